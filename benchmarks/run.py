@@ -0,0 +1,271 @@
+"""Throughput, latency and allocation benchmarks of the bindings
+
+    python benchmarks/run.py [-k filter] [--time SECONDS] [--save results.json] [--compare results.json]
+
+Runs in process against fakenddsc, so no RTI install is needed and what is
+measured is the cost of the bindings: marshalling, ctypes calls and
+allocations, not the middleware's. Each case reports ops/s, payload bytes/s,
+p50/p99 latency, the peak memory allocated while running one op, and the
+native calls made per op. --save and --compare keep results around to tell
+whether a change to the bindings helped.
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import fakenddsc as F
+F.install()
+import dds
+
+# the types
+
+color = F.enum('Color', ('RED', 0), ('GREEN', 1), ('BLUE', 2))
+flat = F.struct('Flat', ('id', F.prim(F.LONG), True), ('x', F.prim(F.DOUBLE)), ('y', F.prim(F.DOUBLE)),
+                ('z', F.prim(F.DOUBLE)), ('name', F.prim(F.STRING)), ('color', color), ('ok', F.prim(F.BOOLEAN)))
+point = F.struct('Point', ('x', F.prim(F.DOUBLE)), ('y', F.prim(F.DOUBLE)))
+nested = F.struct('Nested', ('id', F.prim(F.LONG), True), ('origin', point), ('path', F.seq(point, 64)),
+                  ('tags', F.seq(F.prim(F.STRING), 16)))
+# every sample the same size, so take_columnar reads its CDR through a structured dtype
+fixed = F.struct('Fixed', ('id', F.prim(F.LONG), True), ('x', F.prim(F.DOUBLE)), ('y', F.prim(F.DOUBLE)),
+                 ('z', F.prim(F.DOUBLE)), ('color', color), ('ok', F.prim(F.BOOLEAN)), ('readings', F.array(F.prim(F.FLOAT), 8)))
+floats = F.struct('Floats', ('id', F.prim(F.LONG), True), ('samples', F.seq(F.prim(F.FLOAT), 1 << 20)))
+blob = F.struct('Blob', ('id', F.prim(F.LONG), True), ('data', F.seq(F.prim(F.OCTET), 16 << 20)))
+
+messages = {
+    'flat': (flat, dict(id=1, x=1.5, y=-2.5, z=1e9, name='sensor-0001', color=2, ok=True)),
+    'nested': (nested, dict(id=2, origin=dict(x=0.0, y=0.0), path=[dict(x=float(i), y=-float(i)) for i in range(32)],
+                            tags=['a', 'bb', 'ccc', 'dddd'])),
+    'fixed': (fixed, dict(id=5, x=1.5, y=-2.5, z=1e9, color=1, ok=True, readings=[0.5] * 8)),
+    'floats': (floats, dict(id=3, samples=[i * 0.5 for i in range(100000)])),
+    'blob': (blob, dict(id=4, data=os.urandom(4 << 20))),
+}
+
+for name, (tc, msg) in messages.items():
+    F.define_topic('Bench::%sWriter' % name, 'Bench::%sReader' % name, tc)
+
+def payload_bytes(obj):
+    """Approximate size of a message's data"""
+    if isinstance(obj, dict):
+        return sum(payload_bytes(v) for v in obj.values())
+    if isinstance(obj, list):
+        return sum(payload_bytes(v) for v in obj)
+    if isinstance(obj, (bytes, bytearray, str)):
+        return len(obj)
+    if isinstance(obj, float):
+        return 8
+    return 4
+
+# the cases, each returns (op, prepare) where prepare, if not None, runs untimed before every op,
+# or None when the case does not apply to the type
+
+participant = dds.DDS('Bench::Participant')
+# a participant hands out one Writer and Reader per name, those with cdr=True come from another
+cdr_participant = dds.DDS('Bench::Participant')
+prop = dds.get('DYNAMIC_DATA_PROPERTY_DEFAULT', dds.DDSType.DynamicDataProperty_t)
+
+def case_write_into_dd(name):
+    tc, msg = messages[name]
+    dd = dds.DDSFunc.DynamicData_new(tc.ptr(), prop)
+    return lambda: dds.write_into_dd(msg, dd), None
+
+def case_unpack_dd(name):
+    tc, msg = messages[name]
+    dd = dds.DDSFunc.DynamicData_new(tc.ptr(), prop)
+    dds.write_into_dd(msg, dd)
+    return lambda: dds.unpack_dd(dd), None
+
+def case_write(name):
+    tc, msg = messages[name]
+    writer = participant.lookup_datawriter_by_name('Bench::%sWriter' % name)
+    return lambda: writer.write(msg), F._topics['Bench::%sWriter' % name].samples.clear
+
+def case_take(name):
+    tc, msg = messages[name]
+    writer = participant.lookup_datawriter_by_name('Bench::%sWriter' % name)
+    reader = participant.lookup_datareader_by_name('Bench::%sReader' % name)
+    return reader.take, lambda: writer.write(msg)
+
+def case_write_cdr(name):
+    tc, msg = messages[name]
+    writer = cdr_participant.lookup_datawriter_by_name('Bench::%sWriter' % name, cdr=True)
+    return lambda: writer.write(msg), F._topics['Bench::%sWriter' % name].samples.clear
+
+def case_take_cdr(name):
+    tc, msg = messages[name]
+    writer = participant.lookup_datawriter_by_name('Bench::%sWriter' % name)
+    reader = cdr_participant.lookup_datareader_by_name('Bench::%sReader' % name, cdr=True)
+    return reader.take, lambda: writer.write(msg)
+
+def case_round_trip(name):
+    tc, msg = messages[name]
+    writer = participant.lookup_datawriter_by_name('Bench::%sWriter' % name)
+    reader = participant.lookup_datareader_by_name('Bench::%sReader' % name)
+    def op():
+        writer.write(msg)
+        reader.take()
+    return op, None
+
+# writing 50 large samples before every op would take far longer than the op
+fan_out_types = ('flat', 'nested')
+
+def fan_out(name, writer):
+    # one in 50 samples is wanted, the one with id 0
+    tc, msg = messages[name]
+    def prepare():
+        F._topics['Bench::%sWriter' % name].samples.clear()
+        for i in range(50):
+            writer.write(dict(msg, id=i))
+    return prepare
+
+def case_take_then_filter(name):
+    if name not in fan_out_types:
+        return None
+    writer = participant.lookup_datawriter_by_name('Bench::%sWriter' % name)
+    reader = participant.lookup_datareader_by_name('Bench::%sReader' % name)
+    return lambda: [s for s in reader.take() if s['sampleData']['id'] == 0], fan_out(name, writer)
+
+def case_filtered_take(name):
+    if name not in fan_out_types:
+        return None
+    writer = participant.lookup_datawriter_by_name('Bench::%sWriter' % name)
+    reader = participant.create_filtered_reader('Bench::%sReader' % name, 'id = %0', [0])
+    return reader.take, fan_out(name, writer)
+
+# a batch of samples taken at once, as analytics consumers do
+batch_types = ('flat', 'nested', 'fixed')
+BATCH = 200
+
+def batch(name, writer):
+    tc, msg = messages[name]
+    def prepare():
+        F._topics['Bench::%sWriter' % name].samples.clear()
+        writer.write_many(dict(msg, id=i) for i in range(BATCH))
+    return prepare
+
+def case_take_batch(name):
+    if name not in batch_types:
+        return None
+    writer = participant.lookup_datawriter_by_name('Bench::%sWriter' % name)
+    reader = participant.lookup_datareader_by_name('Bench::%sReader' % name)
+    return reader.take, batch(name, writer)
+
+def case_take_columnar(name):
+    if name not in batch_types:
+        return None
+    writer = participant.lookup_datawriter_by_name('Bench::%sWriter' % name)
+    reader = participant.lookup_datareader_by_name('Bench::%sReader' % name)
+    return reader.take_columnar, batch(name, writer)
+
+cases = [
+    ('write_into_dd', case_write_into_dd),
+    ('unpack_dd', case_unpack_dd),
+    ('Writer.write', case_write),
+    ('Reader.take', case_take),
+    ('Writer.write cdr', case_write_cdr),
+    ('Reader.take cdr', case_take_cdr),
+    ('write+take', case_round_trip),
+    ('take+filter 1/50', case_take_then_filter),
+    ('filtered take 1/50', case_filtered_take),
+    ('take %d' % BATCH, case_take_batch),
+    ('take_columnar %d' % BATCH, case_take_columnar),
+]
+
+# measuring
+
+def percentile(times, p):
+    return times[min(len(times) - 1, int(len(times) * p))]
+
+def measure(op, prepare, duration, max_ops):
+    # warm up, plans get compiled and pools filled on the first ops
+    for i in range(3):
+        if prepare is not None:
+            prepare()
+        op()
+    gc.collect()
+
+    times = []
+    calls_before = sum(F.calls.values())
+    deadline = time.perf_counter() + duration
+    while len(times) < max_ops and (len(times) < 5 or time.perf_counter() < deadline):
+        if prepare is not None:
+            calls_prepare = sum(F.calls.values())
+            prepare()
+            calls_before += sum(F.calls.values()) - calls_prepare
+        t = time.perf_counter_ns()
+        op()
+        times.append(time.perf_counter_ns() - t)
+    calls = sum(F.calls.values()) - calls_before
+
+    # tracing slows everything down, so allocations get their own few ops
+    peaks = []
+    tracemalloc.start()
+    try:
+        for i in range(min(len(times), 20)):
+            if prepare is not None:
+                prepare()
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            op()
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+
+    total = sum(times)
+    times.sort()
+    return {
+        'ops': len(times),
+        'ops_per_s': len(times) / (total / 1e9),
+        'p50_us': percentile(times, 0.5) / 1e3,
+        'p99_us': percentile(times, 0.99) / 1e3,
+        'peak_kib': max(peaks) / 1024,
+        'native_calls': calls / len(times),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-k', dest='filter', default='', help='only run cases whose name contains this')
+    parser.add_argument('--time', type=float, default=0.5, help='seconds to spend on each case')
+    parser.add_argument('--max-ops', type=int, default=100000)
+    parser.add_argument('--save', help='write the results to this json file')
+    parser.add_argument('--compare', help='show the speedup against results saved with --save')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    print('%-24s %10s %10s %10s %10s %10s %8s%s' % ('case', 'ops/s', 'MB/s', 'p50 us', 'p99 us', 'peak KiB', 'calls', '  speedup' if baseline else ''))
+    results = {}
+    for case_name, case in cases:
+        for name, (tc, msg) in messages.items():
+            full_name = '%s[%s]' % (case_name, name)
+            if args.filter not in full_name:
+                continue
+            made = case(name)
+            if made is None:
+                continue
+            op, prepare = made
+            r = measure(op, prepare, args.time, args.max_ops)
+            r['bytes_per_s'] = r['ops_per_s'] * payload_bytes(msg)
+            results[full_name] = r
+            speedup = ''
+            if full_name in baseline:
+                speedup = '  %6.2fx' % (r['ops_per_s'] / baseline[full_name]['ops_per_s'])
+            print('%-24s %10.0f %10.1f %10.1f %10.1f %10.1f %8.1f%s' % (full_name, r['ops_per_s'], r['bytes_per_s'] / 1e6,
+                  r['p50_us'], r['p99_us'], r['peak_kib'], r['native_calls'], speedup))
+            sys.stdout.flush()
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
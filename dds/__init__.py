@@ -1,8 +1,22 @@
+import collections
 import ctypes
+import itertools
+import operator
 import os
+import struct
 import sys
+import threading
+import time
+import traceback
+import types
 import weakref
-from enum import Enum
+import zlib
+from enum import Enum, IntEnum
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 CURRENT_DIR = os.path.dirname(os.path.realpath(__file__))
@@ -10,25 +24,43 @@ CURRENT_DIR = os.path.dirname(os.path.realpath(__file__))
 #4 is machine
 cpu_arch = os.uname()[4]
 
-rti_arch = {
-    'x86_64': 'x64Linux',
-    'x86': 'i86Linux',
-    'aarch64': '<TODO add here arm prefix>'
-}[cpu_arch]
-
-embedded_so = os.path.join(CURRENT_DIR, {
-    'x86_64': 'x64/libnddsc.so',
-    'aarch64': 'armv8/libnddsc.so'
-}[cpu_arch])
-
+# libnddsc is only loaded when the first native function is called, so that
+# importing dds stays cheap for programs that may never need it
 _ddsc_lib = None
+_ddscore_lib = None
+# (libnddscore or None, libnddsc) paths, found once per process
+_ddsc_paths = None
+_library_lock = threading.Lock()
+
+def _library_paths():
+    global _ddsc_paths
+    if _ddsc_paths is not None:
+        return _ddsc_paths
+
+    # PYDDS_LIBNDDSC names libnddsc itself, libnddscore being loaded from next to it when there
+    override = os.environ.get('PYDDS_LIBNDDSC')
+    if override:
+        core_path = os.path.join(os.path.dirname(override), 'libnddscore.so')
+        _ddsc_paths = (core_path if os.path.isfile(core_path) else None, override)
+        return _ddsc_paths
+
+    embedded_so = os.path.join(CURRENT_DIR, {
+        'x86_64': 'x64/libnddsc.so',
+        'aarch64': 'armv8/libnddsc.so'
+    }[cpu_arch])
+    if os.path.isfile(embedded_so):
+        _ddsc_paths = (None, embedded_so)
+        return _ddsc_paths
+
+    rti_arch = {
+        'x86_64': 'x64Linux',
+        'x86': 'i86Linux',
+        'aarch64': '<TODO add here arm prefix>'
+    }[cpu_arch]
 
-if os.path.isfile(embedded_so):
-    _ddsc_lib = ctypes.CDLL(embedded_so) 
-
-if not _ddsc_lib:
     NDDSHOME = os.environ['NDDSHOME']
-    archs = os.listdir(os.path.join(NDDSHOME, 'lib'))
+    lib_dir = os.path.join(NDDSHOME, 'lib')
+    archs = os.listdir(lib_dir)
 
     arch_str = None
     for arch in archs:
@@ -39,16 +71,29 @@ if not _ddsc_lib:
     if arch_str is None:
         raise Exception("No sutiable RTI installation was found for '%s' arch in %s" % (cpu_arch, NDDSHOME))
 
-    base_path = os.path.join(NDDSHOME, 'lib', arch_str)
-    _ddscore_lib = ctypes.CDLL(os.path.join(base_path, 'libnddscore.so'), ctypes.RTLD_GLOBAL)
-    _ddsc_lib = ctypes.CDLL(os.path.join(base_path, 'libnddsc.so'))
+    base_path = os.path.join(lib_dir, arch_str)
+    _ddsc_paths = (os.path.join(base_path, 'libnddscore.so'), os.path.join(base_path, 'libnddsc.so'))
+    # inherited by the processes this one starts, e.g. ReaderPool workers, so they skip the search
+    os.environ['PYDDS_LIBNDDSC'] = _ddsc_paths[1]
+    return _ddsc_paths
+
+def _library():
+    global _ddsc_lib, _ddscore_lib
+    if _ddsc_lib is None:
+        with _library_lock:
+            if _ddsc_lib is None:
+                core_path, path = _library_paths()
+                if core_path is not None:
+                    _ddscore_lib = ctypes.CDLL(core_path, ctypes.RTLD_GLOBAL)
+                _ddsc_lib = ctypes.CDLL(path)
+    return _ddsc_lib
 
 
 # Python 3 has bytes and str, calling ctypes requires bytes and returns bytes
 # the following functions deal with this conversion
 if sys.version_info >= (3, 0):
     def cstring(s):
-        if s:
+        if s is not None:
             if isinstance(s, str):
                 return bytes(s, 'ascii')
             elif isinstance(s ,bytes):
@@ -111,12 +156,33 @@ def check_true(result, func, arguments):
 # Function and structure accessors
 
 def get(name, type):
-    return ctypes.cast(getattr(_ddsc_lib, 'DDS_' + name), ctypes.POINTER(type)).contents
+    return ctypes.cast(getattr(_library(), 'DDS_' + name), ctypes.POINTER(type)).contents
 
+# name (without DDS_): (errcheck, restype, argtypes) of every native function used
+_prototypes = {}
 
+class _NativeFunction(object):
+    """The function name of _prototypes, looked up in libnddsc and given its prototype
+    when first used, from then on a plain attribute of the instance"""
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, obj, cls = None):
+        if obj is None:
+            return self
+        errcheck, restype, argtypes = _prototypes[self.name]
+        f = getattr(_library(), 'DDS_' + self.name)
+        if errcheck is not None:
+            f.errcheck = errcheck
+        f.restype = restype
+        f.argtypes = argtypes
+        setattr(obj, self.name, f)
+        return f
 
 class DDSFunc(object):
-    pass
+    """The native functions of _prototypes, each a _NativeFunction until first used"""
 
 DDSFunc = DDSFunc()
 
@@ -129,28 +195,58 @@ class DDS_InstanceStateKindEnum(Enum):
 class DDS_ViewStateKindEnum(Enum):
     DDS_NEW_VIEW_STATE = 1
     DDS_NOT_NEW_VIEW_STATE = 2
+    DDS_ANY_VIEW_STATE = 65535
 
 class DDS_SampleStateKindEnum(Enum):
     DDS_READ_SAMPLE_STATE = 1
     DDS_NOT_READ_SAMPLE_STATE = 2
+    DDS_ANY_SAMPLE_STATE = 65535
+
+def state_mask(state):
+    """Mask of a state kind enum member, ints are taken as already ORed masks"""
+    return state.value if isinstance(state, Enum) else int(state)
+
 
+class _NativeMethod(object):
+    """The function Struct_method of _prototypes, as method of Struct and of pointers to it,
+    bound once per instance"""
+    __slots__ = ('name', 'method', 'func')
+
+    def __init__(self, name):
+        self.name = name
+        self.method = name.partition('_')[2]
+        self.func = None
+
+    def __get__(self, obj, cls = None):
+        if obj is None:
+            return self
+        func = self.func
+        if func is None:
+            func = self.func = getattr(DDSFunc, self.name)
+        bound = types.MethodType(func, obj)
+        # found before this descriptor from then on
+        obj.__dict__[self.method] = bound
+        return bound
+
+def _attach_methods(names):
+    """Gives the structs of DDSType made so far a _NativeMethod for each of the functions 'names'"""
+    for name in names:
+        struct_name, _, method = name.partition('_')
+        struct = DDSType.__dict__.get(struct_name)
+        if struct is None or not method:
+            continue
+        # the POINTER of a struct is cached, so entities handed back by functions have them too
+        for cls in (struct, ctypes.POINTER(struct)):
+            if method not in cls.__dict__:
+                setattr(cls, method, _NativeMethod(name))
 
 class DDSType(object):
+    """Structs made as first named, the ones of opaque entities having the functions
+    of _prototypes named after them as methods"""
     def __getattr__(self, attr):
         contents = type(attr, (ctypes.Structure,), {})
-        
-        def g(self2, attr2):
-            f = getattr(DDSFunc, attr + '_' + attr2)
-            def m(*args):
-                return f(self2, *args)
-            setattr(self2, attr2, m)
-            return m
-        # make structs dynamically present bound methods
-        contents.__getattr__ = g
-        # take advantage of POINTERs being cached to make type pointers do the same
-        ctypes.POINTER(contents).__getattr__ = g
-        
         setattr(self, attr, contents)
+        _attach_methods([name for name in _prototypes if name.startswith(attr + '_')])
         return contents
 
 DDSType = DDSType()
@@ -161,7 +257,7 @@ DDSType.Topic._fields_ = [
 ]
 ctypes.POINTER(DDSType.Topic).as_topicdescription = lambda self: self.contents._as_TopicDescription
 
-DDSType.DynamicDataSeq._fields_ = DDSType.SampleInfoSeq._fields_ = [
+DDSType.DynamicDataSeq._fields_ = DDSType.SampleInfoSeq._fields_ = DDSType.ConditionSeq._fields_ = DDSType.StringSeq._fields_ = [
     ('_owned', ctypes.c_bool),
     ('_contiguous_buffer', ctypes.c_void_p),
     ('_discontiguous_buffer', ctypes.c_void_p),
@@ -176,7 +272,7 @@ DDSType.DynamicDataSeq._fields_ = DDSType.SampleInfoSeq._fields_ = [
 DDSType.InstanceHandle_t._fields_ = [
     ('keyHash_value', ctypes.c_byte * 16),
     ('keyHash_length', ctypes.c_uint32),
-    ('isValid', ctypes.c_int),
+    ('isValid', ctypes.c_bool),
 ]
 
 # some types
@@ -215,26 +311,36 @@ DDS_DYNAMIC_DATA_MEMBER_ID_UNSPECIFIED = 0
 DDS_HANDLE_NIL = DDSType.InstanceHandle_t((ctypes.c_byte * 16)(*[0]*16), 16, False)
 DDS_LENGTH_UNLIMITED = 2**16-1
 
-DDS_Long = ctypes.c_long
-
+DDSType.Time_t._fields_ = [
+    ('sec', ctypes.c_int32),
+    ('nanosec', DDS_UnsignedLong),
+]
 
-DDSType.DDS_Time_t._fields_ = [
-    ('sec', ctypes.c_long),
-    ('nanosec', ctypes.c_ulong),
+DDSType.Duration_t._fields_ = [
+    ('sec', ctypes.c_int32),
+    ('nanosec', DDS_UnsignedLong),
 ]
+DDS_DURATION_INFINITE_SEC = 0x7fffffff
+DDS_DURATION_INFINITE_NSEC = 0x7fffffff
 
-DDS_SequenceNumber_t = ctypes.c_int
+DDSType.SequenceNumber_t._fields_ = [
+    ('high', DDS_Long),
+    ('low', DDS_UnsignedLong),
+]
+DDSType.GUID_t._fields_ = [
+    ('value', DDS_Octet * 16),
+]
 DDS_SampleStateKind = enum
 DDS_ViewStateKind = enum
 DDS_InstanceStateKind = enum
-DDS_Boolean = ctypes.c_bool
-DDS_GUID_t = ctypes.c_long
 
+# SampleInfo is only ever used through SampleInfoSeq_get_reference, so the members
+# following these, which differ between Connext versions, are left out
 DDSType.SampleInfo._fields_ = [
     ('sample_state', DDS_SampleStateKind),
     ('view_state', DDS_ViewStateKind),
     ('instance_state', DDS_InstanceStateKind),
-    ('source_timestamp', DDSType.DDS_Time_t),
+    ('source_timestamp', DDSType.Time_t),
     ('instance_handle', DDSType.InstanceHandle_t),
     ('publication_handle', DDSType.InstanceHandle_t),
     ('disposed_generation_count', DDS_Long),
@@ -243,15 +349,28 @@ DDSType.SampleInfo._fields_ = [
     ('generation_rank', DDS_Long),
     ('absolute_generation_rank', DDS_Long),
     ('valid_data', DDS_Boolean),
-    ('reception_timestamp', DDSType.DDS_Time_t),
-    ('publication_sequence_number', DDS_SequenceNumber_t),
-    ('reception_sequence_number', DDS_SequenceNumber_t),
-    ('publication_virtual_guid', DDS_GUID_t),
-    ('publication_virtual_sequence_number', DDS_SequenceNumber_t),
-    ('original_publication_virtual_guid', DDS_GUID_t),
-    ('original_publication_virtual_sequence_number', DDS_SequenceNumber_t),
+    ('reception_timestamp', DDSType.Time_t),
+    ('publication_sequence_number', DDSType.SequenceNumber_t),
+    ('reception_sequence_number', DDSType.SequenceNumber_t),
+    ('publication_virtual_guid', DDSType.GUID_t),
+    ('publication_virtual_sequence_number', DDSType.SequenceNumber_t),
+    ('original_publication_virtual_guid', DDSType.GUID_t),
+    ('original_publication_virtual_sequence_number', DDSType.SequenceNumber_t),
 ]
 
+# offsets of the native struct, a mistake here silently reads garbage, so it is checked even under python -O
+if ctypes.sizeof(DDSType.InstanceHandle_t) != 24:
+    raise ImportError('InstanceHandle_t is %d bytes rather than 24' % ctypes.sizeof(DDSType.InstanceHandle_t))
+for _name, _offset in [('source_timestamp', 12), ('instance_handle', 20), ('publication_handle', 44),
+                       ('disposed_generation_count', 68), ('absolute_generation_rank', 84), ('valid_data', 88),
+                       ('reception_timestamp', 92), ('publication_sequence_number', 100), ('reception_sequence_number', 108),
+                       ('publication_virtual_guid', 116), ('original_publication_virtual_sequence_number', 156)]:
+    if getattr(DDSType.SampleInfo, _name).offset != _offset:
+        raise ImportError('SampleInfo.%s is at offset %d rather than %d' % (_name, getattr(DDSType.SampleInfo, _name).offset, _offset))
+if ctypes.sizeof(DDSType.SampleInfo) != 164:
+    raise ImportError('SampleInfo is %d bytes rather than 164' % ctypes.sizeof(DDSType.SampleInfo))
+del _name, _offset
+
 
 # class SampleInfo(ctypes.Structure):
 #     _fields_=[('instance_state', ctypes.c_uint32)]
@@ -261,6 +380,54 @@ DDSType.SampleInfo._fields_ = [
 
 
 
+DDSType.SampleLostStatus._fields_ = [
+    ('total_count', DDS_Long),
+    ('total_count_change', DDS_Long),
+    ('last_reason', enum),
+]
+
+DDSType.SampleRejectedStatus._fields_ = [
+    ('total_count', DDS_Long),
+    ('total_count_change', DDS_Long),
+    ('last_reason', enum),
+    ('last_instance_handle', DDSType.InstanceHandle_t),
+]
+
+# counters of DataWriterProtocolStatus, each followed by its _change, then send_window_size
+_protocol_status_counters = ['pushed_sample_count', 'pushed_sample_bytes', 'filtered_sample_count', 'filtered_sample_bytes',
+                             'sent_heartbeat_count', 'sent_heartbeat_bytes', 'pulled_sample_count', 'pulled_sample_bytes',
+                             'received_ack_count', 'received_ack_bytes', 'received_nack_count', 'received_nack_bytes',
+                             'sent_gap_count', 'sent_gap_bytes', 'rejected_sample_count']
+
+# only the leading members are declared, the rest grew between Connext versions
+# and is left to the padding, which is larger than any of them needs
+DDSType.DataWriterProtocolStatus._fields_ = [field for name in _protocol_status_counters
+                                             for field in ((name, DDS_LongLong), (name + '_change', DDS_LongLong))] + [
+    ('send_window_size', DDS_Long),
+    ('_rest', ctypes.c_char * 1024),
+]
+
+DDSType.DynamicDataInfo._fields_ = [
+    ('member_count', DDS_Long),
+    ('stored_size', DDS_Long),
+    ('is_optimized_storage', DDS_Boolean),
+]
+
+DDSType.DynamicDataMemberInfo._fields_ = [
+    ('member_id', DDS_DynamicDataMemberId),
+    ('member_name', ctypes.c_char_p),
+    ('member_exists', DDS_Boolean),
+    ('member_kind', DDS_TCKind),
+    ('representation_count', DDS_UnsignedLong),
+    ('element_count', DDS_UnsignedLong),
+    ('element_kind', DDS_TCKind),
+]
+
+# only ever filled and read by the library, sized well beyond what any Connext version needs
+DDSType.DataReaderQos._fields_ = [
+    ('_opaque', ctypes.c_char * 32768),
+]
+
 DDSType.Listener._fields_ = [
     ('listener_data', ctypes.c_void_p),
 ]
@@ -323,20 +490,32 @@ _dyn_basic_types = {
     TCKind.WCHAR: ('wchar', DDS_Wchar, None),
 }
 
-def _define_func(params):
-    p, errcheck, restype, argtypes = params
-    f = getattr(_ddsc_lib, 'DDS_' + p)
-    if errcheck is not None:
-        f.errcheck = errcheck
-    f.restype = restype
-    f.argtypes = argtypes
-    setattr(DDSFunc, p, f)
+# sequence types of the get/set_*_seq accessors, laid out like any other sequence
+_dyn_seq_types = {
+    TCKind.LONG: DDSType.LongSeq,
+    TCKind.ULONG: DDSType.UnsignedLongSeq,
+    TCKind.SHORT: DDSType.ShortSeq,
+    TCKind.USHORT: DDSType.UnsignedShortSeq,
+    TCKind.LONGLONG: DDSType.LongLongSeq,
+    TCKind.ULONGLONG: DDSType.UnsignedLongLongSeq,
+    TCKind.FLOAT: DDSType.FloatSeq,
+    TCKind.DOUBLE: DDSType.DoubleSeq,
+    TCKind.BOOLEAN: DDSType.BooleanSeq,
+    TCKind.OCTET: DDSType.OctetSeq,
+    TCKind.CHAR: DDSType.CharSeq,
+    TCKind.WCHAR: DDSType.WcharSeq,
+}
+
+for seq_type in _dyn_seq_types.values():
+    seq_type._fields_ = DDSType.DynamicDataSeq._fields_
 
-list(map(_define_func, [
+_prototypes.update((name, (errcheck, restype, argtypes)) for name, errcheck, restype, argtypes in [
     ('DomainParticipantFactory_get_instance', check_null, ctypes.POINTER(DDSType.DomainParticipantFactory), []),
     ('DomainParticipantFactory_create_participant', check_null, ctypes.POINTER(DDSType.DomainParticipant), [ctypes.POINTER(DDSType.DomainParticipantFactory), DDS_DomainId_t, ctypes.POINTER(DDSType.DomainParticipantQos), ctypes.POINTER(DDSType.DomainParticipantListener), DDS_StatusMask]),
     ('DomainParticipantFactory_create_participant_from_config', check_null, ctypes.POINTER(DDSType.DomainParticipant), [ctypes.POINTER(DDSType.DomainParticipantFactory), ctypes.c_char_p]),
     ('DomainParticipantFactory_delete_participant', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DomainParticipantFactory), ctypes.POINTER(DDSType.DomainParticipant)]),
+    ('DomainParticipantFactory_reload_profiles', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DomainParticipantFactory)]),
+    ('DomainParticipantFactory_load_profiles', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DomainParticipantFactory)]),
     
     ('DomainParticipant_create_publisher', check_null, ctypes.POINTER(DDSType.Publisher), [ctypes.POINTER(DDSType.DomainParticipant), ctypes.POINTER(DDSType.PublisherQos), ctypes.POINTER(DDSType.PublisherListener), DDS_StatusMask]),
     ('DomainParticipant_delete_publisher', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DomainParticipant), ctypes.POINTER(DDSType.Publisher)]),
@@ -347,6 +526,12 @@ list(map(_define_func, [
     ('DomainParticipant_lookup_datawriter_by_name', check_null, ctypes.POINTER(DDSType.DataWriter), [ctypes.POINTER(DDSType.DomainParticipant), ctypes.c_char_p]),
     ('DomainParticipant_lookup_datareader_by_name', check_null, ctypes.POINTER(DDSType.DataReader), [ctypes.POINTER(DDSType.DomainParticipant), ctypes.c_char_p]),
     ('DomainParticipant_delete_contained_entities', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DomainParticipant)]),
+    ('DomainParticipant_create_contentfilteredtopic', check_null, ctypes.POINTER(DDSType.ContentFilteredTopic), [ctypes.POINTER(DDSType.DomainParticipant), ctypes.c_char_p, ctypes.POINTER(DDSType.Topic), ctypes.c_char_p, ctypes.POINTER(DDSType.StringSeq)]),
+    ('DomainParticipant_delete_contentfilteredtopic', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DomainParticipant), ctypes.POINTER(DDSType.ContentFilteredTopic)]),
+
+    ('ContentFilteredTopic_as_topicdescription', check_null, ctypes.POINTER(DDSType.TopicDescription), [ctypes.POINTER(DDSType.ContentFilteredTopic)]),
+    ('ContentFilteredTopic_set_expression_parameters', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.ContentFilteredTopic), ctypes.POINTER(DDSType.StringSeq)]),
+    ('Topic_narrow', check_null, ctypes.POINTER(DDSType.Topic), [ctypes.POINTER(DDSType.TopicDescription)]),
 
     ('Publisher_create_datawriter', check_null, ctypes.POINTER(DDSType.DataWriter), [ctypes.POINTER(DDSType.Publisher), ctypes.POINTER(DDSType.Topic), ctypes.POINTER(DDSType.DataWriterQos), ctypes.POINTER(DDSType.DataWriterListener), DDS_StatusMask]),
     ('Publisher_delete_datawriter', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.Publisher), ctypes.POINTER(DDSType.DataWriter)]),
@@ -356,12 +541,43 @@ list(map(_define_func, [
     
     ('DataWriter_get_topic', check_null, ctypes.POINTER(DDSType.Topic), [ctypes.POINTER(DDSType.DataWriter)]),
     ('DynamicDataWriter_create_data_w_property', check_null, ctypes.POINTER(DDSType.DynamicData), [ctypes.POINTER(DDSType.DynamicDataWriter),ctypes.POINTER(DDSType.DynamicDataProperty_t) ]),
-    ('DynamicDataWriter_delete_data', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicData)]),
+    ('DynamicDataWriter_delete_data', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicDataWriter), ctypes.POINTER(DDSType.DynamicData)]),
+    ('DataWriter_get_datawriter_protocol_status', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DataWriter), ctypes.POINTER(DDSType.DataWriterProtocolStatus)]),
 
 
     ('DataReader_set_listener', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DataReader), ctypes.POINTER(DDSType.DataReaderListener), DDS_StatusMask]),
+    ('DataReader_create_readcondition', check_null, ctypes.POINTER(DDSType.ReadCondition), [ctypes.POINTER(DDSType.DataReader), DDS_SampleStateMask, DDS_ViewStateMask, DDS_InstanceStateMask]),
+    ('DataReader_delete_readcondition', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DataReader), ctypes.POINTER(DDSType.ReadCondition)]),
+    ('DataReader_get_sample_lost_status', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DataReader), ctypes.POINTER(DDSType.SampleLostStatus)]),
+    ('DataReader_get_sample_rejected_status', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DataReader), ctypes.POINTER(DDSType.SampleRejectedStatus)]),
+    ('DataReader_get_topicdescription', check_null, ctypes.POINTER(DDSType.TopicDescription), [ctypes.POINTER(DDSType.DataReader)]),
+    ('DataReader_get_subscriber', check_null, ctypes.POINTER(DDSType.Subscriber), [ctypes.POINTER(DDSType.DataReader)]),
+    ('DataReader_get_qos', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DataReader), ctypes.POINTER(DDSType.DataReaderQos)]),
+    ('DataReader_create_querycondition', check_null, ctypes.POINTER(DDSType.QueryCondition), [ctypes.POINTER(DDSType.DataReader), DDS_SampleStateMask, DDS_ViewStateMask, DDS_InstanceStateMask, ctypes.c_char_p, ctypes.POINTER(DDSType.StringSeq)]),
+    ('QueryCondition_set_query_parameters', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.QueryCondition), ctypes.POINTER(DDSType.StringSeq)]),
+    ('DataReaderQos_initialize', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DataReaderQos)]),
+    ('DataReaderQos_finalize', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DataReaderQos)]),
+
+    ('Entity_get_statuscondition', check_null, ctypes.POINTER(DDSType.StatusCondition), [ctypes.POINTER(DDSType.Entity)]),
+    ('StatusCondition_set_enabled_statuses', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.StatusCondition), DDS_StatusMask]),
+    ('GuardCondition_new', check_null, ctypes.POINTER(DDSType.GuardCondition), []),
+    ('GuardCondition_delete', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.GuardCondition)]),
+    ('GuardCondition_set_trigger_value', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.GuardCondition), DDS_Boolean]),
+    ('Condition_get_trigger_value', None, DDS_Boolean, [ctypes.POINTER(DDSType.Condition)]),
+
+    ('WaitSet_new', check_null, ctypes.POINTER(DDSType.WaitSet), []),
+    ('WaitSet_delete', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.WaitSet)]),
+    ('WaitSet_attach_condition', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.WaitSet), ctypes.POINTER(DDSType.Condition)]),
+    ('WaitSet_detach_condition', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.WaitSet), ctypes.POINTER(DDSType.Condition)]),
+    ('WaitSet_wait', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.WaitSet), ctypes.POINTER(DDSType.ConditionSeq), ctypes.POINTER(DDSType.Duration_t)]),
+
+    ('ConditionSeq_initialize', check_true, DDS_Boolean, [ctypes.POINTER(DDSType.ConditionSeq)]),
+    ('ConditionSeq_finalize', check_true, DDS_Boolean, [ctypes.POINTER(DDSType.ConditionSeq)]),
+    ('ConditionSeq_get_length', None, DDS_Long, [ctypes.POINTER(DDSType.ConditionSeq)]),
+    ('ConditionSeq_get', None, ctypes.POINTER(DDSType.Condition), [ctypes.POINTER(DDSType.ConditionSeq), DDS_Long]),
     
     ('TopicDescription_get_type_name',check_null, ctypes.c_char_p, [ctypes.POINTER(DDSType.Topic)]),
+    ('TopicDescription_get_name', check_null, ctypes.c_char_p, [ctypes.POINTER(DDSType.TopicDescription)]),
 
     ('DynamicDataTypeSupport_new', check_null, ctypes.POINTER(DDSType.DynamicDataTypeSupport), [ctypes.POINTER(DDSType.TypeCode), ctypes.POINTER(DDSType.DynamicDataTypeProperty_t)]),
     ('DynamicDataTypeSupport_delete', None, None, [ctypes.POINTER(DDSType.DynamicDataTypeSupport)]),
@@ -378,29 +594,49 @@ list(map(_define_func, [
 ] + [
     ('DynamicData_set_' + func_name, check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicData), ctypes.c_char_p, DDS_DynamicDataMemberId, data_type])
         for func_name, data_type, bounds  in _dyn_basic_types.values()
+] + [
+    ('DynamicData_get_' + func_name + '_array', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicData), ctypes.c_void_p, ctypes.POINTER(DDS_UnsignedLong), ctypes.c_char_p, DDS_DynamicDataMemberId])
+        for func_name, data_type, bounds in _dyn_basic_types.values()
+] + [
+    ('DynamicData_set_' + func_name + '_array', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicData), ctypes.c_char_p, DDS_DynamicDataMemberId, DDS_UnsignedLong, ctypes.c_void_p])
+        for func_name, data_type, bounds in _dyn_basic_types.values()
+] + [
+    ('DynamicData_get_' + func_name + '_seq', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicData), ctypes.POINTER(_dyn_seq_types[kind]), ctypes.c_char_p, DDS_DynamicDataMemberId])
+        for kind, (func_name, data_type, bounds) in _dyn_basic_types.items()
+] + [
+    ('DynamicData_set_' + func_name + '_seq', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicData), ctypes.c_char_p, DDS_DynamicDataMemberId, ctypes.POINTER(_dyn_seq_types[kind])])
+        for kind, (func_name, data_type, bounds) in _dyn_basic_types.items()
 ] + [
     ('DynamicData_get_string', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicData), ctypes.POINTER(ctypes.c_char_p), ctypes.POINTER(DDS_UnsignedLong), ctypes.c_char_p, DDS_DynamicDataMemberId]),
     ('DynamicData_get_wstring', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicData), ctypes.POINTER(ctypes.c_wchar_p), ctypes.POINTER(DDS_UnsignedLong), ctypes.c_char_p, DDS_DynamicDataMemberId]),
     ('DynamicData_set_string', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicData), ctypes.c_char_p, DDS_DynamicDataMemberId, ctypes.c_char_p]),
     ('DynamicData_set_wstring', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicData), ctypes.c_char_p, DDS_DynamicDataMemberId, ctypes.c_wchar_p]),
-    ('DynamicData_set_octet_array', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicData), ctypes.c_char_p, DDS_DynamicDataMemberId, DDS_UnsignedLong ,ctypes.c_char_p]),
-    ('DynamicData_get_octet_array', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicData), ctypes.c_char_p, ctypes.POINTER(DDS_UnsignedLong), ctypes.c_char_p, DDS_DynamicDataMemberId]),
     ('DynamicData_bind_complex_member', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicData), ctypes.POINTER(DDSType.DynamicData), ctypes.c_char_p, DDS_DynamicDataMemberId]),
     ('DynamicData_unbind_complex_member', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicData), ctypes.POINTER(DDSType.DynamicData)]),
     ('DynamicData_get_member_type', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicData), ctypes.POINTER(ctypes.POINTER(DDSType.TypeCode)), ctypes.c_char_p, DDS_DynamicDataMemberId]),
     ('DynamicData_get_member_count', None, DDS_UnsignedLong, [ctypes.POINTER(DDSType.DynamicData)]),
+    ('DynamicData_get_member_info_by_index', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicData), ctypes.POINTER(DDSType.DynamicDataMemberInfo), DDS_UnsignedLong]),
+    ('DynamicData_member_exists', None, DDS_Boolean, [ctypes.POINTER(DDSType.DynamicData), ctypes.c_char_p, DDS_DynamicDataMemberId]),
+    ('DynamicData_clear_optional_member', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicData), ctypes.c_char_p, DDS_DynamicDataMemberId]),
+    ('DynamicData_get_info', None, None, [ctypes.POINTER(DDSType.DynamicData), ctypes.POINTER(DDSType.DynamicDataInfo)]),
     ('DynamicData_get_type', check_null, ctypes.POINTER(DDSType.TypeCode), [ctypes.POINTER(DDSType.DynamicData)]),
     ('DynamicData_get_type_kind', None, DDS_TCKind, [ctypes.POINTER(DDSType.DynamicData)]),
     ('DynamicData_delete', None, None, [ctypes.POINTER(DDSType.DynamicData)]),
     ('DynamicData_clear_all_members', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicData)]),
+    ('DynamicData_to_cdr_buffer', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicData), ctypes.c_void_p, ctypes.POINTER(DDS_UnsignedLong)]),
+    ('DynamicData_from_cdr_buffer', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicData), ctypes.c_void_p, DDS_UnsignedLong]),
     ('DynamicDataWriter_narrow', check_null, ctypes.POINTER(DDSType.DynamicDataWriter), [ctypes.POINTER(DDSType.DataWriter)]),
     ('DynamicDataWriter_write', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicDataWriter), ctypes.POINTER(DDSType.DynamicData), ctypes.POINTER(DDSType.InstanceHandle_t)]),
+    ('DynamicDataWriter_write_w_timestamp', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicDataWriter), ctypes.POINTER(DDSType.DynamicData), ctypes.POINTER(DDSType.InstanceHandle_t), ctypes.POINTER(DDSType.Time_t)]),
+    ('DynamicDataWriter_register_instance', None, DDSType.InstanceHandle_t, [ctypes.POINTER(DDSType.DynamicDataWriter), ctypes.POINTER(DDSType.DynamicData)]),
     ('DynamicDataWriter_dispose', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicDataWriter), ctypes.POINTER(DDSType.DynamicData), ctypes.POINTER(DDSType.InstanceHandle_t)]),
     ('DynamicDataWriter_unregister_instance', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicDataWriter), ctypes.POINTER(DDSType.DynamicData), ctypes.POINTER(DDSType.InstanceHandle_t)]),
 
     ('DynamicDataReader_narrow', check_null, ctypes.POINTER(DDSType.DynamicDataReader), [ctypes.POINTER(DDSType.DataReader)]),
     ('DynamicDataReader_take', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicDataReader), ctypes.POINTER(DDSType.DynamicDataSeq), ctypes.POINTER(DDSType.SampleInfoSeq), DDS_Long, DDS_SampleStateMask, DDS_ViewStateMask, DDS_InstanceStateMask]),
     ('DynamicDataReader_read', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicDataReader), ctypes.POINTER(DDSType.DynamicDataSeq), ctypes.POINTER(DDSType.SampleInfoSeq), DDS_Long, DDS_SampleStateMask, DDS_ViewStateMask, DDS_InstanceStateMask]),
+    ('DynamicDataReader_take_w_condition', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicDataReader), ctypes.POINTER(DDSType.DynamicDataSeq), ctypes.POINTER(DDSType.SampleInfoSeq), DDS_Long, ctypes.POINTER(DDSType.ReadCondition)]),
+    ('DynamicDataReader_read_w_condition', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicDataReader), ctypes.POINTER(DDSType.DynamicDataSeq), ctypes.POINTER(DDSType.SampleInfoSeq), DDS_Long, ctypes.POINTER(DDSType.ReadCondition)]),
     ('DynamicDataReader_return_loan', check_code, DDS_ReturnCode_t, [ctypes.POINTER(DDSType.DynamicDataReader), ctypes.POINTER(DDSType.DynamicDataSeq), ctypes.POINTER(DDSType.SampleInfoSeq)]),
     
     ('TypeCode_name', check_ex, ctypes.c_char_p, [ctypes.POINTER(DDSType.TypeCode), ctypes.POINTER(DDS_ExceptionCode_t)]),
@@ -409,197 +645,1575 @@ list(map(_define_func, [
     ('TypeCode_member_count', check_ex, DDS_UnsignedLong, [ctypes.POINTER(DDSType.TypeCode), ctypes.POINTER(DDS_ExceptionCode_t)]),
     ('TypeCode_member_name', check_ex, ctypes.c_char_p, [ctypes.POINTER(DDSType.TypeCode), DDS_UnsignedLong, ctypes.POINTER(DDS_ExceptionCode_t)]),
     ('TypeCode_member_type', check_ex, ctypes.POINTER(DDSType.TypeCode), [ctypes.POINTER(DDSType.TypeCode), DDS_UnsignedLong, ctypes.POINTER(DDS_ExceptionCode_t)]),
+    ('TypeCode_is_member_key', check_ex, DDS_Boolean, [ctypes.POINTER(DDSType.TypeCode), DDS_UnsignedLong, ctypes.POINTER(DDS_ExceptionCode_t)]),
+    ('TypeCode_is_member_required', check_ex, DDS_Boolean, [ctypes.POINTER(DDSType.TypeCode), DDS_UnsignedLong, ctypes.POINTER(DDS_ExceptionCode_t)]),
+    ('TypeCode_member_ordinal', check_ex, DDS_Long, [ctypes.POINTER(DDSType.TypeCode), DDS_UnsignedLong, ctypes.POINTER(DDS_ExceptionCode_t)]),
+    ('TypeCode_member_label_count', check_ex, DDS_UnsignedLong, [ctypes.POINTER(DDSType.TypeCode), DDS_UnsignedLong, ctypes.POINTER(DDS_ExceptionCode_t)]),
+    ('TypeCode_member_label', check_ex, DDS_Long, [ctypes.POINTER(DDSType.TypeCode), DDS_UnsignedLong, DDS_UnsignedLong, ctypes.POINTER(DDS_ExceptionCode_t)]),
+    ('TypeCode_discriminator_type', check_ex, ctypes.POINTER(DDSType.TypeCode), [ctypes.POINTER(DDSType.TypeCode), ctypes.POINTER(DDS_ExceptionCode_t)]),
+    ('TypeCode_default_index', check_ex, DDS_Long, [ctypes.POINTER(DDSType.TypeCode), ctypes.POINTER(DDS_ExceptionCode_t)]),
+    ('TypeCode_length', check_ex, DDS_UnsignedLong, [ctypes.POINTER(DDSType.TypeCode), ctypes.POINTER(DDS_ExceptionCode_t)]),
+    ('TypeCode_array_dimension_count', check_ex, DDS_UnsignedLong, [ctypes.POINTER(DDSType.TypeCode), ctypes.POINTER(DDS_ExceptionCode_t)]),
+    ('TypeCode_extensibility_kind', check_ex, enum, [ctypes.POINTER(DDSType.TypeCode), ctypes.POINTER(DDS_ExceptionCode_t)]),
+    ('TypeCode_array_dimension', check_ex, DDS_UnsignedLong, [ctypes.POINTER(DDSType.TypeCode), DDS_UnsignedLong, ctypes.POINTER(DDS_ExceptionCode_t)]),
     
     ('DynamicDataSeq_initialize', check_true, DDS_Boolean, [ctypes.POINTER(DDSType.DynamicDataSeq)]),
+    ('DynamicDataSeq_finalize', check_true, DDS_Boolean, [ctypes.POINTER(DDSType.DynamicDataSeq)]),
     ('DynamicDataSeq_get_length', None, DDS_Long, [ctypes.POINTER(DDSType.DynamicDataSeq)]),
     ('DynamicDataSeq_get_reference', check_null, ctypes.POINTER(DDSType.DynamicData), [ctypes.POINTER(DDSType.DynamicDataSeq), DDS_Long]),
     
     ('SampleInfoSeq_initialize', check_true, DDS_Boolean, [ctypes.POINTER(DDSType.SampleInfoSeq)]),
+    ('SampleInfoSeq_finalize', check_true, DDS_Boolean, [ctypes.POINTER(DDSType.SampleInfoSeq)]),
     ('SampleInfoSeq_get_length', None, DDS_Long, [ctypes.POINTER(DDSType.SampleInfoSeq)]),
     ('SampleInfoSeq_get_reference', check_null, ctypes.POINTER(DDSType.SampleInfo), [ctypes.POINTER(DDSType.SampleInfoSeq), DDS_Long]),
     
+    ('StringSeq_initialize', check_true, DDS_Boolean, [ctypes.POINTER(DDSType.StringSeq)]),
+    ('StringSeq_finalize', check_true, DDS_Boolean, [ctypes.POINTER(DDSType.StringSeq)]),
+    ('StringSeq_from_array', check_true, DDS_Boolean, [ctypes.POINTER(DDSType.StringSeq), ctypes.POINTER(ctypes.c_char_p), DDS_Long]),
+
     ('String_free', None, None, [ctypes.c_char_p]),
     
     ('Wstring_free', None, None, [ctypes.c_wchar_p]),
-]))
+])
+for _name in _prototypes:
+    setattr(type(DDSFunc), _name, _NativeFunction(_name))
+del _name
+_attach_methods(_prototypes)
+
+# options of TypePlan.unpack and unpack_member
+UNPACK_NUMPY = 1    # numeric sequences and arrays as numpy arrays
+UNPACK_RECORDS = 2  # structs as namedtuples instead of dicts, see TypePlan.record
+
+def _unpack_flags(as_numpy, as_records):
+    if as_numpy and numpy is None:
+        raise ImportError('as_numpy requires numpy')
+    return (UNPACK_NUMPY if as_numpy else 0) | (UNPACK_RECORDS if as_records else 0)
+
+# Marshalling plans
+#
+# Walking a TypeCode through ctypes costs several native calls per member, so
+# every TypeCode is compiled once into a TypePlan that knows how to move its
+# values in and out of a DynamicData. Plans are cached by TypeCode address,
+# which stays valid for as long as the type is registered with a participant,
+# so DDS.close() forgets those of its participant's types (see _forget_plans)
+# before another TypeCode can be allocated at the same address.
+
+_plans = {}
+_compiling = {}
+_plans_lock = threading.RLock()
+
+def _tc_address(tc):
+    return ctypes.cast(tc, ctypes.c_void_p).value
+
+def compile_plan(tc):
+    key = _tc_address(tc)
+    plan = _plans.get(key)
+    if plan is None:
+        with _plans_lock:
+            # recursive types find their own, still compiling, plan
+            plan = _plans.get(key) or _compiling.get(key)
+            if plan is None and tc.kind(ex()) == TCKind.ALIAS:
+                # resolved once, values of an alias are moved as those of the type it names
+                plan = _plans[key] = compile_plan(tc.content_type(ex()))
+            elif plan is None:
+                plan = _compiling[key] = TypePlan(tc)
+                try:
+                    plan._compile()
+                    _plans[key] = plan
+                finally:
+                    del _compiling[key]
+    return plan
+
+def _forget_plans(plans):
+    """Drops plans, and those of their members and elements, from the cache, along with the cdr
+    codecs, records and column layouts kept on them. Those are compiled again when next needed."""
+    reachable = set()
+    pending = [plan for plan in plans if plan is not None]
+    while pending:
+        plan = pending.pop()
+        if id(plan) in reachable:
+            continue
+        reachable.add(id(plan))
+        pending.extend(member for name, cname, member in plan.members)
+        pending.extend(member for member in (plan.discriminator, plan.element) if member is not None)
+    with _plans_lock:
+        for key, plan in list(_plans.items()):
+            if id(plan) in reachable:
+                del _plans[key]
+
+class TypePlan(object):
+    """How values of one TypeCode are written into and unpacked from DynamicData.
+
+    write_member/unpack_member move a value of this type as a member of an
+    enclosing DynamicData. For structs, unions, sequences and arrays
+    write/unpack fill or read a DynamicData of this type itself. Unions are
+    {member name: value} dicts of their one selected member, enums IntEnums.
+    """
+
+    def __init__(self, tc):
+        self.tc = tc
+        self.kind = tc.kind(ex())
+        # (name, cname, plan) of each struct or union member
+        self.members = []
+        # name: (cname, plan) of each struct or union member
+        self.member_plans = {}
+        # names of the struct's optional members, unpacked as None when not set
+        self.optional = frozenset()
+        # the union's discriminator plan, labels of each member and the default member's name
+        self.discriminator = None
+        self.labels = {}
+        self.default_member = None
+        # IntEnum of an enum's values
+        self.enum = None
+        # plan of the elements of a sequence or array
+        self.element = None
+        # bound of a sequence, total number of elements of an array
+        self.length = None
+        # struct whose members are all replaced as a whole when written, see overwrites
+        self.flat = False
+        self.member_names = frozenset()
+        # names of the struct's key members
+        self.key_names = ()
+        # namedtuple structs are unpacked into with UNPACK_RECORDS
+        self.record = None
+        # set by cdr_compile
+        self.cdr_encode = None
+        self.cdr_decode = None
+        # set by _column_layout
+        self.columns = None
+
+    def _compile(self):
+        tc = self.tc
+        if self.kind == TCKind.STRUCT:
+            key_names = []
+            optional = []
+            for i in range(tc.member_count(ex())):
+                cname = tc.member_name(i, ex())
+                self.members.append((pstring(cname), cname, compile_plan(tc.member_type(i, ex()))))
+                if tc.is_member_key(i, ex()):
+                    key_names.append(pstring(cname))
+                elif not tc.is_member_required(i, ex()):
+                    optional.append(pstring(cname))
+            self.key_names = tuple(key_names)
+            self.optional = frozenset(optional)
+            record_name = pstring(tc.name(ex())).rpartition('::')[2]
+            self.record = collections.namedtuple(record_name if record_name.isidentifier() else 'Record',
+                                                 [name for name, cname, plan in self.members], rename=True)
+            self.member_plans = {name: (cname, plan) for name, cname, plan in self.members}
+            self.member_names = frozenset(self.member_plans)
+            self.flat = all(plan.kind in _dyn_basic_types or plan.kind in (TCKind.STRING, TCKind.WSTRING, TCKind.ENUM) or
+                            (plan.element is not None and plan.element.kind in _dyn_basic_types) for name, cname, plan in self.members)
+        elif self.kind == TCKind.UNION:
+            self.discriminator = compile_plan(tc.discriminator_type(ex()))
+            default_index = tc.default_index(ex())
+            for i in range(tc.member_count(ex())):
+                cname = tc.member_name(i, ex())
+                name = pstring(cname)
+                self.members.append((name, cname, compile_plan(tc.member_type(i, ex()))))
+                self.labels[name] = [tc.member_label(i, j, ex()) for j in range(tc.member_label_count(i, ex()))]
+                if i == default_index:
+                    self.default_member = name
+            self.member_plans = {name: (cname, plan) for name, cname, plan in self.members}
+            self.member_names = frozenset(self.member_plans)
+        elif self.kind == TCKind.ENUM:
+            record_name = pstring(tc.name(ex())).rpartition('::')[2]
+            self.enum = _IntEnum(record_name if record_name.isidentifier() else 'Enum',
+                                 [(pstring(tc.member_name(i, ex())), tc.member_ordinal(i, ex())) for i in range(tc.member_count(ex()))])
+        elif self.kind == TCKind.SEQUENCE:
+            self.element = compile_plan(tc.content_type(ex()))
+            self.length = tc.length(ex())
+        elif self.kind == TCKind.ARRAY:
+            self.element = compile_plan(tc.content_type(ex()))
+            self.length = 1
+            for i in range(tc.array_dimension_count(ex())):
+                self.length *= tc.array_dimension(i, ex())
+
+        if self.element is not None and self.element.kind in _dyn_basic_types:
+            codec = _primitive_collection_codec
+        else:
+            codec = _member_codecs.get(self.kind, _unsupported_codec)
+        self.write_member, self.unpack_member = codec(self)
+
+    def overwrites(self, obj):
+        """Whether writing obj sets every member, so the DynamicData needs no clearing first"""
+        return self.flat and obj.keys() >= self.member_names
+
+    def write(self, obj, dd):
+        if self.kind == TCKind.STRUCT:
+            assert isinstance(obj, dict)
+            optional = self.optional
+            for name, cname, plan in self.members:
+                if name in obj:
+                    value = obj[name]
+                    if value is None and name in optional:
+                        DDSFunc.DynamicData_clear_optional_member(dd, cname, DDS_DYNAMIC_DATA_MEMBER_ID_UNSPECIFIED)
+                    else:
+                        plan.write_member(value, dd, cname, DDS_DYNAMIC_DATA_MEMBER_ID_UNSPECIFIED)
+        elif self.kind == TCKind.UNION:
+            if not isinstance(obj, dict) or len(obj) != 1:
+                raise ValueError('unions are written as a dict of their one selected member, not %r' % (obj,))
+            (name, value), = obj.items()
+            cname, plan = self.member_plans[name]
+            plan.write_member(value, dd, cname, DDS_DYNAMIC_DATA_MEMBER_ID_UNSPECIFIED)
+        elif self.kind == TCKind.ARRAY or self.kind == TCKind.SEQUENCE:
+            assert isinstance(obj, list)
+            write_member = self.element.write_member
+            for i, x in enumerate(obj):
+                write_member(x, dd, None, i+1)
+        else:
+            raise NotImplementedError(self.kind)
+
+    def unpack(self, dd, flags=0):
+        if self.kind == TCKind.STRUCT and self.optional:
+            values = [None if name in self.optional and not DDSFunc.DynamicData_member_exists(dd, cname, DDS_DYNAMIC_DATA_MEMBER_ID_UNSPECIFIED)
+                      else plan.unpack_member(dd, cname, DDS_DYNAMIC_DATA_MEMBER_ID_UNSPECIFIED, flags) for name, cname, plan in self.members]
+            if flags & UNPACK_RECORDS:
+                return self.record._make(values)
+            return dict(zip(self.member_plans, values))
+        elif self.kind == TCKind.STRUCT:
+            if flags & UNPACK_RECORDS:
+                return self.record._make(plan.unpack_member(dd, cname, DDS_DYNAMIC_DATA_MEMBER_ID_UNSPECIFIED, flags) for name, cname, plan in self.members)
+            return {name: plan.unpack_member(dd, cname, DDS_DYNAMIC_DATA_MEMBER_ID_UNSPECIFIED, flags) for name, cname, plan in self.members}
+        elif self.kind == TCKind.ARRAY or self.kind == TCKind.SEQUENCE:
+            unpack_member = self.element.unpack_member
+            return [unpack_member(dd, None, i+1, flags) for i in range(DDSFunc.DynamicData_get_member_count(dd))]
+        elif self.kind == TCKind.UNION:
+            info = DDSType.DynamicDataMemberInfo()
+            try:
+                DDSFunc.DynamicData_get_member_info_by_index(dd, ctypes.byref(info), 0)
+            except Error:
+                # no member selected yet
+                return None
+            name = pstring(info.member_name)
+            cname, plan = self.member_plans[name]
+            return {name: plan.unpack_member(dd, cname, DDS_DYNAMIC_DATA_MEMBER_ID_UNSPECIFIED, flags)}
+        else:
+            raise NotImplementedError(self.kind)
+
+# Member codecs, each returns a (write_member, unpack_member) pair for a plan
+
+def _basic_codec(plan):
+    func_name, data_type, bounds = _dyn_basic_types[plan.kind]
+    setter = getattr(DDSFunc, 'DynamicData_set_' + func_name)
+    getter = getattr(DDSFunc, 'DynamicData_get_' + func_name)
+
+    if bounds is None:
+        def write_member(obj, dd, member_name, member_id):
+            setter(dd, member_name, member_id, obj)
+    else:
+        low, high = bounds
+        def write_member(obj, dd, member_name, member_id):
+            if not low <= obj < high:
+                raise ValueError('%r not in range [%r, %r)' % (obj, low, high))
+            setter(dd, member_name, member_id, obj)
 
-def write_into_dd_member(obj, dd, member_name=None, member_id=DDS_DYNAMIC_DATA_MEMBER_ID_UNSPECIFIED):
-    member_name = cstring(member_name)
+    def unpack_member(dd, member_name, member_id, flags):
+        inner = data_type()
+        getter(dd, ctypes.byref(inner), member_name, member_id)
+        return inner.value
+    return write_member, unpack_member
 
-    tc = ctypes.POINTER(DDSType.TypeCode)()
-    dd.get_member_type(ctypes.byref(tc), member_name, member_id, ex())
-    
-    kind = tc.kind(ex())
-    if kind in _dyn_basic_types:
-        func_name, data_type, bounds = _dyn_basic_types[kind]
-        if bounds is not None and not bounds[0] <= obj < bounds[1]:
-            raise ValueError('%r not in range [%r, %r)' % (obj, bounds[0], bounds[1]))
-        getattr(dd, 'set_' + func_name)(member_name, member_id, obj)
-    elif kind == TCKind.STRUCT or kind == TCKind.SEQUENCE or kind == TCKind.ARRAY:
-        #TODO: move this to its own generic implementation of sequnece writing
-        if kind == TCKind.SEQUENCE:
-            content_type = tc.content_type(ex())
-            content_kind = content_type.kind(ex())
-            if content_kind == TCKind.OCTET and type(obj) is bytes:
-                dd.set_octet_array(member_name, member_id, len(obj), obj)
-                return
+def _complex_codec(plan):
+    prop = get('DYNAMIC_DATA_PROPERTY_DEFAULT', DDSType.DynamicDataProperty_t)
 
-        inner = DDSFunc.DynamicData_new(None, get('DYNAMIC_DATA_PROPERTY_DEFAULT', DDSType.DynamicDataProperty_t))
+    def write_member(obj, dd, member_name, member_id):
+        inner = DDSFunc.DynamicData_new(None, prop)
         try:
-            dd.bind_complex_member(inner, member_name, member_id)
+            DDSFunc.DynamicData_bind_complex_member(dd, inner, member_name, member_id)
             try:
-                write_into_dd(obj, inner)
+                plan.write(obj, inner)
             finally:
-                dd.unbind_complex_member(inner)
+                DDSFunc.DynamicData_unbind_complex_member(dd, inner)
         finally:
-            inner.delete()
-    elif kind == TCKind.STRING:
-        if '\0' in obj:
-            raise ValueError('strings can not contain null characters')
-        dd.set_string(member_name, member_id, cstring(obj))
-    elif kind == TCKind.WSTRING:
-        dd.set_wstring(member_name, member_id, obj)
-    elif kind == TCKind.ENUM:
-        dd.set_long(member_name, member_id, obj)
-    else:
-        raise NotImplementedError(kind)
-
-def write_into_dd(obj, dd):
-    obj_type = dd.get_type()
-    kind = dd.get_type_kind()
-    if kind == TCKind.STRUCT:
-        assert isinstance(obj, dict)
-        tc = dd.get_type()
-        for i in range(tc.member_count(ex())):
-            name = pstring(tc.member_name(i, ex()))
-            if name in obj:
-                write_into_dd_member(obj[name], dd, member_name=name)
-    elif kind == TCKind.ARRAY or kind == TCKind.SEQUENCE:
-        assert isinstance(obj, list)
-        for i, x in enumerate(obj):
-            write_into_dd_member(x, dd, member_id=i+1)
-    else:
-        raise NotImplementedError(kind)
+            DDSFunc.DynamicData_delete(inner)
 
-def unpack_dd_member(dd, member_name=None, member_id=DDS_DYNAMIC_DATA_MEMBER_ID_UNSPECIFIED):
-    tc = ctypes.POINTER(DDSType.TypeCode)()
-    dd.get_member_type(ctypes.byref(tc), member_name, member_id, ex())
-    
-    kind = tc.kind(ex())
-    if kind in _dyn_basic_types:
-        func_name, data_type, bounds = _dyn_basic_types[kind]
-        inner = data_type()
-        getattr(dd, 'get_' + func_name)(ctypes.byref(inner), member_name, member_id)
-        return inner.value
-    elif kind == TCKind.STRUCT or kind == TCKind.SEQUENCE or kind == TCKind.ARRAY:
-        inner = DDSFunc.DynamicData_new(None, get('DYNAMIC_DATA_PROPERTY_DEFAULT', DDSType.DynamicDataProperty_t))
+    def unpack_member(dd, member_name, member_id, flags):
+        inner = DDSFunc.DynamicData_new(None, prop)
         try:
-            dd.bind_complex_member(inner, member_name, member_id)
+            DDSFunc.DynamicData_bind_complex_member(dd, inner, member_name, member_id)
             try:
-                #TODO: move this to its own generic implementation of sequnece unpacking
-                if kind == TCKind.SEQUENCE:
-                    content_type = tc.content_type(ex())
-                    content_kind = content_type.kind(ex())
-                    if content_kind == TCKind.OCTET:
-                        data_len = inner.get_member_count()
-                        length = DDS_UnsignedLong(data_len)
-                        length_p = ctypes.cast(ctypes.addressof(length), DDS_UnsignedLong_p)
-                        obj = ctypes.create_string_buffer(data_len)
-                        dd.get_octet_array(obj, length_p, member_name, member_id)
-                        # TODO: should we assert here that data read is the correct size?
-                        return obj.raw
-
-                return unpack_dd(inner)
+                return plan.unpack(inner, flags)
             finally:
-                dd.unbind_complex_member(inner)
+                DDSFunc.DynamicData_unbind_complex_member(dd, inner)
+        finally:
+            DDSFunc.DynamicData_delete(inner)
+    return write_member, unpack_member
+
+# sequences whose bound fits in this many bytes are read straight into a
+# buffer of that size, larger ones are bound first to learn their length
+_SMALL_SEQUENCE_BYTES = 64 * 1024
+
+def _collection_length(dd, member_name, member_id, prop):
+    inner = DDSFunc.DynamicData_new(None, prop)
+    try:
+        DDSFunc.DynamicData_bind_complex_member(dd, inner, member_name, member_id)
+        try:
+            return DDSFunc.DynamicData_get_member_count(inner)
         finally:
-            inner.delete()
-    elif kind == TCKind.STRING:
+            DDSFunc.DynamicData_unbind_complex_member(dd, inner)
+    finally:
+        DDSFunc.DynamicData_delete(inner)
+
+def _numpy_dtype(kind):
+    if numpy is None or kind == TCKind.CHAR or kind == TCKind.WCHAR:
+        return None
+    return numpy.dtype(_dyn_basic_types[kind][1])
+
+def _numpy_elements(obj, dtype, bounds):
+    """The ndarray obj as contiguous dtype elements. Integers are checked against bounds rather
+    than wrapped, and floats are not truncated into integers, as neither would be for a list."""
+    if obj.dtype != dtype and not numpy.can_cast(obj.dtype, dtype, 'safe'):
+        if obj.dtype.kind in 'biu' and dtype.kind in 'iu':
+            if bounds is not None and obj.size and not (bounds[0] <= obj.min() and obj.max() < bounds[1]):
+                raise ValueError('%r not in range [%r, %r)' % (obj, bounds[0], bounds[1]))
+        elif not (obj.dtype.kind == 'f' and dtype.kind == 'f'):
+            raise ValueError('%s elements can not be stored as %s' % (obj.dtype, dtype))
+    return numpy.ascontiguousarray(obj, dtype)
+
+# struct format characters grouped by how their bits are interpreted
+_buffer_format_classes = {}
+_buffer_format_classes.update(dict.fromkeys('bhilqn', 'signed'))
+_buffer_format_classes.update(dict.fromkeys('BHILQN', 'unsigned'))
+_buffer_format_classes.update(dict.fromkeys('efd', 'float'))
+_buffer_format_classes['?'] = 'bool'
+_buffer_format_classes['c'] = 'unsigned'
+
+def _element_buffer(obj, data_type, dtype):
+    """(pointer, length) to obj's own memory when it already holds contiguous
+    data_type elements, so it can be written without copying, otherwise None"""
+    if isinstance(obj, bytes):
+        if data_type is DDS_Octet:
+            return obj, len(obj)
+        return None
+    if dtype is not None and isinstance(obj, numpy.ndarray):
+        if obj.dtype == dtype and obj.flags.c_contiguous:
+            return obj.ctypes.data, obj.size
+        return None
+    if isinstance(obj, list):
+        return None
+
+    try:
+        view = memoryview(obj)
+    except TypeError:
+        return None
+    if not view.c_contiguous or view.itemsize != ctypes.sizeof(data_type):
+        return None
+    if data_type is not DDS_Octet:
+        fmt = view.format.lstrip('@')
+        if _buffer_format_classes.get(fmt) != _buffer_format_classes.get(data_type._type_):
+            return None
+    if view.readonly:
+        # ctypes can only point into writable buffers
+        if data_type is DDS_Octet:
+            return view.tobytes(), view.nbytes
+        return None
+    return (ctypes.c_char * view.nbytes).from_buffer(view), view.nbytes // view.itemsize
+
+def _primitive_collection_codec(plan):
+    """Sequences and arrays of basic types, moved with one get/set_*_array call
+
+    Writes take lists as well as bytes, ndarrays and other buffers, the latter
+    passed without copying. With UNPACK_NUMPY reads return ndarrays.
+    """
+    prop = get('DYNAMIC_DATA_PROPERTY_DEFAULT', DDSType.DynamicDataProperty_t)
+    kind = plan.element.kind
+    func_name, data_type, bounds = _dyn_basic_types[kind]
+    setter = getattr(DDSFunc, 'DynamicData_set_' + func_name + '_array')
+    getter = getattr(DDSFunc, 'DynamicData_get_' + func_name + '_array')
+    is_array = plan.kind == TCKind.ARRAY
+    small = is_array or plan.length * ctypes.sizeof(data_type) <= _SMALL_SEQUENCE_BYTES
+    dtype = _numpy_dtype(kind)
+
+    def write_member(obj, dd, member_name, member_id):
+        if dtype is not None and isinstance(obj, numpy.ndarray) and obj.dtype != dtype:
+            obj = _numpy_elements(obj, dtype, bounds)
+
+        buf = _element_buffer(obj, data_type, dtype)
+        if buf is not None and (not is_array or buf[1] == plan.length):
+            buf, length = buf
+        else:
+            length = len(obj)
+            if bounds is not None and length and not (bounds[0] <= min(obj) and max(obj) < bounds[1]):
+                bad = next(x for x in obj if not bounds[0] <= x < bounds[1])
+                raise ValueError('%r not in range [%r, %r)' % (bad, bounds[0], bounds[1]))
+            if is_array:
+                if length > plan.length:
+                    raise ValueError('%d elements do not fit in an array of %d' % (length, plan.length))
+                # elements past the end of obj are left zeroed
+                length = plan.length
+            buf = (data_type * length)(*obj)
+        setter(dd, member_name, member_id, length, buf)
+
+    def unpack_member(dd, member_name, member_id, flags):
+        if small:
+            capacity = plan.length
+        else:
+            capacity = _collection_length(dd, member_name, member_id, prop)
+        length = DDS_UnsignedLong(capacity)
+        if flags & UNPACK_NUMPY and dtype is not None:
+            # filled in place and handed out as is, the only copy is the one out of DynamicData
+            arr = numpy.empty(capacity, dtype)
+            getter(dd, arr.ctypes.data, ctypes.byref(length), member_name, member_id)
+            if length.value < capacity:
+                # a slice would keep the whole bound alive for as long as the caller keeps it
+                return arr[:length.value].copy()
+            return arr
+
+        buf = (data_type * capacity)()
+        getter(dd, buf, ctypes.byref(length), member_name, member_id)
+        if kind == TCKind.OCTET:
+            return ctypes.string_at(buf, length.value)
+        elif kind == TCKind.CHAR or kind == TCKind.WCHAR:
+            # slicing would join them into a single bytes/str
+            return list(buf)[:length.value]
+        return buf[:length.value]
+    return write_member, unpack_member
+
+def _string_codec(plan):
+    def write_member(obj, dd, member_name, member_id):
+        if '\0' in obj:
+            raise ValueError('strings can not contain null characters')
+        DDSFunc.DynamicData_set_string(dd, member_name, member_id, cstring(obj))
+
+    def unpack_member(dd, member_name, member_id, flags):
         inner = ctypes.c_char_p(None)
         try:
-            dd.get_string(ctypes.byref(inner), None, member_name, member_id)
+            DDSFunc.DynamicData_get_string(dd, ctypes.byref(inner), None, member_name, member_id)
             return pstring(inner.value)
         finally:
             DDSFunc.String_free(inner)
-    elif kind == TCKind.WSTRING:
+    return write_member, unpack_member
+
+def _wstring_codec(plan):
+    def write_member(obj, dd, member_name, member_id):
+        DDSFunc.DynamicData_set_wstring(dd, member_name, member_id, obj)
+
+    def unpack_member(dd, member_name, member_id, flags):
         inner = ctypes.c_wchar_p(None)
         try:
-            dd.get_wstring(ctypes.byref(inner), None, member_name, member_id)
+            DDSFunc.DynamicData_get_wstring(dd, ctypes.byref(inner), None, member_name, member_id)
             return inner.value
         finally:
             DDSFunc.Wstring_free(inner)
-    elif kind == TCKind.ENUM:
+    return write_member, unpack_member
+
+class _IntEnum(IntEnum):
+    """Base of the IntEnums enum plans make, whose values pickle as plain
+    ints as processes that never compiled the type can not find the class"""
+    def __reduce_ex__(self, protocol):
+        return int, (int(self),)
+
+def _enum_codec(plan):
+    # values not in the type, which peers may still send, are left ints
+    values = {int(value): value for value in plan.enum}
+
+    def write_member(obj, dd, member_name, member_id):
+        DDSFunc.DynamicData_set_long(dd, member_name, member_id, obj)
+
+    def unpack_member(dd, member_name, member_id, flags):
         inner = DDS_Long()
-        dd.get_longlong(ctypes.byref(inner), member_name, member_id)
-        return inner.value
-    else:
-        raise NotImplementedError(kind)
-
-def unpack_dd(dd):
-    kind = dd.get_type_kind()
-    if kind == TCKind.STRUCT:
-        obj = {}
-        tc = dd.get_type()
-        for i in range(tc.member_count(ex())):
-            name = tc.member_name(i, ex())
-            obj[pstring(name)] = unpack_dd_member(dd, member_name=name)
-        return obj
-    elif kind == TCKind.ARRAY or kind == TCKind.SEQUENCE:
-        obj = []
-        for i in range(dd.get_member_count()):
-            obj.append(unpack_dd_member(dd, member_id=i+1))
-        return obj
-    else:
-        raise NotImplementedError(kind)
+        DDSFunc.DynamicData_get_long(dd, ctypes.byref(inner), member_name, member_id)
+        return values.get(inner.value, inner.value)
+    return write_member, unpack_member
+
+def _unsupported_codec(plan):
+    # fail only when a value of the type is actually moved, like before plans
+    def write_member(obj, dd, member_name, member_id):
+        raise NotImplementedError(plan.kind)
+
+    def unpack_member(dd, member_name, member_id, flags):
+        raise NotImplementedError(plan.kind)
+    return write_member, unpack_member
+
+_member_codecs = dict.fromkeys(_dyn_basic_types, _basic_codec)
+_member_codecs.update({
+    TCKind.STRUCT: _complex_codec,
+    TCKind.UNION: _complex_codec,
+    TCKind.SEQUENCE: _complex_codec,
+    TCKind.ARRAY: _complex_codec,
+    TCKind.STRING: _string_codec,
+    TCKind.WSTRING: _wstring_codec,
+    TCKind.ENUM: _enum_codec,
+})
+
+def _member_plan(dd, member_name, member_id):
+    tc = ctypes.POINTER(DDSType.TypeCode)()
+    dd.get_member_type(ctypes.byref(tc), member_name, member_id, ex())
+    return compile_plan(tc)
+
+def write_into_dd_member(obj, dd, member_name=None, member_id=DDS_DYNAMIC_DATA_MEMBER_ID_UNSPECIFIED):
+    member_name = cstring(member_name)
+    _member_plan(dd, member_name, member_id).write_member(obj, dd, member_name, member_id)
+
+def write_into_dd(obj, dd):
+    compile_plan(dd.get_type()).write(obj, dd)
+
+def unpack_dd_member(dd, member_name=None, member_id=DDS_DYNAMIC_DATA_MEMBER_ID_UNSPECIFIED, as_numpy=False, as_records=False):
+    return _member_plan(dd, member_name, member_id).unpack_member(dd, member_name, member_id, _unpack_flags(as_numpy, as_records))
+
+def unpack_dd(dd, as_numpy=False, as_records=False):
+    return compile_plan(dd.get_type()).unpack(dd, _unpack_flags(as_numpy, as_records))
+
+# CDR
+#
+# Writers and Readers created with cdr=True skip the DynamicData accessors:
+# samples are serialized in Python to classic little endian CDR and handed
+# to the middleware, or taken from it, with one from_cdr_buffer/to_cdr_buffer
+# call. Consecutive basic members of a struct are packed by one struct.Struct,
+# whose padding depends on where the run starts, so one is made for each of
+# the 8 alignments it can start at. Offsets count from the end of the 4 byte
+# encapsulation header every buffer starts with.
+
+_CDR_LE = b'\x00\x01\x00\x00'
+_EXTENSIBILITY_MUTABLE = 2
+_cdr_zeros = bytes(8)
+_cdr_ulong = struct.Struct('<I')
+
+# struct format of the basic types, which CDR aligns to their size
+_cdr_formats = {
+    TCKind.SHORT: 'h', TCKind.USHORT: 'H', TCKind.LONG: 'i', TCKind.ULONG: 'I',
+    TCKind.LONGLONG: 'q', TCKind.ULONGLONG: 'Q', TCKind.FLOAT: 'f', TCKind.DOUBLE: 'd',
+    TCKind.BOOLEAN: '?', TCKind.OCTET: 'B', TCKind.CHAR: 'c', TCKind.ENUM: 'i',
+}
+# what members missing from a written dict are sent as, like unset DynamicData members
+_cdr_defaults = dict.fromkeys(_cdr_formats, 0)
+_cdr_defaults.update({TCKind.BOOLEAN: False, TCKind.CHAR: b'\0', TCKind.STRING: '',
+                      TCKind.STRUCT: {}, TCKind.SEQUENCE: [], TCKind.ARRAY: [], TCKind.UNION: None})
+
+_cdr_compiling = set()
+
+def _cdr_pad(pos, align):
+    return -(pos - 4) % align
+
+def _cdr_run_structs(formats):
+    """Struct of a run of basic members for each offset % 8 it can start at, leading padding included"""
+    structs = []
+    for start in range(8):
+        fmt, offset = '<', start
+        for f in formats:
+            size = struct.calcsize(f)
+            fmt += 'x' * (-offset % size) + f
+            offset += -offset % size + size
+        structs.append(struct.Struct(fmt))
+    return structs
+
+def cdr_compile(plan):
+    """Gives plan its cdr_encode(obj, out), appending obj's CDR to the bytearray out, and its
+    cdr_decode(buf, pos, flags), returning (value, offset past it). NotImplementedError for
+    mutable types, optional members, wide strings and the other kinds of types this CDR does
+    not cover."""
+    with _plans_lock:
+        if plan.cdr_encode is not None or plan in _cdr_compiling:
+            return
+        _cdr_compiling.add(plan)
+        try:
+            if plan.kind == TCKind.STRUCT:
+                codec = _cdr_struct
+            elif plan.kind == TCKind.UNION:
+                codec = _cdr_union
+            elif plan.kind == TCKind.STRING:
+                codec = _cdr_string
+            elif plan.element is not None and plan.element.kind in _dyn_basic_types:
+                codec = _cdr_primitive_collection
+            elif plan.element is not None:
+                codec = _cdr_collection
+            elif plan.kind in _cdr_formats:
+                codec = _cdr_basic
+            else:
+                raise NotImplementedError(plan.kind)
+            plan.cdr_encode, plan.cdr_decode = codec(plan)
+        finally:
+            _cdr_compiling.discard(plan)
+
+def _cdr_basic(plan):
+    # basic values outside of structs, as collection elements, struct members are packed in runs
+    s = struct.Struct('<' + _cdr_formats[plan.kind])
+    values = _cdr_enum_values(plan)
+
+    def encode(obj, out):
+        out += _cdr_zeros[:_cdr_pad(len(out), s.size)]
+        out += s.pack(obj)
+
+    def decode(buf, pos, flags):
+        pos += _cdr_pad(pos, s.size)
+        value, = s.unpack_from(buf, pos)
+        if values is not None:
+            value = values.get(value, value)
+        return value, pos + s.size
+    return encode, decode
+
+def _cdr_enum_values(plan):
+    # value: IntEnum member of an enum plan, as _enum_codec unpacks them
+    if plan.enum is None:
+        return None
+    return {int(value): value for value in plan.enum}
+
+class _CdrRun(object):
+    """Consecutive basic members of a struct"""
+    def __init__(self):
+        self.names = []
+        self.kinds = []
+        # (index in the run, values) of enum members, see _cdr_enum_values
+        self.enums = []
+
+    def compile(self):
+        self.get = operator.itemgetter(*self.names)
+        self.single = len(self.names) == 1
+        self.defaults = [_cdr_defaults[kind] for kind in self.kinds]
+        self.structs = _cdr_run_structs([_cdr_formats[kind] for kind in self.kinds])
+
+def _cdr_struct(plan):
+    if plan.tc.extensibility_kind(ex()) == _EXTENSIBILITY_MUTABLE:
+        raise NotImplementedError('mutable types')
+    if plan.optional:
+        # classic CDR only has room for them in parameter lists
+        raise NotImplementedError('optional members')
+    # _CdrRun of basic members, (name, plan) of the others
+    steps = []
+    for name, cname, member in plan.members:
+        if member.kind in _cdr_formats:
+            if not steps or not isinstance(steps[-1], _CdrRun):
+                steps.append(_CdrRun())
+            steps[-1].names.append(name)
+            steps[-1].kinds.append(member.kind)
+            if member.enum is not None:
+                steps[-1].enums.append((len(steps[-1].names) - 1, _cdr_enum_values(member)))
+        else:
+            cdr_compile(member)
+            steps.append((name, member))
+    for step in steps:
+        if isinstance(step, _CdrRun):
+            step.compile()
+    names = [name for name, cname, member in plan.members]
+    record = plan.record
+
+    def encode(obj, out):
+        for step in steps:
+            if type(step) is tuple:
+                name, member = step
+                value = obj.get(name)
+                member.cdr_encode(_cdr_defaults[member.kind] if value is None else value, out)
+                continue
+            try:
+                values = step.get(obj)
+            except KeyError:
+                values = [obj.get(name, default) for name, default in zip(step.names, step.defaults)]
+            else:
+                if step.single:
+                    values = (values,)
+            out += step.structs[(len(out) - 4) % 8].pack(*values)
+
+    def decode(buf, pos, flags):
+        values = []
+        for step in steps:
+            if type(step) is tuple:
+                value, pos = step[1].cdr_decode(buf, pos, flags)
+                values.append(value)
+            else:
+                s = step.structs[(pos - 4) % 8]
+                run = s.unpack_from(buf, pos)
+                if step.enums:
+                    run = list(run)
+                    for i, enum_values in step.enums:
+                        run[i] = enum_values.get(run[i], run[i])
+                values.extend(run)
+                pos += s.size
+        if flags & UNPACK_RECORDS:
+            return record._make(values), pos
+        return dict(zip(names, values)), pos
+    return encode, decode
+
+def _cdr_union(plan):
+    """The discriminator then the selected member"""
+    if plan.tc.extensibility_kind(ex()) == _EXTENSIBILITY_MUTABLE:
+        raise NotImplementedError('mutable types')
+    discriminator = plan.discriminator
+    cdr_compile(discriminator)
+    for name, cname, member in plan.members:
+        cdr_compile(member)
+    members = {name: member for name, cname, member in plan.members}
+    by_label = {label: name for name, labels in plan.labels.items() if name != plan.default_member for label in labels}
+    # the default member is selected by any value no other member has
+    candidates = [int(value) for value in discriminator.enum] if discriminator.enum is not None else itertools.count()
+    default_label = next((label for label in candidates if label not in by_label), None)
+    # discriminator value each member is written with, as discriminator.cdr_encode takes it
+    selectors = {}
+    for name, labels in plan.labels.items():
+        label = default_label if name == plan.default_member or not labels else labels[0]
+        if label is not None and discriminator.kind == TCKind.CHAR:
+            label = bytes([label & 0xff])
+        elif label is not None and discriminator.kind == TCKind.BOOLEAN:
+            label = bool(label)
+        selectors[name] = label
+    unset = plan.default_member or plan.members[0][0]
+
+    def encode(obj, out):
+        if obj is None:
+            # like a DynamicData union nothing was written into
+            name, value = unset, _cdr_defaults.get(members[unset].kind)
+        elif not isinstance(obj, dict) or len(obj) != 1:
+            raise ValueError('unions are written as a dict of their one selected member, not %r' % (obj,))
+        else:
+            (name, value), = obj.items()
+        member = members[name]
+        if selectors[name] is None:
+            raise ValueError('no discriminator value is left for %s' % name)
+        discriminator.cdr_encode(selectors[name], out)
+        member.cdr_encode(_cdr_defaults.get(member.kind) if value is None else value, out)
+
+    def decode(buf, pos, flags):
+        label, pos = discriminator.cdr_decode(buf, pos, flags)
+        name = by_label.get(label[0] if isinstance(label, bytes) else int(label), plan.default_member)
+        if name is None:
+            # a value no member is selected by
+            return None, pos
+        value, pos = members[name].cdr_decode(buf, pos, flags)
+        return {name: value}, pos
+    return encode, decode
+
+def _cdr_string(plan):
+    def encode(obj, out):
+        if '\0' in obj:
+            raise ValueError('strings can not contain null characters')
+        data = bytes(obj, 'ascii')
+        out += _cdr_zeros[:_cdr_pad(len(out), 4)]
+        out += _cdr_ulong.pack(len(data) + 1)
+        out += data
+        out += b'\0'
+
+    def decode(buf, pos, flags):
+        pos += _cdr_pad(pos, 4)
+        length, = _cdr_ulong.unpack_from(buf, pos)
+        pos += 4
+        # the length counts the terminating null
+        return str(buf[pos:pos + length - 1], 'ascii'), pos + length
+    return encode, decode
+
+def _cdr_primitive_collection(plan):
+    """Sequences and arrays of basic types, moved as one block of bytes like _primitive_collection_codec"""
+    kind = plan.element.kind
+    fmt = _cdr_formats[kind]
+    size = struct.calcsize(fmt)
+    is_array = plan.kind == TCKind.ARRAY
+    bounds = _dyn_basic_types[kind][2]
+    dtype = _numpy_dtype(kind)
+    if dtype is not None:
+        dtype = dtype.newbyteorder('<')
+
+    def encode(obj, out):
+        if isinstance(obj, bytes) and kind == TCKind.OCTET:
+            data, length = obj, len(obj)
+        elif dtype is not None and isinstance(obj, numpy.ndarray):
+            data, length = _numpy_elements(obj, dtype, bounds).tobytes(), obj.size
+        else:
+            length = len(obj)
+            data = struct.pack('<%d%s' % (length, fmt), *obj)
+        if is_array:
+            if length > plan.length:
+                raise ValueError('%d elements do not fit in an array of %d' % (length, plan.length))
+            # elements past the end of obj are left zeroed
+            data += bytes((plan.length - length) * size)
+        else:
+            if length > plan.length:
+                raise ValueError('%d elements do not fit in a sequence of %d' % (length, plan.length))
+            out += _cdr_zeros[:_cdr_pad(len(out), 4)]
+            out += _cdr_ulong.pack(length)
+        out += _cdr_zeros[:_cdr_pad(len(out), size)]
+        out += data
+
+    def decode(buf, pos, flags):
+        if is_array:
+            length = plan.length
+        else:
+            pos += _cdr_pad(pos, 4)
+            length, = _cdr_ulong.unpack_from(buf, pos)
+            pos += 4
+        pos += _cdr_pad(pos, size)
+        end = pos + length * size
+        if flags & UNPACK_NUMPY and dtype is not None:
+            return numpy.frombuffer(buf, dtype, length, pos).copy(), end
+        if kind == TCKind.OCTET:
+            return bytes(buf[pos:end]), end
+        return list(struct.unpack_from('<%d%s' % (length, fmt), buf, pos)), end
+    return encode, decode
+
+def _cdr_collection(plan):
+    """Sequences and arrays of anything else, element by element"""
+    element = plan.element
+    cdr_compile(element)
+    is_array = plan.kind == TCKind.ARRAY
+    default = _cdr_defaults.get(element.kind)
+
+    def encode(obj, out):
+        if len(obj) > plan.length:
+            raise ValueError('%d elements do not fit in a collection of %d' % (len(obj), plan.length))
+        if is_array:
+            obj = list(obj) + [default] * (plan.length - len(obj))
+        else:
+            out += _cdr_zeros[:_cdr_pad(len(out), 4)]
+            out += _cdr_ulong.pack(len(obj))
+        # looked up here, a recursive type's element is still being compiled in cdr_compile
+        encode_element = element.cdr_encode
+        for x in obj:
+            encode_element(x, out)
+
+    def decode(buf, pos, flags):
+        if is_array:
+            length = plan.length
+        else:
+            pos += _cdr_pad(pos, 4)
+            length, = _cdr_ulong.unpack_from(buf, pos)
+            pos += 4
+        decode_element = element.cdr_decode
+        result = []
+        for i in range(length):
+            value, pos = decode_element(buf, pos, flags)
+            result.append(value)
+        return result, pos
+    return encode, decode
+
+def cdr_encode(plan, obj):
+    """obj serialized as a whole CDR buffer, encapsulation header included"""
+    cdr_compile(plan)
+    out = bytearray(_CDR_LE)
+    try:
+        plan.cdr_encode(obj, out)
+    except struct.error as e:
+        # as the DynamicData accessors do for values out of range
+        raise ValueError(str(e))
+    return out
+
+def cdr_decode(plan, buf, flags = 0):
+    """Unpacks a whole CDR buffer, encapsulation header included"""
+    cdr_compile(plan)
+    if bytes(buf[:2]) != _CDR_LE[:2]:
+        raise NotImplementedError('CDR encapsulation %r' % bytes(buf[:2]))
+    return plan.cdr_decode(buf, 4, flags)[0]
+
+def _cdr_dtype(plan, offset):
+    """numpy dtype laid out like plan's CDR at offset, and the offset after it, or None if its size varies"""
+    if plan.kind in _cdr_formats:
+        base = numpy.dtype('S1') if plan.kind == TCKind.CHAR else numpy.dtype('<' + _cdr_formats[plan.kind])
+        return base, offset + -offset % base.itemsize, offset + -offset % base.itemsize + base.itemsize
+    if plan.kind == TCKind.ARRAY and plan.element.kind in _cdr_formats:
+        base, start, end = _cdr_dtype(plan.element, offset)
+        return numpy.dtype((base, (plan.length,))), start, start + base.itemsize * plan.length
+    if plan.kind == TCKind.STRUCT:
+        names, formats, offsets = [], [], []
+        end = offset
+        for name, cname, member in plan.members:
+            layout = _cdr_dtype(member, end)
+            if layout is None:
+                return None
+            names.append(name)
+            formats.append(layout[0])
+            offsets.append(layout[1] - offset)
+            end = layout[2]
+        return numpy.dtype({'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': end - offset}), offset, end
+    return None
+
+def cdr_dtype(plan):
+    """numpy structured dtype whose items are laid out as plan's CDR, or None when
+    plan's type holds strings or sequences, see cdr_encode_array"""
+    if numpy is None:
+        raise ImportError('cdr_dtype requires numpy')
+    cdr_compile(plan)
+    layout = _cdr_dtype(plan, 0)
+    return None if layout is None else layout[0]
+
+def _pack_fields(plan, packed, array):
+    """Copies the fields of the structured ndarray array into those of packed, laid out as
+    plan's struct, by name at every level and with the checks of _numpy_elements"""
+    if array.dtype.names is None:
+        raise ValueError('%s elements are not a struct' % array.dtype)
+    for name, cname, member in plan.members:
+        if name not in array.dtype.names:
+            continue
+        if member.kind == TCKind.STRUCT:
+            _pack_fields(member, packed[name], array[name])
+            continue
+        kind = member.element.kind if member.kind == TCKind.ARRAY else member.kind
+        if kind == TCKind.CHAR:
+            packed[name] = array[name]
+            continue
+        bounds = _dyn_basic_types[TCKind.LONG if kind == TCKind.ENUM else kind][2]
+        packed[name] = _numpy_elements(array[name], packed[name].dtype, bounds)
+
+def cdr_encode_array(plan, array):
+    """CDR buffers of every item of a structured ndarray, all packed by numpy at once.
+    array's fields are taken by name, nested ones too, missing ones are zeroed, and values
+    that would wrap or be truncated raise ValueError as they do when written from dicts.
+    Only for types whose samples all have the same size, see cdr_dtype."""
+    dtype = cdr_dtype(plan)
+    if dtype is None:
+        raise NotImplementedError('the size of %s samples varies' % pstring(plan.tc.name(ex())))
+    packed = numpy.zeros(len(array), dtype)
+    _pack_fields(plan, packed, array)
+    data = packed.tobytes()
+    size = dtype.itemsize
+    return [_CDR_LE + data[i:i + size] for i in range(0, len(data), size)]
+
+# Columns
+#
+# Reader.take_columnar turns a whole loan into one column per struct member.
+# When every sample of the type has the same CDR size, each one's CDR is
+# copied at a fixed stride into one buffer that a numpy structured dtype then
+# reads as columns, one native call and no Python objects per sample. Other
+# types are unpacked into records that are transposed into columns.
+
+_COLUMNS_FIXED = 'fixed'    # samples' CDR read through a structured dtype
+_COLUMNS_CDR = 'cdr'        # samples unpacked through their CDR, see cdr_compile
+_COLUMNS_DYNAMIC = 'dynamic'    # samples unpacked through DynamicData, for types cdr_compile does not cover
+
+def _column_layout(plan):
+    """How samples of plan's type are made into columns: (one of the above, dtype of the fixed ones)"""
+    if plan.columns is None:
+        try:
+            cdr_compile(plan)
+        except NotImplementedError:
+            plan.columns = _COLUMNS_DYNAMIC, None
+        else:
+            dtype = cdr_dtype(plan)
+            plan.columns = (_COLUMNS_CDR, None) if dtype is None else (_COLUMNS_FIXED, dtype)
+    return plan.columns
+
+def _fixed_columns(plan, dtype, samples):
+    """Columns of samples of a type whose CDR always has dtype's layout, or None if
+    the middleware did not serialize them as little endian CDR"""
+    # the encapsulation header, then the data, every sample aligned to 8 bytes
+    stride = 4 + dtype.itemsize + -(4 + dtype.itemsize) % 8
+    buf = ctypes.create_string_buffer(stride * len(samples))
+    base = ctypes.addressof(buf)
+    length = DDS_UnsignedLong()
+    for i, dd in enumerate(samples):
+        length.value = stride
+        dd.to_cdr_buffer(base + i * stride, ctypes.byref(length))
+    layout = numpy.dtype({'names': ['encapsulation', 'data'], 'formats': ['>u2', dtype], 'offsets': [0, 4], 'itemsize': stride})
+    records = numpy.frombuffer(buf, layout)
+    if (records['encapsulation'] != 1).any():
+        return None
+    return {name: records['data'][name].copy() for name in dtype.names}
+
+def _column(plan, values):
+    """numpy array of the values of one member, an object one where optional members are unset"""
+    if plan.kind in _cdr_formats and None not in values:
+        return numpy.array(values, 'S1' if plan.kind == TCKind.CHAR else _cdr_formats[plan.kind])
+    if plan.kind == TCKind.ARRAY and plan.element.kind in _cdr_formats and values:
+        return numpy.stack([numpy.asarray(value) for value in values])
+    # strings, sequences and structs, one object each
+    column = numpy.empty(len(values), object)
+    column[:] = values
+    return column
+
+def _decoded_columns(plan, records):
+    """Columns of the values of records, namedtuples of plan's struct"""
+    values = list(zip(*records)) if records else [()] * len(plan.members)
+    return {name: _column(member, column) for (name, cname, member), column in zip(plan.members, values)}
+
+def _arrow_array(pyarrow, plan, column):
+    if plan.kind == TCKind.STRING:
+        # one buffer of all the strings, delimited by offsets
+        encoded = [value.encode() for value in column]
+        offsets = numpy.zeros(len(encoded) + 1, numpy.int32)
+        numpy.cumsum(numpy.fromiter(map(len, encoded), numpy.int32, len(encoded)), out=offsets[1:])
+        return pyarrow.StringArray.from_buffers(len(encoded), pyarrow.py_buffer(offsets), pyarrow.py_buffer(b''.join(encoded)))
+    if column.dtype.names:
+        return pyarrow.StructArray.from_arrays([_arrow_array(pyarrow, member, column[name]) for name, cname, member in plan.members],
+                                               [name for name, cname, member in plan.members])
+    if column.ndim > 1:
+        flat = numpy.ascontiguousarray(column).reshape(-1)
+        return pyarrow.FixedSizeListArray.from_arrays(_arrow_array(pyarrow, plan.element, flat), column.shape[1])
+    if column.dtype == object:
+        return pyarrow.array(list(column))
+    return pyarrow.array(column)
+
+def _arrow_batch(plan, columns):
+    """pyarrow RecordBatch of the columns take_columnar made of samples of plan's type"""
+    import pyarrow
+    arrays = [_arrow_array(pyarrow, plan.member_plans[name][1], column) if name in plan.member_plans else pyarrow.array(column)
+              for name, column in columns.items()]
+    return pyarrow.RecordBatch.from_arrays(arrays, names=list(columns))
 
 _outside_refs = set()
 _refs = set()
 
+# initialized sequences each Reader keeps around for reuse
+_SEQ_POOL_SIZE = 4
+# initial size of the buffers a Reader created with cdr=True takes samples out with
+_CDR_BUFFER_BYTES = 64 * 1024
+
+
+def _seconds(t):
+    return t.sec + t.nanosec * 1e-9
+
+def _nanoseconds(t):
+    return t.sec * 1000000000 + t.nanosec
+
+def _handle_bytes(handle):
+    return bytes(handle.keyHash_value)
+
+def _sequence_number(sn):
+    return sn.high << 32 | sn.low
+
+# key in unpack_sampleInfo's dict, SampleInfo member and how it is converted
+_sample_info_fields = [
+    ('InstanceState', 'instance_state', DDS_InstanceStateKindEnum),
+    ('SampleState', 'sample_state', DDS_SampleStateKindEnum),
+    ('ViewState', 'view_state', DDS_ViewStateKindEnum),
+    ('ValidData', 'valid_data', bool),
+    ('SourceTimestamp', 'source_timestamp', _seconds),
+    ('ReceptionTimestamp', 'reception_timestamp', _seconds),
+    ('InstanceHandle', 'instance_handle', _handle_bytes),
+    ('PublicationHandle', 'publication_handle', _handle_bytes),
+    ('DisposedGenerationCount', 'disposed_generation_count', int),
+    ('NoWritersGenerationCount', 'no_writers_generation_count', int),
+    ('SampleRank', 'sample_rank', int),
+    ('GenerationRank', 'generation_rank', int),
+    ('AbsoluteGenerationRank', 'absolute_generation_rank', int),
+    ('PublicationSequenceNumber', 'publication_sequence_number', _sequence_number),
+    ('ReceptionSequenceNumber', 'reception_sequence_number', _sequence_number),
+]
 
 def unpack_sampleInfo(sampleInfo):
-    obj = {}
-    obj['InstanceState']=DDS_InstanceStateKindEnum(sampleInfo.contents.instance_state)
-    obj['SampleState']=DDS_SampleStateKindEnum(sampleInfo.contents.sample_state)
-    obj['ViewState']=DDS_ViewStateKindEnum(sampleInfo.contents.view_state)
-    return obj
+    """Timestamps are in seconds since the epoch, handles are their 16 key hash bytes"""
+    info = sampleInfo.contents
+    return {key: convert(getattr(info, member)) for key, member, convert in _sample_info_fields}
+
+class SampleInfoRecord(object):
+    """Compact sampleInfo of samples received with as_records, a copy of the native
+    struct whose fields are only converted when read. sampleInfo['Key'] and
+    sampleInfo.Key give what unpack_sampleInfo would, the snake_case member names
+    the same except for the states, which are left as ints."""
+    __slots__ = ('_info',)
+
+    def __init__(self, sampleInfo):
+        self._info = DDSType.SampleInfo()
+        ctypes.memmove(ctypes.byref(self._info), sampleInfo, ctypes.sizeof(DDSType.SampleInfo))
+
+    def __getitem__(self, key):
+        # so code written against the dicts keeps working
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __repr__(self):
+        return 'SampleInfoRecord(%s)' % ', '.join('%s=%r' % (key, getattr(self, key)) for key, member, convert in _sample_info_fields)
+
+def _sample_info_property(member, convert):
+    return property(lambda self: convert(getattr(self._info, member)))
+
+for _key, _member, _convert in _sample_info_fields:
+    setattr(SampleInfoRecord, _key, _sample_info_property(_member, _convert))
+    setattr(SampleInfoRecord, _member, _sample_info_property(_member, int if _member.endswith('_state') else _convert))
+del _key, _member, _convert
+
+# what read/take return for each sample with as_records
+Sample = collections.namedtuple('Sample', ('sampleInfo', 'sampleData'))
+
+# messages with a top level collection at least this long are written off the event loop
+_ASYNC_WRITE_INLINE_LENGTH = 64 * 1024
+
+def _is_large(msg):
+    for value in msg.values():
+        if isinstance(value, (bytes, bytearray, memoryview, list)) or (numpy is not None and isinstance(value, numpy.ndarray)):
+            if len(value) >= _ASYNC_WRITE_INLINE_LENGTH:
+                return True
+    return False
+
+def time_t(timestamp):
+    """Time_t of seconds since the epoch, or of a (sec, nanosec) pair"""
+    if isinstance(timestamp, tuple):
+        return DDSType.Time_t(*timestamp)
+    sec = int(timestamp // 1)
+    return DDSType.Time_t(sec, int((timestamp - sec) * 1e9))
+
+def string_seq(strings):
+    """StringSeq holding a copy of str() of each of strings, to be finalized with StringSeq_finalize"""
+    seq = DDSType.StringSeq()
+    DDSFunc.StringSeq_initialize(seq)
+    array = (ctypes.c_char_p * len(strings))(*[bytes(str(s), 'ascii') for s in strings])
+    try:
+        DDSFunc.StringSeq_from_array(seq, array, len(strings))
+    except:
+        DDSFunc.StringSeq_finalize(seq)
+        raise
+    return seq
+
+# content filters and query conditions are named after the topic and this
+_filter_ids = itertools.count()
+
+# Instrumentation
+
+_clock = time.perf_counter
+
+class Metrics(object):
+    """Counters of a Writer or Reader created with metrics=True, entities created
+    without them skip every update"""
+    def __init__(self, names):
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(names, 0)
+
+    def add(self, **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                self._counters[name] += amount
+
+    def maximum(self, name, value):
+        with self._lock:
+            if value > self._counters[name]:
+                self._counters[name] = value
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counters)
+
+def _stored_size(dd):
+    info = DDSType.DynamicDataInfo()
+    DDSFunc.DynamicData_get_info(dd, ctypes.byref(info))
+    return info.stored_size
+
+def _measured_native(func, metrics, counter):
+    """func, a native call on a DynamicData, adding its time to native_seconds and,
+    once it succeeded, one to 'counter' and for samples their size to bytes"""
+    def measured(entity, data, *args):
+        started = _clock()
+        result = func(entity, data, *args)
+        elapsed = _clock() - started
+        if counter == 'samples':
+            metrics.add(native_seconds=elapsed, samples=1, bytes=_stored_size(data))
+        elif counter is not None:
+            metrics.add(**{'native_seconds': elapsed, counter: 1})
+        else:
+            metrics.add(native_seconds=elapsed)
+        return result
+    return measured
+
+_writer_metrics = ('samples', 'bytes', 'disposes', 'unregisters', 'marshal_seconds', 'native_seconds',
+                   'batches', 'batch_samples', 'max_batch')
+_reader_metrics = ('takes', 'empty_takes', 'samples', 'invalid_samples', 'bytes', 'unpack_seconds', 'native_seconds',
+                   'callbacks', 'callback_seconds', 'max_callback_seconds')
+# metrics() values that are not running totals, the _change of DataWriterProtocolStatus counters
+# being what they grew by since the status was last read, so never exported as counters
+_gauge_metrics = frozenset(['max_batch', 'mean_batch_size', 'empty_take_ratio', 'max_callback_seconds',
+                            'send_window_size', 'sample_lost_last_reason', 'sample_rejected_last_reason'] +
+                           [name + '_change' for name in _protocol_status_counters])
+
+def _prometheus_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def prometheus_text(*entities):
+    """Prometheus text exposition of the metrics() of Writers and Readers"""
+    series = collections.OrderedDict()
+    for entity in entities:
+        kind = 'writer' if isinstance(entity, Writer) else 'reader'
+        name = entity.name if isinstance(entity.name, str) else pstring(entity.name)
+        for key, value in sorted(entity.metrics().items()):
+            metric = 'dds_%s_%s' % (kind, key) if key in _gauge_metrics else 'dds_%s_%s_total' % (kind, key)
+            series.setdefault((metric, key in _gauge_metrics), []).append('%s{name="%s"} %r' % (metric, _prometheus_label(name), value))
+    lines = []
+    for (metric, gauge), samples in series.items():
+        lines.append('# TYPE %s %s' % (metric, 'gauge' if gauge else 'counter'))
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+# DynamicData each Writer keeps for concurrent writes
+_DATA_POOL_SIZE = 4
 
 class Writer(object):
-    def __init__(self, dds, name):
+    def __init__(self, dds, name, instance_cache_size = 0, metrics = False, cdr = False):
         self._dds = weakref.ref(dds)
         self.name = name
         self._writer = dds._participant.lookup_datawriter_by_name(cstring(name))
         self._dyn_narrowed_writer = DDSFunc.DynamicDataWriter_narrow(self._writer)
-        self._dynamicData = self._dyn_narrowed_writer.create_data_w_property(get('DYNAMIC_DATA_PROPERTY_DEFAULT', DDSType.DynamicDataProperty_t))
+        # one DynamicData per write in progress, writes may come from executor threads
+        self._data_pool = [self._create_data()]
+        self._plan = compile_plan(self._data_pool[0].get_type())
+        # samples are serialized in Python and set with one from_cdr_buffer call, see cdr_compile
+        self._cdr = cdr
+        if cdr:
+            cdr_compile(self._plan)
+        # LRU of key tuple: InstanceHandle_t, so the middleware doesn't hash the key of every write
+        self._instance_cache_size = instance_cache_size if self._plan.key_names else 0
+        self._instances = collections.OrderedDict()
+        self._instances_lock = threading.Lock()
+        self._metrics = None
+        self._write = DDSFunc.DynamicDataWriter_write
+        self._write_w_timestamp = DDSFunc.DynamicDataWriter_write_w_timestamp
+        self._dispose = DDSFunc.DynamicDataWriter_dispose
+        self._unregister_instance = DDSFunc.DynamicDataWriter_unregister_instance
+        self._register_instance = DDSFunc.DynamicDataWriter_register_instance
+        if metrics:
+            self._metrics = Metrics(_writer_metrics)
+            for attr, counter in [('_write', 'samples'), ('_write_w_timestamp', 'samples'), ('_dispose', 'disposes'),
+                                  ('_unregister_instance', 'unregisters'), ('_register_instance', None)]:
+                setattr(self, attr, _measured_native(getattr(self, attr), self._metrics, counter))
 
     def __del__(self):
-        # TODO: what about this?
-        #self._dyn_narrowed_writer.delete_data(self._dynamicData)
-        pass
+        self.close()
+
+    def close(self):
+        """Deletes the DynamicData kept for writing, the Writer is not to be used afterwards"""
+        if getattr(self, '_data_pool', None) is None:
+            return
+        dds = self._dds()
+        # otherwise the participant deleted everything the writer owned
+        if dds is not None and dds._participant is not None:
+            for data in self._data_pool:
+                DDSFunc.DynamicDataWriter_delete_data(self._dyn_narrowed_writer, data)
+        self._data_pool = None
+
+    def _create_data(self):
+        return self._dyn_narrowed_writer.create_data_w_property(get('DYNAMIC_DATA_PROPERTY_DEFAULT', DDSType.DynamicDataProperty_t))
+
+    def _acquire_data(self):
+        try:
+            return self._data_pool.pop()
+        except IndexError:
+            return self._create_data()
+
+    def _release_data(self, data):
+        if self._data_pool is None:
+            # closed while writing, data went with the writer
+            return
+        if len(self._data_pool) < _DATA_POOL_SIZE:
+            self._data_pool.append(data)
+        else:
+            DDSFunc.DynamicDataWriter_delete_data(self._dyn_narrowed_writer, data)
+
+    def _prepare(self, msg, data, encoded = None):
+        """Fills data with msg, or with its CDR when already 'encoded'"""
+        if self._metrics is not None:
+            started = _clock()
+        if self._cdr or encoded is not None:
+            if encoded is None:
+                encoded = cdr_encode(self._plan, msg)
+            if isinstance(encoded, bytes):
+                buf = encoded
+            else:
+                # a pointer into the bytearray or writable buffer, not a copy of it
+                buf = (ctypes.c_char * len(encoded)).from_buffer(encoded)
+            data.from_cdr_buffer(buf, len(encoded))
+        else:
+            if not self._plan.overwrites(msg):
+                data.clear_all_members()
+            self._plan.write(msg, data)
+        if self._metrics is not None:
+            self._metrics.add(marshal_seconds=_clock() - started)
+
+    def metrics(self):
+        """The counters kept when created with metrics=True (times in seconds, bytes as stored
+        in DynamicData) along with the middleware's cumulative DataWriterProtocolStatus counters"""
+        result = {}
+        if self._metrics is not None:
+            result = self._metrics.snapshot()
+            result['mean_batch_size'] = result['batch_samples'] / result['batches'] if result['batches'] else 0
+        status = DDSType.DataWriterProtocolStatus()
+        self._writer.get_datawriter_protocol_status(ctypes.byref(status))
+        for name in _protocol_status_counters:
+            result[name] = getattr(status, name)
+        result['send_window_size'] = status.send_window_size
+        return result
+
+    def _key(self, msg):
+        try:
+            key = tuple(msg[name] for name in self._plan.key_names)
+            hash(key)
+        except (KeyError, TypeError):
+            # incomplete or unhashable keys are left for the middleware to sort out
+            return None
+        return key
+
+    def register_instance(self, key):
+        """Registers the instance identified by the key members of 'key' (other members are
+        ignored) and returns its handle, cached when the writer has an instance cache"""
+        data = self._acquire_data()
+        try:
+            self._prepare(key, data)
+            handle = self._register_instance(self._dyn_narrowed_writer, data)
+        finally:
+            self._release_data(data)
+        if not handle.isValid:
+            raise Error('could not register instance')
+        if self._instance_cache_size:
+            self._cache_handle(self._key(key), handle)
+        return handle
+
+    def _cache_handle(self, key, handle):
+        if key is None:
+            return
+        with self._instances_lock:
+            self._instances[key] = handle
+            if len(self._instances) > self._instance_cache_size:
+                self._instances.popitem(last=False)
+
+    def _handle(self, msg, handle):
+        """Handle to write msg with: the one given, the cached one or DDS_HANDLE_NIL"""
+        if handle is not None:
+            return handle
+        if not self._instance_cache_size:
+            return DDS_HANDLE_NIL
+        key = self._key(msg)
+        if key is None:
+            return DDS_HANDLE_NIL
+        with self._instances_lock:
+            handle = self._instances.get(key)
+            if handle is not None:
+                self._instances.move_to_end(key)
+                return handle
+        return self.register_instance(dict(zip(self._plan.key_names, key)))
     
-    def write(self, msg):
-        self._dynamicData.clear_all_members()
-        write_into_dd(msg, self._dynamicData)
-        self._dyn_narrowed_writer.write(self._dynamicData, DDS_HANDLE_NIL)
-
-    def dispose(self, msg):
-        write_into_dd(msg, self._dynamicData)
-        self._dyn_narrowed_writer.dispose(self._dynamicData, DDS_HANDLE_NIL)
+    def write(self, msg, handle = None):
+        data = self._acquire_data()
+        try:
+            self._prepare(msg, data)
+            self._write(self._dyn_narrowed_writer, data, self._handle(msg, handle))
+        finally:
+            self._release_data(data)
 
-    def unregister(self, msg):
-        write_into_dd(msg, self._dynamicData)
-        self._dyn_narrowed_writer.unregister_instance(self._dynamicData, DDS_HANDLE_NIL)
+    def write_w_timestamp(self, msg, timestamp, handle = None):
+        """write with 'timestamp' (seconds since the epoch or (sec, nanosec)) as the source timestamp"""
+        data = self._acquire_data()
+        try:
+            self._prepare(msg, data)
+            self._write_w_timestamp(self._dyn_narrowed_writer, data, self._handle(msg, handle), time_t(timestamp))
+        finally:
+            self._release_data(data)
+
+    def write_many(self, msgs, timestamps = None):
+        """Writes every message of an iterable through the same DynamicData, with
+        source timestamps taken from the 'timestamps' iterable if given.
+        A writer created with cdr=True also takes a numpy structured array, whose
+        items are all packed at once (see cdr_encode_array).
+        Returns how many messages were written."""
+        if self._cdr and numpy is not None and isinstance(msgs, numpy.ndarray):
+            items = zip(msgs, cdr_encode_array(self._plan, msgs))
+        else:
+            items = ((msg, None) for msg in msgs)
+        return self._write_items(items, timestamps)
+
+    def write_encoded(self, buffers, timestamps = None):
+        """write_many of samples already serialized to CDR, encapsulation header included (e.g. by
+        Reader.take_encoded), each set with one from_cdr_buffer call. Buffers other than bytes
+        must be writable, they are pointed to rather than copied."""
+        return self._write_items(((None, buf) for buf in buffers), timestamps)
+
+    def _write_items(self, items, timestamps):
+        """Writes (message, its CDR or None) pairs, see write_many"""
+        write = self._write
+        write_w_timestamp = self._write_w_timestamp
+        writer = self._dyn_narrowed_writer
+        count = 0
+        data = self._acquire_data()
+        try:
+            if timestamps is None:
+                for msg, encoded in items:
+                    self._prepare(msg, data, encoded)
+                    write(writer, data, self._handle(msg, None))
+                    count += 1
+            else:
+                for (msg, encoded), timestamp in zip(items, timestamps):
+                    self._prepare(msg, data, encoded)
+                    write_w_timestamp(writer, data, self._handle(msg, None), time_t(timestamp))
+                    count += 1
+        finally:
+            self._release_data(data)
+            if self._metrics is not None:
+                self._metrics.add(batches=1, batch_samples=count)
+                self._metrics.maximum('max_batch', count)
+        return count
+
+    def dispose(self, msg, handle = None):
+        data = self._acquire_data()
+        try:
+            self._prepare(msg, data)
+            self._dispose(self._dyn_narrowed_writer, data, self._handle(msg, handle))
+        finally:
+            self._release_data(data)
+
+    def unregister(self, msg, handle = None):
+        if handle is None and self._instance_cache_size:
+            # the handle is no good once the instance is unregistered
+            key = self._key(msg)
+            with self._instances_lock:
+                handle = self._instances.pop(key, None)
+        data = self._acquire_data()
+        try:
+            self._prepare(msg, data)
+            self._unregister_instance(self._dyn_narrowed_writer, data, DDS_HANDLE_NIL if handle is None else handle)
+        finally:
+            self._release_data(data)
+
+    async def write_async(self, msg, executor = None):
+        """write for asyncio, messages carrying large collections are written from 'executor'
+        (the loop's default one if None) so that marshalling them doesn't stall the loop"""
+        if _is_large(msg):
+            # imported here, asyncio takes longer to import than the rest of dds
+            import asyncio
+            await asyncio.get_running_loop().run_in_executor(executor, self.write, msg)
+        else:
+            self.write(msg)
+
+class Dispatcher(object):
+    """Runs Reader data available callbacks on its own threads.
+
+    Without one, callbacks run on the middleware's receive thread and a slow
+    one delays every other reader of the participant. With one, the listener
+    only queues a notification and 'threads' workers run the callbacks.
+    Past 'max_queued' pending notifications, 'overflow' decides between
+    'drop_oldest', 'drop_newest' and 'block' (holding up the receive thread).
+    """
+    OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+    def __init__(self, threads = 1, max_queued = 1024, overflow = 'drop_oldest'):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError('overflow must be one of %r' % (self.OVERFLOW_POLICIES,))
+        self.max_queued = max_queued
+        self.overflow = overflow
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._metrics = {}
+        self._closed = False
+        self._threads = [threading.Thread(target=self._work, name='dds-dispatcher-%d' % i) for i in range(threads)]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def metrics(self):
+        """Per reader name: notifications 'queued' now and at most ('max_queued'), 'dispatched' and 'dropped'"""
+        with self._cond:
+            return {name: dict(metrics) for name, metrics in self._metrics.items()}
+
+    def submit(self, reader):
+        """Queues running reader's callbacks, called from the listener"""
+        with self._cond:
+            metrics = self._metrics.get(reader.name)
+            if metrics is None:
+                metrics = self._metrics[reader.name] = dict(queued=0, max_queued=0, dispatched=0, dropped=0)
+            while len(self._queue) >= self.max_queued and not self._closed:
+                if self.overflow == 'block':
+                    self._cond.wait()
+                elif self.overflow == 'drop_newest':
+                    metrics['dropped'] += 1
+                    return
+                else:
+                    dropped = self._metrics[self._queue.popleft().name]
+                    dropped['queued'] -= 1
+                    dropped['dropped'] += 1
+            self._queue.append(reader)
+            metrics['queued'] += 1
+            metrics['max_queued'] = max(metrics['max_queued'], metrics['queued'])
+            self._cond.notify_all()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                reader = self._queue.popleft()
+                metrics = self._metrics[reader.name]
+                metrics['queued'] -= 1
+                # room for a blocked submit
+                self._cond.notify_all()
+            try:
+                reader._run_callbacks()
+            except Exception:
+                traceback.print_exc()
+            with self._cond:
+                metrics['dispatched'] += 1
+
+    def close(self):
+        """Runs what is already queued and stops the worker threads"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
 
 class Reader(object):
-    def __init__(self, dds, name):
+    def __init__(self, dds, name, dispatcher = None, metrics = False, cdr = False, filtered = None):
     
         self._dds = weakref.ref(dds)
         self.name = name
-        self._reader = dds._participant.lookup_datareader_by_name(cstring(name))
+        # (query, sample mask, view mask, instance mask): [QueryCondition, its parameters]
+        self._queries = {}
+        # (DataReader, ContentFilteredTopic) made by DDS.create_filtered_reader, deleted along with this Reader
+        self._filtered = filtered
+        if filtered is None:
+            self._reader = dds._participant.lookup_datareader_by_name(cstring(name))
+        else:
+            self._reader = filtered[0]
         self._dyn_narrowed_reader = DDSFunc.DynamicDataReader_narrow(self._reader)
         self._callbacks = {}
+        self._listener = None
+        self._dispatcher = dispatcher
+        # compiled from the first sample received, the reader's type never changes
+        self._plan = None
+        # initialized (data_seq, info_seq) pairs ready for the next read/take
+        self._seq_pool = []
+        self._metrics = Metrics(_reader_metrics) if metrics else None
+        # samples are taken out with one to_cdr_buffer call into one of these buffers, see cdr_compile
+        self._cdr = cdr
+        self._cdr_buffers = []
     
     def __del__(self):
-        pass
+        self.close()
+
+    def close(self):
+        """Removes the callbacks and deletes the query conditions, sequences and filtered reader made
+        for this Reader, which is not to be used afterwards"""
+        if getattr(self, '_seq_pool', None) is None:
+            return
+        dds = self._dds()
+        if dds is None or dds._participant is None:
+            # the participant deleted everything the reader owned
+            _outside_refs.discard(self)
+        else:
+            if self._listener is not None:
+                self._disable_listener()
+            for condition, parameters in self._queries.values():
+                self._reader.delete_readcondition(ctypes.cast(condition, ctypes.POINTER(DDSType.ReadCondition)))
+            for data_seq, info_seq in self._seq_pool:
+                DDSFunc.DynamicDataSeq_finalize(data_seq)
+                DDSFunc.SampleInfoSeq_finalize(info_seq)
+            if self._filtered is not None:
+                reader, filtered_topic = self._filtered
+                reader.get_subscriber().delete_datareader(reader)
+                dds._participant.delete_contentfilteredtopic(filtered_topic)
+        self._callbacks.clear()
+        self._listener = None
+        self._queries.clear()
+        self._seq_pool = None
+
+    def set_filter_parameters(self, parameters):
+        """Replaces the parameters of the filter of a reader made by DDS.create_filtered_reader"""
+        if self._filtered is None:
+            raise Error('not a filtered reader')
+        seq = string_seq(parameters)
+        try:
+            self._filtered[1].set_expression_parameters(seq)
+        finally:
+            DDSFunc.StringSeq_finalize(seq)
+
+    def _query_condition(self, query, parameters, instanceState, sampleState, viewState):
+        """The ReadCondition of a QueryCondition selecting the samples matching query, made once per query and states"""
+        key = (query, state_mask(sampleState), state_mask(viewState), state_mask(instanceState))
+        parameters = tuple(str(p) for p in parameters)
+        entry = self._queries.get(key)
+        if entry is None or entry[1] != parameters:
+            seq = string_seq(parameters)
+            try:
+                if entry is None:
+                    condition = self._reader.create_querycondition(key[1], key[2], key[3], cstring(query), seq)
+                    entry = self._queries[key] = [condition, parameters]
+                else:
+                    entry[0].set_query_parameters(seq)
+                    entry[1] = parameters
+            finally:
+                DDSFunc.StringSeq_finalize(seq)
+        return ctypes.cast(entry[0], ctypes.POINTER(DDSType.ReadCondition))
 
     def _enable_listener(self):
         assert self._listener is None
@@ -614,10 +2228,10 @@ class Reader(object):
         _outside_refs.remove(self)
     
     def add_data_available_callback(self, cb):
-        '''Warning: callback is called back in another thread!'''
+        '''Warning: callback is called back in another thread! (the middleware's, or the reader's Dispatcher's)'''
         if not self._callbacks:
             self._enable_listener()
-        ref = max(self._callbacks) if self._callbacks else 0
+        ref = max(self._callbacks) + 1 if self._callbacks else 0
         self._callbacks[ref] = cb
         return ref
     
@@ -627,65 +2241,1007 @@ class Reader(object):
             self._disable_listener()
     
     def _data_available_callback(self, listener_data, datareader):
-        for cb in self._callbacks.values():
+        if self._dispatcher is not None:
+            self._dispatcher.submit(self)
+        else:
+            self._run_callbacks()
+
+    def _run_callbacks(self):
+        if self._metrics is not None:
+            started = _clock()
+        # copied, callbacks may be added or removed from other threads meanwhile
+        for cb in list(self._callbacks.values()):
             cb()
-
-    def read(self, instanceState = DDS_InstanceStateKindEnum.DDS_ANY_INSTANCE_STATE):
-        return self._receive(instanceState, False)
-
-    def take(self, instanceState = DDS_InstanceStateKindEnum.DDS_ANY_INSTANCE_STATE):
-        return self._receive(instanceState, True)
-
-    def _receive(self, instanceState : DDS_InstanceStateKindEnum, take = True):
-        """'takeFlag' controls whether read samples stay in the DDS cache (i.e. use DDS Read API) or removed (i.e. use DDS Take API) """
-        data_seq = DDSType.DynamicDataSeq()
-        DDSFunc.DynamicDataSeq_initialize(data_seq)
-        info_seq = DDSType.SampleInfoSeq()
-        DDSFunc.SampleInfoSeq_initialize(info_seq)
+        if self._metrics is not None:
+            elapsed = _clock() - started
+            self._metrics.add(callbacks=1, callback_seconds=elapsed)
+            self._metrics.maximum('max_callback_seconds', elapsed)
+
+    def metrics(self):
+        """The counters kept when created with metrics=True (times in seconds, bytes as stored
+        in DynamicData, callbacks counts data available notifications) along with the
+        middleware's SampleLost and SampleRejected statuses"""
+        result = {}
+        if self._metrics is not None:
+            result = self._metrics.snapshot()
+            result['empty_take_ratio'] = result['empty_takes'] / result['takes'] if result['takes'] else 0
+        lost = DDSType.SampleLostStatus()
+        self._reader.get_sample_lost_status(ctypes.byref(lost))
+        rejected = DDSType.SampleRejectedStatus()
+        self._reader.get_sample_rejected_status(ctypes.byref(rejected))
+        result['sample_lost'] = lost.total_count
+        result['sample_lost_last_reason'] = lost.last_reason
+        result['sample_rejected'] = rejected.total_count
+        result['sample_rejected_last_reason'] = rejected.last_reason
+        return result
+
+    def read(self, instanceState = DDS_InstanceStateKindEnum.DDS_ANY_INSTANCE_STATE, as_numpy = False, max_samples = DDS_LENGTH_UNLIMITED,
+             sampleState = DDS_SampleStateKindEnum.DDS_ANY_SAMPLE_STATE, viewState = DDS_ViewStateKindEnum.DDS_ANY_VIEW_STATE, as_records = False,
+             query = None, query_parameters = ()):
+        """See _receive. A 'query' is an SQL expression on the data members, e.g. "count > %0", whose %0, %1...
+        are replaced by 'query_parameters' (strings quoted, e.g. "'node7'"). The middleware evaluates it, samples not
+        matching it are neither returned nor unpacked and stay in the DDS cache."""
+        condition = None if query is None else self._query_condition(query, query_parameters, instanceState, sampleState, viewState)
+        return self._receive(instanceState, False, as_numpy, max_samples, sampleState, viewState, as_records, condition)
+
+    def take(self, instanceState = DDS_InstanceStateKindEnum.DDS_ANY_INSTANCE_STATE, as_numpy = False, max_samples = DDS_LENGTH_UNLIMITED,
+             sampleState = DDS_SampleStateKindEnum.DDS_ANY_SAMPLE_STATE, viewState = DDS_ViewStateKindEnum.DDS_ANY_VIEW_STATE, as_records = False,
+             query = None, query_parameters = ()):
+        """See read"""
+        condition = None if query is None else self._query_condition(query, query_parameters, instanceState, sampleState, viewState)
+        return self._receive(instanceState, True, as_numpy, max_samples, sampleState, viewState, as_records, condition)
+
+    def take_columnar(self, instanceState = DDS_InstanceStateKindEnum.DDS_ANY_INSTANCE_STATE, max_samples = DDS_LENGTH_UNLIMITED,
+                      sampleState = DDS_SampleStateKindEnum.DDS_ANY_SAMPLE_STATE, viewState = DDS_ViewStateKindEnum.DDS_ANY_VIEW_STATE,
+                      sample_info = False, as_arrow = False):
+        """Takes samples as {member name: numpy array} with one item per sample with valid data,
+        rather than one dict per sample. Basic members are typed columns, arrays of them 2-d,
+        strings, sequences and structs object columns (structs of a fixed size structured
+        columns). With sample_info the SourceTimestamp and ReceptionTimestamp columns are added.
+        With as_arrow a pyarrow RecordBatch, whose strings are laid out as offsets and one buffer.
+        Only types whose samples all have the same size (see cdr_dtype) skip unpacking samples one
+        by one, those with strings or sequences are unpacked into records first, barely faster than take."""
+        if numpy is None:
+            raise ImportError('take_columnar requires numpy')
+        seqs = self._acquire_seqs()
+        loaned = self._loan(seqs, instanceState, True, max_samples, sampleState, viewState)
+        data_seq, info_seq = seqs
+        samples, infos = [], []
+        if self._metrics is not None:
+            started = _clock()
         try:
-            if take:
-                self._dyn_narrowed_reader.take(ctypes.byref(data_seq), ctypes.byref(info_seq), DDS_LENGTH_UNLIMITED, get('ANY_SAMPLE_STATE', DDS_SampleStateMask), get('ANY_VIEW_STATE', DDS_ViewStateMask), instanceState.value)
-            else:
-                self._dyn_narrowed_reader.read(ctypes.byref(data_seq), ctypes.byref(info_seq), DDS_LENGTH_UNLIMITED, get('ANY_SAMPLE_STATE', DDS_SampleStateMask), get('ANY_VIEW_STATE', DDS_ViewStateMask), instanceState.value)
+            for i in range(data_seq.get_length() if loaned else 0):
+                info = info_seq.get_reference(i)
+                if info.contents.valid_data:
+                    samples.append(data_seq.get_reference(i))
+                    infos.append(info.contents)
+            plan = self._plan_of(samples[0]) if samples else self._plan
+            if plan is None:
+                # nothing was ever received, the type is not known yet
+                return _arrow_batch(None, {}) if as_arrow else {}
+            kind, dtype = _column_layout(plan)
+            if kind == _COLUMNS_FIXED:
+                columns = _fixed_columns(plan, dtype, samples)
+                if columns is None:
+                    kind = _COLUMNS_DYNAMIC
+            if kind == _COLUMNS_DYNAMIC:
+                columns = _decoded_columns(plan, [plan.unpack(dd, UNPACK_RECORDS | UNPACK_NUMPY) for dd in samples])
+            elif kind == _COLUMNS_CDR:
+                try:
+                    buf = self._cdr_buffers.pop()
+                except IndexError:
+                    buf = ctypes.create_string_buffer(_CDR_BUFFER_BYTES)
+                records = []
+                for dd in samples:
+                    record, buf = self._unpack_cdr(dd, UNPACK_RECORDS | UNPACK_NUMPY, buf)
+                    records.append(record)
+                self._cdr_buffers.append(buf)
+                columns = _decoded_columns(plan, records)
+            if sample_info:
+                columns['SourceTimestamp'] = numpy.array([_seconds(info.source_timestamp) for info in infos])
+                columns['ReceptionTimestamp'] = numpy.array([_seconds(info.reception_timestamp) for info in infos])
+            return _arrow_batch(plan, columns) if as_arrow else columns
+        finally:
+            if loaned:
+                if self._metrics is not None:
+                    self._measure_loan(seqs, _clock() - started)
+                self._dyn_narrowed_reader.return_loan(ctypes.byref(data_seq), ctypes.byref(info_seq))
+            self._release_seqs(seqs)
+
+    def take_encoded(self, instanceState = DDS_InstanceStateKindEnum.DDS_ANY_INSTANCE_STATE, max_samples = DDS_LENGTH_UNLIMITED,
+                     sampleState = DDS_SampleStateKindEnum.DDS_ANY_SAMPLE_STATE, viewState = DDS_ViewStateKindEnum.DDS_ANY_VIEW_STATE,
+                     as_records = False):
+        """take, with each sampleData left as the CDR bytes the middleware serializes it to, encapsulation
+        header included, for Writer.write_encoded or cdr_decode. The type needs no support from cdr_compile."""
+        return self._receive(instanceState, True, False, max_samples, sampleState, viewState, as_records, encoded = True)
+
+    def read_next_sample(self, instanceState = DDS_InstanceStateKindEnum.DDS_ANY_INSTANCE_STATE, as_numpy = False,
+                         sampleState = DDS_SampleStateKindEnum.DDS_NOT_READ_SAMPLE_STATE, viewState = DDS_ViewStateKindEnum.DDS_ANY_VIEW_STATE,
+                         as_records = False):
+        """The next not yet read sample, or None"""
+        samples = self._receive(instanceState, False, as_numpy, 1, sampleState, viewState, as_records)
+        return samples[0] if samples else None
+
+    def take_next_sample(self, instanceState = DDS_InstanceStateKindEnum.DDS_ANY_INSTANCE_STATE, as_numpy = False,
+                         sampleState = DDS_SampleStateKindEnum.DDS_ANY_SAMPLE_STATE, viewState = DDS_ViewStateKindEnum.DDS_ANY_VIEW_STATE,
+                         as_records = False):
+        """The next sample, or None"""
+        samples = self._receive(instanceState, True, as_numpy, 1, sampleState, viewState, as_records)
+        return samples[0] if samples else None
+
+    def stream(self, batch_size = 64, timeout = None, instanceState = DDS_InstanceStateKindEnum.DDS_ANY_INSTANCE_STATE, as_numpy = False,
+               as_records = False):
+        """Generator taking at most batch_size samples at a time and yielding them one by one.
+        Between batches it sleeps until the reader's listener reports new data, and it returns
+        once none arrived for 'timeout' seconds (None waits forever)."""
+        available = threading.Event()
+        ref = self.add_data_available_callback(available.set)
+        try:
+            while True:
+                # cleared before taking so data arriving after the take still wakes us
+                available.clear()
+                samples = self.take(instanceState, as_numpy, batch_size, as_records = as_records)
+                if samples:
+                    for sample in samples:
+                        yield sample
+                elif not available.wait(timeout):
+                    return
+        finally:
+            self.remove_data_available_callback(ref)
+
+    async def take_async(self, instanceState = DDS_InstanceStateKindEnum.DDS_ANY_INSTANCE_STATE, as_numpy = False, max_samples = DDS_LENGTH_UNLIMITED,
+                         as_records = False):
+        """take for asyncio, waits without blocking the event loop until there are samples"""
+        with _AsyncAvailable(self) as available:
+            while True:
+                available.clear()
+                samples = self.take(instanceState, as_numpy, max_samples, as_records = as_records)
+                if samples:
+                    return samples
+                await available.wait()
+
+    async def stream_async(self, batch_size = 64, instanceState = DDS_InstanceStateKindEnum.DDS_ANY_INSTANCE_STATE, as_numpy = False,
+                           as_records = False):
+        """stream for asyncio, yields samples for ever without blocking the event loop"""
+        with _AsyncAvailable(self) as available:
+            while True:
+                available.clear()
+                samples = self.take(instanceState, as_numpy, batch_size, as_records = as_records)
+                if samples:
+                    for sample in samples:
+                        yield sample
+                else:
+                    await available.wait()
+
+    def __aiter__(self):
+        return self.stream_async()
+
+    def read_loaned(self, instanceState = DDS_InstanceStateKindEnum.DDS_ANY_INSTANCE_STATE, as_numpy = False, max_samples = DDS_LENGTH_UNLIMITED,
+                    sampleState = DDS_SampleStateKindEnum.DDS_ANY_SAMPLE_STATE, viewState = DDS_ViewStateKindEnum.DDS_ANY_VIEW_STATE):
+        """Like read but as a context manager over the loaned samples, see Loan"""
+        return Loan(self, instanceState, False, as_numpy, max_samples, sampleState, viewState)
+
+    def take_loaned(self, instanceState = DDS_InstanceStateKindEnum.DDS_ANY_INSTANCE_STATE, as_numpy = False, max_samples = DDS_LENGTH_UNLIMITED,
+                    sampleState = DDS_SampleStateKindEnum.DDS_ANY_SAMPLE_STATE, viewState = DDS_ViewStateKindEnum.DDS_ANY_VIEW_STATE):
+        """Like take but as a context manager over the loaned samples, see Loan"""
+        return Loan(self, instanceState, True, as_numpy, max_samples, sampleState, viewState)
+
+    def _plan_of(self, dd):
+        if self._plan is None:
+            self._plan = compile_plan(dd.get_type())
+        return self._plan
+
+    def _to_cdr(self, dd, buf):
+        """dd's CDR, copied into buf or into a larger buffer that is returned with a view of it"""
+        length = DDS_UnsignedLong(len(buf))
+        try:
+            dd.to_cdr_buffer(buf, ctypes.byref(length))
+        except Error:
+            # too small, a null buffer gives the length needed
+            dd.to_cdr_buffer(None, ctypes.byref(length))
+            buf = ctypes.create_string_buffer(length.value)
+            dd.to_cdr_buffer(buf, ctypes.byref(length))
+        return memoryview(buf).cast('B')[:length.value], buf
+
+    def _unpack_cdr(self, dd, flags, buf):
+        """Unpacks dd through its CDR, see _to_cdr"""
+        view, buf = self._to_cdr(dd, buf)
+        return cdr_decode(self._plan_of(dd), view, flags), buf
+
+    def _acquire_seqs(self):
+        try:
+            return self._seq_pool.pop()
+        except IndexError:
+            data_seq = DDSType.DynamicDataSeq()
+            DDSFunc.DynamicDataSeq_initialize(data_seq)
+            info_seq = DDSType.SampleInfoSeq()
+            DDSFunc.SampleInfoSeq_initialize(info_seq)
+            return data_seq, info_seq
+
+    def _release_seqs(self, seqs):
+        if self._seq_pool is not None and len(self._seq_pool) < _SEQ_POOL_SIZE:
+            self._seq_pool.append(seqs)
+
+    def _loan(self, seqs, instanceState, take, max_samples, sampleState, viewState, condition = None):
+        """Fills the sequences with samples on loan, returns False if there were none
+        With a ReadCondition, which holds the states, only samples matching it are loaned"""
+        data_seq, info_seq = seqs
+        if condition is None:
+            f = self._dyn_narrowed_reader.take if take else self._dyn_narrowed_reader.read
+            selection = (state_mask(sampleState), state_mask(viewState), state_mask(instanceState))
+        else:
+            f = self._dyn_narrowed_reader.take_w_condition if take else self._dyn_narrowed_reader.read_w_condition
+            selection = (condition,)
+        if self._metrics is not None:
+            started = _clock()
+        try:
+            f(ctypes.byref(data_seq), ctypes.byref(info_seq), max_samples, *selection)
         except Error as e:
             if str(e) == 'no data':
-                return []
+                if self._metrics is not None:
+                    self._metrics.add(takes=1, empty_takes=1, native_seconds=_clock() - started)
+                return False
             else:
                 raise e
+        if self._metrics is not None:
+            self._metrics.add(takes=1, native_seconds=_clock() - started)
+        return True
+
+    def _measure_loan(self, seqs, unpack_seconds):
+        """Adds the samples on loan in seqs, once they have been unpacked, to the metrics"""
+        data_seq, info_seq = seqs
+        length = data_seq.get_length()
+        size = invalid = 0
+        for i in range(length):
+            if info_seq.get_reference(i).contents.valid_data:
+                size += _stored_size(data_seq.get_reference(i))
+            else:
+                invalid += 1
+        self._metrics.add(samples=length, invalid_samples=invalid, bytes=size, unpack_seconds=unpack_seconds)
+
+    def _receive(self, instanceState : DDS_InstanceStateKindEnum, take = True, as_numpy = False, max_samples = DDS_LENGTH_UNLIMITED,
+                 sampleState = DDS_SampleStateKindEnum.DDS_ANY_SAMPLE_STATE, viewState = DDS_ViewStateKindEnum.DDS_ANY_VIEW_STATE,
+                 as_records = False, condition = None, encoded = False):
+        """'takeFlag' controls whether read samples stay in the DDS cache (i.e. use DDS Read API) or removed (i.e. use DDS Take API)
+        'as_numpy' returns sequences and arrays of numbers (and octets) as numpy arrays filled straight from DDS
+        'max_samples' bounds how many samples are returned, the rest stay in the DDS cache
+        'as_records' returns Sample namedtuples holding a SampleInfoRecord and the data's
+        struct as a namedtuple (see TypePlan.record) instead of nested dicts
+        'condition' a ReadCondition selecting the samples instead of the states
+        'encoded' returns the data as CDR bytes instead of unpacking it
+        Samples without valid data (dispose and unregister notifications) have None as their sampleData"""
+        flags = _unpack_flags(as_numpy, as_records)
+        seqs = self._acquire_seqs()
+        if not self._loan(seqs, instanceState, take, max_samples, sampleState, viewState, condition):
+            self._release_seqs(seqs)
+            return []
+        data_seq, info_seq = seqs
         data_seq_length = data_seq.get_length()
         samplesList = []
+        cdr = self._cdr or encoded
+        if cdr:
+            try:
+                buf = self._cdr_buffers.pop()
+            except IndexError:
+                buf = ctypes.create_string_buffer(_CDR_BUFFER_BYTES)
+        if self._metrics is not None:
+            started = _clock()
         try:
             for i in range(data_seq_length):
-                sampleInfo = unpack_sampleInfo(info_seq.get_reference(i))
-                sampleData = unpack_dd(data_seq.get_reference(i))
-                sampleDict = {'sampleInfo': sampleInfo, 'sampleData': sampleData}            
-                samplesList.append(sampleDict)
+                info = info_seq.get_reference(i)
+                if info.contents.valid_data:
+                    dd = data_seq.get_reference(i)
+                    if encoded:
+                        view, buf = self._to_cdr(dd, buf)
+                        sampleData = bytes(view)
+                    elif self._cdr:
+                        sampleData, buf = self._unpack_cdr(dd, flags, buf)
+                    else:
+                        sampleData = self._plan_of(dd).unpack(dd, flags)
+                else:
+                    # dispose and unregister notifications, their DynamicData hold no data
+                    sampleData = None
+                if as_records:
+                    samplesList.append(Sample(SampleInfoRecord(info), sampleData))
+                else:
+                    sampleInfo = unpack_sampleInfo(info)
+                    sampleDict = {'sampleInfo': sampleInfo, 'sampleData': sampleData}            
+                    samplesList.append(sampleDict)
             return samplesList
         finally:
+            if self._metrics is not None:
+                self._measure_loan(seqs, _clock() - started)
+                started = _clock()
             self._dyn_narrowed_reader.return_loan(ctypes.byref(data_seq), ctypes.byref(info_seq))
+            self._release_seqs(seqs)
+            if cdr:
+                self._cdr_buffers.append(buf)
+            if self._metrics is not None:
+                self._metrics.add(native_seconds=_clock() - started)
         
-class DDS(object):
-    """Creating application via configuration file name (i.e. XML Application Creation)"""
-    def __init__(self, configuration_name, configuration_file = None):
-        if configuration_file:
+class _AsyncAvailable(object):
+    """asyncio.Event set, through the running loop, whenever reader's listener reports data"""
+    def __init__(self, reader):
+        self._reader = reader
+        import asyncio
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+
+    def _callback(self):
+        # runs on the middleware's thread
+        try:
+            self._loop.call_soon_threadsafe(self._event.set)
+        except RuntimeError:
+            # the loop was closed while still registered
+            pass
+
+    def __enter__(self):
+        self._ref = self._reader.add_data_available_callback(self._callback)
+        return self._event
+
+    def __exit__(self, *exc_info):
+        self._reader.remove_data_available_callback(self._ref)
+
+class LoanedSample(object):
+    """A sample still owned by DDS, its data members are unpacked only when
+    accessed as sample.member or sample['member']. Those of a dispose or
+    unregister notification, without valid data, are None, as its
+    sampleData is for read/take."""
+    __slots__ = ('_loan', '_dd', '_info')
+
+    def __init__(self, loan, dd, info):
+        self._loan = loan
+        self._dd = dd
+        self._info = info
+
+    @property
+    def info(self):
+        self._loan._check()
+        return unpack_sampleInfo(self._info)
+
+    def __getitem__(self, name):
+        self._loan._check()
+        cname, plan = self._loan._plan.member_plans[name]
+        if not self._info.contents.valid_data:
+            return None
+        if name in self._loan._plan.optional and not DDSFunc.DynamicData_member_exists(self._dd, cname, DDS_DYNAMIC_DATA_MEMBER_ID_UNSPECIFIED):
+            return None
+        return plan.unpack_member(self._dd, cname, DDS_DYNAMIC_DATA_MEMBER_ID_UNSPECIFIED, self._loan._flags)
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def unpack(self):
+        """All of the sample's data, as read/take would return it"""
+        self._loan._check()
+        if not self._info.contents.valid_data:
+            return None
+        return self._loan._plan.unpack(self._dd, self._loan._flags)
+
+class Loan(object):
+    """Samples read or taken from a Reader without unpacking them.
+
+    Entering the with block gives a list of LoanedSample, which are only valid
+    until the block exits and the samples are returned to the reader.
+    """
+    def __init__(self, reader, instanceState, take, as_numpy, max_samples, sampleState, viewState):
+        self._flags = _unpack_flags(as_numpy, False)
+        self._reader = reader
+        self._args = (instanceState, take, max_samples, sampleState, viewState)
+        self.as_numpy = as_numpy
+        self._plan = None
+        self._seqs = None
+
+    def __enter__(self):
+        seqs = self._reader._acquire_seqs()
+        if not self._reader._loan(seqs, *self._args):
+            self._reader._release_seqs(seqs)
+            return []
+        self._seqs = data_seq, info_seq = seqs
+        try:
+            samples = []
+            for i in range(data_seq.get_length()):
+                dd = data_seq.get_reference(i)
+                if self._plan is None:
+                    self._plan = self._reader._plan_of(dd)
+                samples.append(LoanedSample(self, dd, info_seq.get_reference(i)))
+            if self._reader._metrics is not None:
+                # unpacked later, if at all, by the LoanedSamples
+                self._reader._measure_loan(seqs, 0)
+            return samples
+        except:
+            self.__exit__(*sys.exc_info())
+            raise
+
+    def __exit__(self, *exc_info):
+        if self._seqs is not None:
+            seqs, self._seqs = self._seqs, None
+            self._reader._dyn_narrowed_reader.return_loan(ctypes.byref(seqs[0]), ctypes.byref(seqs[1]))
+            self._reader._release_seqs(seqs)
+
+    def _check(self):
+        if self._seqs is None:
+            raise Error('samples were already returned to the reader')
+
+def _hashable(value):
+    if isinstance(value, list):
+        return tuple(_hashable(x) for x in value)
+    elif isinstance(value, dict):
+        return tuple((k, _hashable(v)) for k, v in value.items())
+    return value
+
+class InstanceCache(object):
+    """Latest data of every live instance of a Reader's topic.
+
+    update() takes the samples the reader has and folds them in, keyed by
+    the tuple of the type's key members (() for keyless types). Instances
+    that are disposed or lose their writers are removed. Each change bumps
+    'version', and changed_since(version) tells what changed after it,
+    the last 'removed_history' removals included. With follow=True
+    update() runs from the reader's data available callback.
+    """
+    def __init__(self, reader, follow = False, removed_history = 1024):
+        self._reader = reader
+        self.version = 0
+        self._data = {}
+        # instance handle: key, to recognize samples carrying no data
+        self._handles = {}
+        # key: version of its last change, oldest first, of the instances in _data
+        self._versions = collections.OrderedDict()
+        # key: version of its removal, oldest first, the last removed_history of them
+        self._removed = collections.OrderedDict()
+        self.removed_history = removed_history
+        # latest version of a removal no longer in _removed
+        self._forgotten = 0
+        self._lock = threading.RLock()
+        self._ref = reader.add_data_available_callback(self.update) if follow else None
+
+    def close(self):
+        if self._ref is not None:
+            self._reader.remove_data_available_callback(self._ref)
+            self._ref = None
+
+    def _key(self, key):
+        if not isinstance(key, tuple):
+            return (key,)
+        return key
+
+    def get(self, key, default = None):
+        """Data of the instance of 'key', a tuple of key member values or the value of a single key"""
+        return self._data.get(self._key(key), default)
+
+    def __getitem__(self, key):
+        return self._data[self._key(key)]
+
+    def __contains__(self, key):
+        return self._key(key) in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def items(self):
+        with self._lock:
+            return list(self._data.items())
+
+    def changed_since(self, version):
+        """{key: data, or None if removed} of the instances changed after 'version'. Raises
+        Error when removals after it were forgotten, see removed_history, the cache then
+        has to be read again with items()"""
+        changed = {}
+        with self._lock:
+            if version < self._forgotten:
+                raise Error('removals after version %d were forgotten' % version)
+            for key, key_version in reversed(self._versions.items()):
+                if key_version <= version:
+                    break
+                changed[key] = self._data[key]
+            for key, key_version in reversed(self._removed.items()):
+                if key_version <= version:
+                    break
+                changed[key] = None
+        return changed
+
+    def _changed(self, key):
+        self.version += 1
+        self._versions[key] = self.version
+        self._versions.move_to_end(key)
+        self._removed.pop(key, None)
+
+    def _remove(self, key):
+        self.version += 1
+        del self._versions[key]
+        self._removed[key] = self.version
+        if len(self._removed) > self.removed_history:
+            self._forgotten = self._removed.popitem(last=False)[1]
+
+    def update(self):
+        """Folds in the samples available on the reader, returns how many there were"""
+        reader = self._reader
+        seqs = reader._acquire_seqs()
+        if not reader._loan(seqs, DDS_InstanceStateKindEnum.DDS_ANY_INSTANCE_STATE, True, DDS_LENGTH_UNLIMITED,
+                            DDS_SampleStateKindEnum.DDS_ANY_SAMPLE_STATE, DDS_ViewStateKindEnum.DDS_ANY_VIEW_STATE):
+            reader._release_seqs(seqs)
+            return 0
+        data_seq, info_seq = seqs
+        try:
+            length = data_seq.get_length()
+            with self._lock:
+                for i in range(length):
+                    info_p = info_seq.get_reference(i)
+                    info = info_p.contents
+                    handle = _handle_bytes(info.instance_handle)
+                    if info.valid_data:
+                        dd = data_seq.get_reference(i)
+                        plan = reader._plan_of(dd)
+                        data = plan.unpack(dd)
+                        key = tuple(_hashable(data[name]) for name in plan.key_names)
+                        self._handles[handle] = key
+                        self._data[key] = data
+                        self._changed(key)
+                    else:
+                        key = self._handles.get(handle)
+                    if info.instance_state != DDS_InstanceStateKindEnum.DDS_ALIVE_INSTANCE_STATE.value:
+                        self._handles.pop(handle, None)
+                        if key is not None and self._data.pop(key, None) is not None:
+                            self._remove(key)
+            return length
+        finally:
+            reader._dyn_narrowed_reader.return_loan(ctypes.byref(data_seq), ctypes.byref(info_seq))
+            reader._release_seqs(seqs)
+
+def duration(timeout):
+    """Duration_t of a timeout in seconds, None being infinite"""
+    if timeout is None:
+        return DDSType.Duration_t(DDS_DURATION_INFINITE_SEC, DDS_DURATION_INFINITE_NSEC)
+    sec = int(timeout)
+    return DDSType.Duration_t(sec, int((timeout - sec) * 1e9))
+
+class WaitSet(object):
+    """Blocks a thread until any of many readers has data.
+
+    The native wait releases the GIL, so other threads keep running while
+    one waits here. Only one thread should wait on a WaitSet at a time.
+    """
+    def __init__(self):
+        self._waitset = DDSFunc.WaitSet_new()
+        # condition address: (condition, reader, read condition to delete or None)
+        self._conditions = {}
+        self._active = DDSType.ConditionSeq()
+        DDSFunc.ConditionSeq_initialize(self._active)
+        self._guard = DDSFunc.GuardCondition_new()
+        self._attach(ctypes.cast(self._guard, ctypes.POINTER(DDSType.Condition)), None, None)
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        if getattr(self, '_waitset', None) is None:
+            return
+        for condition, reader, read_condition in self._conditions.values():
+            self._waitset.detach_condition(condition)
+            if read_condition is not None:
+                reader._reader.delete_readcondition(read_condition)
+        self._conditions.clear()
+        DDSFunc.GuardCondition_delete(self._guard)
+        DDSFunc.ConditionSeq_finalize(self._active)
+        DDSFunc.WaitSet_delete(self._waitset)
+        self._waitset = None
+
+    def _attach(self, condition, reader, read_condition):
+        self._waitset.attach_condition(condition)
+        self._conditions[ctypes.cast(condition, ctypes.c_void_p).value] = (condition, reader, read_condition)
+
+    def attach(self, reader, instanceState = DDS_InstanceStateKindEnum.DDS_ANY_INSTANCE_STATE,
+               sampleState = DDS_SampleStateKindEnum.DDS_NOT_READ_SAMPLE_STATE, viewState = DDS_ViewStateKindEnum.DDS_ANY_VIEW_STATE):
+        """Wakes wait() while reader holds samples in the given states (a ReadCondition)"""
+        read_condition = reader._reader.create_readcondition(state_mask(sampleState), state_mask(viewState), state_mask(instanceState))
+        try:
+            self._attach(ctypes.cast(read_condition, ctypes.POINTER(DDSType.Condition)), reader, read_condition)
+        except:
+            reader._reader.delete_readcondition(read_condition)
+            raise
+
+    def attach_status(self, reader, mask = DATA_AVAILABLE_STATUS):
+        """Wakes wait() when any of the communication statuses in mask changes on reader (a StatusCondition)"""
+        status_condition = DDSFunc.Entity_get_statuscondition(ctypes.cast(reader._reader, ctypes.POINTER(DDSType.Entity)))
+        status_condition.set_enabled_statuses(mask)
+        self._attach(ctypes.cast(status_condition, ctypes.POINTER(DDSType.Condition)), reader, None)
+
+    def detach(self, reader):
+        """Removes every condition attached for reader"""
+        for key, (condition, owner, read_condition) in list(self._conditions.items()):
+            if owner is reader:
+                self._waitset.detach_condition(condition)
+                if read_condition is not None:
+                    reader._reader.delete_readcondition(read_condition)
+                del self._conditions[key]
+
+    def wake(self):
+        """Makes a wait() in another thread return, possibly with no readers"""
+        DDSFunc.GuardCondition_set_trigger_value(self._guard, True)
+
+    def wait(self, timeout = None):
+        """Waits up to 'timeout' seconds (None for ever) and returns the readers with triggered conditions"""
+        try:
+            self._waitset.wait(ctypes.byref(self._active), ctypes.byref(duration(timeout)))
+        except Error as e:
+            if str(e) == 'timeout':
+                return []
+            else:
+                raise e
+        ready = []
+        for i in range(DDSFunc.ConditionSeq_get_length(self._active)):
+            condition, reader, read_condition = self._conditions[ctypes.cast(DDSFunc.ConditionSeq_get(self._active, i), ctypes.c_void_p).value]
+            if reader is None:
+                DDSFunc.GuardCondition_set_trigger_value(self._guard, False)
+            elif reader not in ready:
+                ready.append(reader)
+        return ready
+
+# the configuration file whose profiles the participant factory last loaded
+_factory_profiles = None
+_factory_lock = threading.Lock()
+
+def _participant_factory(configuration_file):
+    """The DomainParticipantFactory, having loaded configuration_file's profiles. They are reloaded
+    only when another file is asked for, NDDS_QOS_PROFILES being set just while they are. The
+    environment is read when they are loaded, which reload_profiles alone leaves to the next
+    participant created, so load_profiles loads them there and then"""
+    global _factory_profiles
+    factory = DDSFunc.DomainParticipantFactory_get_instance()
+    if not configuration_file:
+        return factory
+    with _factory_lock:
+        if configuration_file != _factory_profiles:
+            previous = os.environ.get('NDDS_QOS_PROFILES')
             os.environ['NDDS_QOS_PROFILES'] = configuration_file
+            try:
+                factory.reload_profiles()
+                factory.load_profiles()
+            finally:
+                if previous is None:
+                    del os.environ['NDDS_QOS_PROFILES']
+                else:
+                    os.environ['NDDS_QOS_PROFILES'] = previous
+            _factory_profiles = configuration_file
+    return factory
+
+def _profile_files(configuration_file):
+    # where the middleware looks for profiles, NDDS_QOS_PROFILES holds ';' separated, optionally [bracketed], urls
+    files = [configuration_file] if configuration_file else []
+    for url in os.environ.get('NDDS_QOS_PROFILES', '').split(';'):
+        url = url.strip().strip('[]')
+        if url.startswith('file://'):
+            url = url[len('file://'):]
+        if url and '://' not in url:
+            files.append(url)
+    files.append('USER_QOS_PROFILES.xml')
+    return files
+
+def configured_entities(configuration_name, configuration_file = None):
+    """(writer names, reader names) of the participant configuration_name (e.g.
+    MyParticipantLibrary::PublicationParticipant) as declared in the XML profiles, base
+    participants included, in the form the lookup_*_by_name methods of DDS take them"""
+    import xml.etree.ElementTree as ElementTree
+    participants = {}
+    for path in _profile_files(configuration_file):
+        try:
+            root = ElementTree.parse(path).getroot()
+        except (OSError, ElementTree.ParseError):
+            continue
+        for library in root.iter('domain_participant_library'):
+            for participant in library.findall('domain_participant'):
+                participants.setdefault('%s::%s' % (library.get('name'), participant.get('name')), (library.get('name'), participant))
+    writers, readers = [], []
+    name = configuration_name
+    while name in participants:
+        library, participant = participants.pop(name)
+        for publisher in participant.findall('publisher'):
+            writers.extend('%s::%s' % (publisher.get('name'), writer.get('name')) for writer in publisher.findall('data_writer'))
+        for subscriber in participant.findall('subscriber'):
+            readers.extend('%s::%s' % (subscriber.get('name'), reader.get('name')) for reader in subscriber.findall('data_reader'))
+        name = participant.get('base_name')
+        if name is not None and '::' not in name:
+            name = '%s::%s' % (library, name)
+    return list(dict.fromkeys(writers)), list(dict.fromkeys(readers))
 
+class DDS(object):
+    """Creating application via configuration file name (i.e. XML Application Creation)
+
+    Lookups hand out the same Writer or Reader for the same name, wrapping the one
+    DataWriter or DataReader of that name, and raise Error when asked for it with
+    other options than it was first looked up with. With prewarm, those of every
+    writer and reader the XML declares for the participant (see configured_entities)
+    are made, and their types compiled, right away, and remade with the options of
+    the first lookup asking for other ones.
+    close(), or leaving a with block, frees them and deletes the participant.
+    """
+    _shared = weakref.WeakValueDictionary()
+    _shared_lock = threading.Lock()
+
+    def __init__(self, configuration_name, configuration_file = None, prewarm = True):
         self.configuration_name = configuration_name
-        self._participant = DDSFunc.DomainParticipantFactory_get_instance().create_participant_from_config(cstring(self.configuration_name))
+        self.configuration_file = configuration_file
+        # kept for close(), which may run while the interpreter shuts down
+        self._factory = _participant_factory(configuration_file)
+        self._participant = self._factory.create_participant_from_config(cstring(self.configuration_name))
+        # full name: [Writer or Reader, its options, whether a lookup handed it out]
+        self._writers = {}
+        self._readers = {}
+        self._lookup_lock = threading.Lock()
+        # full name: (Subscriber, TopicDescription, DataReaderQos) of the DataReaders deleted by
+        # create_filtered_reader(replace=True), which its next filtered readers are made like
+        self._templates = {}
+        # every Writer and Reader made for the participant, closed along with it
+        self._entities = weakref.WeakSet()
+        if prewarm:
+            try:
+                writers, readers = configured_entities(configuration_name, configuration_file)
+                for name in writers:
+                    self._lookup(self._writers, Writer, name, (0, False, False), False)
+                for name in readers:
+                    self._lookup(self._readers, Reader, name, (None, False, False), False)
+            except:
+                self.close()
+                raise
+
+    @classmethod
+    def shared(cls, configuration_name, configuration_file = None):
+        """The DDS of configuration_name still in use elsewhere in the process, or a new one,
+        so that code that does not know of each other creates a single participant"""
+        with cls._shared_lock:
+            dds = cls._shared.get((configuration_name, configuration_file))
+            if dds is None or dds._participant is None:
+                dds = cls._shared[(configuration_name, configuration_file)] = cls(configuration_name, configuration_file)
+            return dds
 
     def __del__(self):
-        self._participant.delete_contained_entities()
-
-    def lookup_datawriter_by_name(self, datawriter_full_name):
-        """Retrieves the DDS DataWriter according to its full name (e.g. MyPublisher::HelloWorldWriter"""
-        res = Writer(self,cstring(datawriter_full_name))
+        if getattr(self, '_participant', None) is not None:
+            self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Closes every Writer and Reader made for the participant, then deletes it and all it contains"""
+        if self._participant is None:
+            return
+        entities = list(getattr(self, '_entities', ()))
+        for entity in entities:
+            entity.close()
+        self._writers = {}
+        self._readers = {}
+        try:
+            self._participant.delete_contained_entities()
+            self._factory.delete_participant(self._participant)
+        finally:
+            self._participant = None
+            for subscriber, description, qos in self._templates.values():
+                DDSFunc.DataReaderQos_finalize(qos)
+            self._templates = {}
+            # the types go with the participant, another may be allocated where one of theirs was
+            _forget_plans([entity._plan for entity in entities])
+
+    def lookup_datawriter_by_name(self, datawriter_full_name, instance_cache_size = 0, metrics = False, cdr = False):
+        """Retrieves the DDS DataWriter according to its full name (e.g. MyPublisher::HelloWorldWriter
+        With an instance_cache_size the handles of that many recently written keys are kept and reused
+        With metrics the writer keeps the counters returned by its metrics()
+        With cdr samples are serialized in Python and set in one native call, see cdr_compile"""
+        return self._lookup(self._writers, Writer, datawriter_full_name, (instance_cache_size, metrics, cdr))
+
+    def lookup_datareader_by_name(self, datareader_full_name, dispatcher = None, metrics = False, cdr = False):
+        """Retrieves the DDS DataReader according to its full name (e.g. MySubscriber::HelloWorldReader
+        A Dispatcher runs its callbacks off the middleware's receive thread
+        With metrics the reader keeps the counters returned by its metrics()
+        With cdr read and take get samples out in one native call and unpack their CDR, see cdr_compile"""
+        if datareader_full_name in self._templates:
+            raise Error('%s was replaced by filtered readers' % datareader_full_name)
+        return self._lookup(self._readers, Reader, datareader_full_name, (dispatcher, metrics, cdr))
+
+    def _lookup(self, cache, cls, name, options, hand_out = True):
+        """The cls (Writer or Reader) of name in cache, made with options if there is none. Two of them
+        would fight over the DataReader's listener, so one of other options is only made in place of one
+        no lookup handed out yet."""
+        with self._lookup_lock:
+            entry = cache.get(name)
+            if entry is not None and entry[1] != options:
+                if entry[2]:
+                    raise Error('%s was looked up with other options before' % name)
+                entry[0].close()
+                entry = None
+            if entry is None:
+                res = cls(self, cstring(name), *options)
+                self._entities.add(res)
+                entry = cache[name] = [res, options, False]
+            entry[2] = entry[2] or hand_out
+            return entry[0]
+
+    def create_filtered_reader(self, datareader_full_name, filter_expression, filter_parameters = (), dispatcher = None, metrics = False,
+                               cdr = False, replace = False):
+        """Creates a DataReader like the one named datareader_full_name, in its Subscriber and with its QoS, of a
+        ContentFilteredTopic of its topic: only samples matching 'filter_expression', an SQL expression on the data
+        members (e.g. "sender = %0" or "count > 1000"), reach it. Its %0, %1... are replaced by 'filter_parameters'
+        (strings quoted, e.g. "'node7'"), which Reader.set_filter_parameters changes later. Writers learn the filter
+        and, where they can, drop the samples before sending them. The DataReader is deleted with the Reader.
+
+        The DataReader named datareader_full_name keeps receiving every sample, and with reliable KEEP_ALL QoS
+        holds back writers once its cache fills, unless something takes from it. With 'replace' it is deleted,
+        along with its Reader if one was looked up, and can no longer be looked up, later filtered readers
+        being made like it still."""
+        template = self._templates.get(datareader_full_name)
+        if template is None:
+            reader = self._participant.lookup_datareader_by_name(cstring(datareader_full_name))
+            qos = DDSType.DataReaderQos()
+            DDSFunc.DataReaderQos_initialize(qos)
+            try:
+                reader.get_qos(qos)
+            except:
+                DDSFunc.DataReaderQos_finalize(qos)
+                raise
+            template = (reader.get_subscriber(), reader.get_topicdescription(), qos)
+        subscriber, description, qos = template
+        try:
+            name = b'%s_filter%d' % (DDSFunc.TopicDescription_get_name(description), next(_filter_ids))
+            seq = string_seq(filter_parameters)
+            try:
+                filtered_topic = self._participant.create_contentfilteredtopic(name, DDSFunc.Topic_narrow(description), cstring(filter_expression), seq)
+            finally:
+                DDSFunc.StringSeq_finalize(seq)
+            try:
+                reader = subscriber.create_datareader(filtered_topic.as_topicdescription(), qos, None, 0)
+            except:
+                self._participant.delete_contentfilteredtopic(filtered_topic)
+                raise
+            if replace and datareader_full_name not in self._templates:
+                with self._lookup_lock:
+                    entry = self._readers.pop(datareader_full_name, None)
+                if entry is not None:
+                    entry[0].close()
+                subscriber.delete_datareader(self._participant.lookup_datareader_by_name(cstring(datareader_full_name)))
+                self._templates[datareader_full_name] = template
+        finally:
+            if datareader_full_name not in self._templates:
+                DDSFunc.DataReaderQos_finalize(qos)
+        res = Reader(self, cstring(datareader_full_name), dispatcher, metrics, cdr, (reader, filtered_topic))
+        self._entities.add(res)
         return res
 
-    def lookup_datareader_by_name(self, datareader_full_name):
-        """Retrieves the DDS DataReader according to its full name (e.g. MySubscriber::HelloWorldReader"""
-        res = Reader(self,cstring(datareader_full_name))
-        return res
 
 
 
 
+# Sharding readers over processes
+
+# how often, in seconds, ReaderPool workers check whether they should stop
+_POOL_POLL_SECONDS = 0.1
+
+def _shard(handle, shards):
+    """Which of 'shards' the instance of handle belongs to, the same in every process"""
+    return zlib.crc32(bytes(handle.keyHash_value)) % shards
+
+def _take_shard(reader, shard, shards, as_numpy, max_samples):
+    """Takes up to max_samples samples and unpacks those of the instances in shard"""
+    samples = []
+    with reader.take_loaned(as_numpy = as_numpy, max_samples = max_samples) as loaned:
+        for sample in loaned:
+            info = sample._info.contents
+            if _shard(info.instance_handle, shards) == shard:
+                samples.append({'sampleInfo': unpack_sampleInfo(sample._info),
+                                'sampleData': sample.unpack() if info.valid_data else None})
+    return samples
+
+def _reader_pool_worker(configuration_name, configuration_file, datareader_full_name, shard, shards, shard_filter,
+                        as_numpy, batch_size, queue, stop):
+    """Body of a ReaderPool process, puts lists of samples, or the traceback of what failed, on queue"""
+    participant = waitset = None
+    failed = False
+    try:
+        participant = DDS(configuration_name, configuration_file, prewarm = False)
+        if shard_filter is None:
+            reader = participant.lookup_datareader_by_name(datareader_full_name)
+        else:
+            # the reader it is made like would otherwise receive, and hold on to, every sample
+            reader = participant.create_filtered_reader(datareader_full_name, shard_filter, replace = True)
+        waitset = WaitSet()
+        waitset.attach(reader)
+        while not stop.is_set():
+            if not waitset.wait(_POOL_POLL_SECONDS):
+                continue
+            if shard_filter is None:
+                samples = _take_shard(reader, shard, shards, as_numpy, batch_size)
+            else:
+                samples = reader.take(as_numpy = as_numpy, max_samples = batch_size)
+            if samples:
+                queue.put(samples)
+    except Exception:
+        failed = True
+        queue.put(traceback.format_exc())
+    finally:
+        if waitset is not None:
+            waitset.close()
+        if participant is not None:
+            participant.close()
+        if not failed:
+            # what is still queued is dropped rather than blocking the exit,
+            # but a failure has to be flushed out for take() to report it
+            queue.cancel_join_thread()
+
+class ReaderPool(object):
+    """Unpacks the samples of one DataReader in several processes, past what one GIL allows.
+
+    Each of 'processes' workers creates its own participant from configuration_name
+    (and configuration_file) and its own copy of the reader named datareader_full_name.
+    By default they all receive every sample and each unpacks only those of the
+    instances whose key hash falls in its shard. With 'shard_filters', one filter
+    expression per process (e.g. "id < 1000" and "id >= 1000"), each worker reads
+    through a ContentFilteredTopic instead, so the middleware splits the samples.
+
+    The samples, as Reader.take returns them, come out of take() and stream() in
+    batches of up to 'batch_size', each instance's in order. Workers stop taking while
+    'max_queued' batches wait to be consumed. Workers are started with 'start_method',
+    the default 'spawn' avoids forking a process that already runs the middleware.
+    """
+    def __init__(self, configuration_name, datareader_full_name, processes = None, configuration_file = None,
+                 shard_filters = None, as_numpy = False, batch_size = 64, max_queued = 64, start_method = 'spawn'):
+        import multiprocessing
+        processes = processes or (len(shard_filters) if shard_filters else os.cpu_count())
+        if shard_filters is not None and len(shard_filters) != processes:
+            raise ValueError('one shard filter per process is needed')
+        context = multiprocessing.get_context(start_method)
+        self._queue = context.Queue(max_queued)
+        self._stop = context.Event()
+        self._processes = [context.Process(target=_reader_pool_worker, name='dds-reader-pool-%d' % i,
+                                           args=(configuration_name, configuration_file, datareader_full_name, i, processes,
+                                                 shard_filters[i] if shard_filters else None, as_numpy, batch_size,
+                                                 self._queue, self._stop))
+                           for i in range(processes)]
+        for process in self._processes:
+            process.daemon = True
+            process.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def take(self, timeout = None):
+        """The next batch of samples from any worker, waiting up to 'timeout' seconds (None for ever), or []"""
+        import queue
+        try:
+            batch = self._queue.get(timeout = timeout)
+        except queue.Empty:
+            return []
+        if isinstance(batch, str):
+            raise Error('a reader pool worker failed:\n' + batch)
+        return batch
+
+    def stream(self, timeout = None):
+        """Generator yielding samples one by one, returns once none arrived for 'timeout' seconds (None waits forever)"""
+        while True:
+            samples = self.take(timeout)
+            if not samples:
+                return
+            for sample in samples:
+                yield sample
+
+    def __iter__(self):
+        return self.stream()
+
+    def close(self, timeout = 5):
+        """Stops the workers, dropping the samples they have not handed over yet"""
+        if self._processes is None:
+            return
+        self._stop.set()
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._processes = None
+        self._queue.close()
@@ -0,0 +1,318 @@
+"""Writing octet payloads of hundreds of MB from files, buffers or chunk iterators, and reassembling them
+
+A payload written in one sample is first turned into bytes and then copied into
+DynamicData, so a publisher briefly holds it two or three times over and blocks
+until all of it is serialized. BlobWriter instead cuts it into fragments of
+'chunk_size' bytes, each read straight from the file (or sliced from the
+buffer, or taken from the iterator) into one reused buffer and written as its
+own sample, so memory stays flat whatever the size of the payload.
+
+A fragment is the octet sequence member of a sample, starting with a header:
+a magic, flags, the blob id, the offset of the fragment in the blob and the
+blob's total size (-1 when it is not known before its last fragment). The
+other members of every fragment are those of the message given to write().
+The octet sequence must be bounded by at least chunk_size + FRAGMENT_HEADER_BYTES.
+
+BlobReader puts the fragments of each blob back together, one copy per
+fragment into a buffer allocated once when the total size is known. Fragments
+have to arrive in order and none may be lost, so both ends need reliable,
+KEEP_ALL QoS (e.g. BuiltinQosLibExp::Generic.StrictReliable.LargeData) and a
+writer's blobs have to be read by a reader that was already there when they
+started.
+"""
+import collections
+import mmap
+import os
+import struct
+import time
+
+from . import Error, TCKind, numpy
+
+MAGIC = b'DDSB'
+# magic, flags, blob id, offset, total size or -1
+_fragment = struct.Struct('<4sIQQq')
+FRAGMENT_HEADER_BYTES = _fragment.size
+LAST_FRAGMENT = 1
+DEFAULT_CHUNK_BYTES = 1 << 20
+
+BlobChunk = collections.namedtuple('BlobChunk', ('id', 'offset', 'total', 'data', 'last'))
+
+def _octet_sequence(plan, member):
+    """The bound of the octet sequence 'member' of the struct of plan"""
+    try:
+        cname, member_plan = plan.member_plans[member]
+    except KeyError:
+        raise ValueError('%r is not a member of the type' % member)
+    if member_plan.kind != TCKind.SEQUENCE or member_plan.element.kind != TCKind.OCTET:
+        raise ValueError('%r is not a sequence of octets' % member)
+    return member_plan.length
+
+def _source_size(f):
+    """Bytes left to read in the file f, or None for pipes and the like"""
+    try:
+        return os.fstat(f.fileno()).st_size - f.tell()
+    except (AttributeError, OSError, ValueError):
+        return None
+
+class _Filler(object):
+    """Fills buffers from a file, a buffer or an iterator of chunks, in order"""
+    def __init__(self, source):
+        self.total = None
+        self._file = None
+        self._view = None
+        self._chunks = None
+        self._left = memoryview(b'')
+        if hasattr(source, 'readinto'):
+            self._file = source
+            self.total = _source_size(source)
+        else:
+            try:
+                self._view = memoryview(source).cast('B')
+                self.total = len(self._view)
+            except TypeError:
+                self._chunks = iter(source)
+
+    def fill(self, view):
+        """Fills view as far as the source goes, returns how many bytes it put there"""
+        filled = 0
+        size = len(view)
+        if self._file is not None:
+            while filled < size:
+                n = self._file.readinto(view[filled:])
+                if not n:
+                    break
+                filled += n
+        elif self._view is not None:
+            filled = min(size, len(self._view))
+            view[:filled] = self._view[:filled]
+            self._view = self._view[filled:]
+        else:
+            while filled < size:
+                if not self._left:
+                    chunk = next(self._chunks, None)
+                    if chunk is None:
+                        break
+                    self._left = memoryview(chunk).cast('B')
+                    continue
+                n = min(size - filled, len(self._left))
+                view[filled:filled + n] = self._left[:n]
+                self._left = self._left[n:]
+                filled += n
+        return filled
+
+def _whole(source):
+    """source as one buffer the Writer can point to, mapping files rather than reading them"""
+    if hasattr(source, 'readinto'):
+        size = _source_size(source)
+        if size and source.tell() == 0:
+            # copy on write, so ctypes can point into it, pages are read as the middleware copies them
+            return mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_COPY)
+        return source.read()
+    if isinstance(source, bytes):
+        return source
+    try:
+        return memoryview(source).cast('B')
+    except TypeError:
+        return b''.join(source)
+
+class BlobWriter(object):
+    """Writes large octet payloads as the 'member' octet sequence of samples of 'writer' (a Writer).
+
+    With 'fragment' each payload is split into samples carrying at most 'chunk_size'
+    of its bytes, for a BlobReader to put back together. Without it a payload is
+    written in one sample, from a memory map when it is a file, so it is only copied
+    by the middleware.
+    """
+    def __init__(self, writer, member, chunk_size = DEFAULT_CHUNK_BYTES, fragment = True):
+        self._writer = writer
+        self.member = member
+        self.chunk_size = chunk_size
+        self.fragment = fragment
+        bound = _octet_sequence(writer._plan, member)
+        if fragment and chunk_size + _fragment.size > bound:
+            raise ValueError('fragments of %d bytes do not fit in a sequence of %d' % (chunk_size + _fragment.size, bound))
+        # header and payload of the fragment being written, pointed to rather than copied by Writer.write
+        self._buffer = bytearray(_fragment.size + chunk_size) if fragment else None
+
+    def write(self, source, msg = None, on_progress = None):
+        """Writes the bytes of 'source': a path, a file open in binary mode, a buffer (bytes,
+        mmap, memoryview, numpy array) or an iterator of such chunks. 'msg' gives the
+        other members of the samples. on_progress(bytes written, total bytes or None,
+        seconds elapsed) is called after every sample. Returns how many bytes were written.
+        """
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, 'rb') as f:
+                return self.write(f, msg, on_progress)
+        msg = dict(msg or {})
+        started = time.monotonic()
+        if not self.fragment:
+            data = _whole(source)
+            try:
+                msg[self.member] = data
+                self._writer.write(msg)
+                written = len(data)
+                del msg[self.member]
+            finally:
+                if isinstance(data, mmap.mmap):
+                    try:
+                        data.close()
+                    except BufferError:
+                        # still pointed to, it is unmapped when that goes
+                        pass
+            if on_progress is not None:
+                on_progress(written, written, time.monotonic() - started)
+            return written
+
+        filler = _Filler(source)
+        total = -1 if filler.total is None else filler.total
+        blob_id = int.from_bytes(os.urandom(8), 'little')
+        view = memoryview(self._buffer)
+        payload = view[_fragment.size:]
+        offset = 0
+        try:
+            while True:
+                n = filler.fill(payload)
+                # a full fragment may still be the last one, which is only known once the source has ended
+                last = n < len(payload) or offset + n == total
+                _fragment.pack_into(view, 0, MAGIC, LAST_FRAGMENT if last else 0, blob_id, offset, total)
+                msg[self.member] = view[:_fragment.size + n]
+                self._writer.write(msg)
+                offset += n
+                if on_progress is not None:
+                    on_progress(offset, None if total < 0 else total, time.monotonic() - started)
+                if last:
+                    return offset
+        finally:
+            # the buffer is pointed to by nothing once written
+            del msg[self.member]
+
+class _Assembly(object):
+    """A blob whose fragments are being received"""
+    def __init__(self, total, sample):
+        self.buffer = bytearray(max(total, 0))
+        self.total = total
+        self.filled = 0
+        self.sample = sample
+        self.started = time.monotonic()
+
+class BlobReader(object):
+    """Reassembles the blobs BlobWriter wrote into the 'member' octet sequence of the samples of
+    'reader' (a Reader), see the module's docstring. With 'fragment' False every sample is
+    a blob of its own.
+
+    At most 'max_pending' blobs are kept while waiting for their fragments, the oldest
+    is dropped to make room for another. on_progress(blob id, bytes received, total
+    bytes or None, seconds since its first fragment) is called after every fragment.
+    """
+    def __init__(self, reader, member, fragment = True, max_pending = 16, on_progress = None):
+        self._reader = reader
+        self.member = member
+        self.fragment = fragment
+        self.max_pending = max_pending
+        self.on_progress = on_progress
+        self._pending = collections.OrderedDict()
+        # ids of blobs given up on whose last fragment is still to come, so that they are counted once
+        self._given_up = collections.OrderedDict()
+        # blobs given up on because a fragment went missing or there were too many pending
+        self.dropped = 0
+
+    def _give_up(self, blob_id, last = False):
+        """Counts the blob blob_id as dropped, its fragments after 'last' not being counted again"""
+        self.dropped += 1
+        if not last:
+            self._given_up[blob_id] = None
+            if len(self._given_up) > self.max_pending:
+                # one whose last fragment was lost too
+                self._given_up.popitem(last=False)
+
+    def _chunks(self, samples):
+        """(sample, BlobChunk) of each fragment of samples, see chunks"""
+        for sample in samples:
+            data = sample['sampleData']
+            if data is None:
+                continue
+            octets = memoryview(data[self.member]).cast('B')
+            if not self.fragment:
+                yield sample, BlobChunk(None, 0, len(octets), octets, True)
+                continue
+            if len(octets) < _fragment.size:
+                raise Error('%r of a sample is not a fragment' % self.member)
+            magic, flags, blob_id, offset, total = _fragment.unpack_from(octets)
+            if magic != MAGIC:
+                raise Error('%r of a sample is not a fragment' % self.member)
+            yield sample, BlobChunk(blob_id, offset, None if total < 0 else total, octets[_fragment.size:],
+                                    bool(flags & LAST_FRAGMENT))
+
+    def chunks(self, samples):
+        """Generator of a BlobChunk for each fragment among 'samples' (as taken from the reader
+        with as_numpy, so that the octets are not turned into bytes), for consumers that
+        process blobs as their fragments arrive. Fragments are not checked for gaps here."""
+        for sample, chunk in self._chunks(samples):
+            yield chunk
+
+    def _add(self, sample, chunk):
+        """Copies chunk into the blob it belongs to, returns the blob's sample once it is complete"""
+        if not self.fragment:
+            sample['sampleData'][self.member] = chunk.data
+            return sample
+        assembly = self._pending.get(chunk.id)
+        if assembly is None:
+            if chunk.offset != 0:
+                # started before this reader was there, its first fragment was lost or it was given up on
+                if chunk.id not in self._given_up:
+                    self._give_up(chunk.id, chunk.last)
+                elif chunk.last:
+                    del self._given_up[chunk.id]
+                return None
+            if len(self._pending) >= self.max_pending:
+                self._give_up(self._pending.popitem(last=False)[0])
+            assembly = self._pending[chunk.id] = _Assembly(-1 if chunk.total is None else chunk.total, sample)
+        if chunk.offset != assembly.filled:
+            del self._pending[chunk.id]
+            self._give_up(chunk.id, chunk.last)
+            return None
+        end = chunk.offset + len(chunk.data)
+        if end <= len(assembly.buffer):
+            assembly.buffer[chunk.offset:end] = chunk.data
+        else:
+            assembly.buffer += chunk.data
+        assembly.filled = end
+        if self.on_progress is not None:
+            self.on_progress(chunk.id, end, chunk.total, time.monotonic() - assembly.started)
+        if not chunk.last:
+            return None
+        del self._pending[chunk.id]
+        data = assembly.sample['sampleData']
+        data[self.member] = memoryview(assembly.buffer)[:end]
+        # the other members as first written, with the info of the last fragment
+        return {'sampleInfo': sample['sampleInfo'], 'sampleData': data}
+
+    def add(self, samples):
+        """The blobs completed by 'samples' (as taken from the reader with as_numpy), each the
+        first fragment's sample whose 'member' is a memoryview of the whole blob"""
+        blobs = []
+        for sample, chunk in self._chunks(samples):
+            blob = self._add(sample, chunk)
+            if blob is not None:
+                blobs.append(blob)
+        return blobs
+
+    def take(self, max_samples = None):
+        """Takes the reader's samples and returns the blobs they complete, see add"""
+        if max_samples is None:
+            return self.add(self._reader.take(as_numpy = numpy is not None))
+        return self.add(self._reader.take(as_numpy = numpy is not None, max_samples = max_samples))
+
+    def stream(self, timeout = None, batch_size = 64):
+        """Generator of blobs as they are completed, see Reader.stream for 'timeout'"""
+        for sample in self._reader.stream(batch_size, timeout, as_numpy = numpy is not None):
+            for sample, chunk in self._chunks((sample,)):
+                blob = self._add(sample, chunk)
+                if blob is not None:
+                    yield blob
+
+    def stream_chunks(self, timeout = None, batch_size = 64):
+        """Generator of the BlobChunk of every fragment as it arrives, see chunks"""
+        for sample in self._reader.stream(batch_size, timeout, as_numpy = numpy is not None):
+            for sample, chunk in self._chunks((sample,)):
+                yield chunk
@@ -0,0 +1,227 @@
+"""Recording topic traffic into a sample log, which dds.replay plays back
+
+A log is an append-only file of the CDR the middleware serializes samples to,
+written as they are taken so multi-GB captures never sit in memory, and read
+back through mmap. It starts with the magic, then the length and JSON of the
+topic table: one {"reader": ..., "topic": ...} per recorded reader, whose
+position is the topic number of its samples. Each sample follows as a record
+header (payload length, topic, source and reception timestamps in nanoseconds
+since the epoch, as exact as the middleware's Time_t) and its CDR, padded to
+8 bytes.
+
+Next to it, path + '.idx' indexes every record by reception time and topic
+with fixed size entries, so a time range or a few topics of a long capture
+are found without reading the rest of it. Each entry holds the sample's own
+reception time, which selects it, and the latest reception time so far,
+which never decreases, even when readers polled one after the other received
+out of order, and so can be bisected.
+"""
+import bisect
+import collections
+import json
+import mmap
+import os
+import struct
+import time
+
+from . import DDS_LENGTH_UNLIMITED, Error, WaitSet, _nanoseconds, pstring
+
+MAGIC = b'PYDDSLG3'
+_header = struct.Struct('<8sI')
+# payload length, topic, source and reception timestamps
+_record = struct.Struct('<IH2xqq')
+# latest reception time so far, reception time, offset of the record, topic
+_index_entry = struct.Struct('<qqQH6x')
+_padding = bytes(8)
+
+# timestamps in nanoseconds since the epoch
+LoggedSample = collections.namedtuple('LoggedSample', ('topic', 'source_timestamp', 'reception_timestamp', 'data'))
+
+def _padded(length):
+    return length + -length % 8
+
+class Recorder(object):
+    """Appends the samples with valid data taken from 'readers' (Readers) to a new log at 'path'.
+
+    Samples are taken with Reader.take_encoded, so the recorded types need nothing
+    from cdr_compile. poll() records what the readers hold, run() keeps recording
+    as samples arrive.
+    """
+    def __init__(self, path, readers, max_samples = DDS_LENGTH_UNLIMITED):
+        self.path = path
+        self._readers = list(readers)
+        self._max_samples = max_samples
+        topics = [{'reader': pstring(reader.name), 'topic': pstring(reader._reader.get_topicdescription().get_name())}
+                  for reader in self._readers]
+        table = json.dumps(topics).encode()
+        self._log = open(path, 'wb')
+        self._index = open(path + '.idx', 'wb')
+        self._log.write(_header.pack(MAGIC, len(table)) + table + _padding[:-(_header.size + len(table)) % 8])
+        self._offset = _padded(_header.size + len(table))
+        self._latest = -1 << 63
+        self.samples = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _append(self, topic, source, reception, data):
+        """Appends the CDR 'data' received at 'reception' as a sample of 'topic', both timestamps in nanoseconds"""
+        self._log.write(_record.pack(len(data), topic, source, reception))
+        self._log.write(data)
+        self._log.write(_padding[:-len(data) % 8])
+        self._latest = max(self._latest, reception)
+        self._index.write(_index_entry.pack(self._latest, reception, self._offset, topic))
+        self._offset += _record.size + _padded(len(data))
+
+    def poll(self, readers = None):
+        """Records the samples 'readers' (all by default) hold now, returns how many"""
+        count = 0
+        for reader in self._readers if readers is None else readers:
+            topic = self._readers.index(reader)
+            for info, data in reader.take_encoded(max_samples = self._max_samples, as_records = True):
+                # dispose and unregister notifications carry nothing to replay
+                if data is not None:
+                    self._append(topic, _nanoseconds(info._info.source_timestamp), _nanoseconds(info._info.reception_timestamp), data)
+                    count += 1
+        self.samples += count
+        return count
+
+    def run(self, duration = None, stop = None):
+        """Records samples as they arrive for 'duration' seconds (None for ever) or until the
+        threading.Event 'stop' is set, returns how many"""
+        deadline = None if duration is None else time.monotonic() + duration
+        count = 0
+        waitset = WaitSet()
+        try:
+            for reader in self._readers:
+                waitset.attach(reader)
+            while stop is None or not stop.is_set():
+                timeout = 0.1 if stop is not None else None
+                if deadline is not None:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        break
+                    timeout = left if timeout is None else min(timeout, left)
+                ready = waitset.wait(timeout)
+                if ready:
+                    count += self.poll(ready)
+        finally:
+            waitset.close()
+            self.flush()
+        return count
+
+    def flush(self):
+        self._log.flush()
+        self._index.flush()
+
+    def close(self):
+        if self._log.closed:
+            return
+        self._log.close()
+        self._index.close()
+
+def _map(path):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        # copy on write, so views of it can be pointed to by ctypes without copying
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+class _IndexTimes(object):
+    """The latest reception times of index entries, as a sequence bisect can search"""
+    def __init__(self, index, length):
+        self._index = index
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, i):
+        return _index_entry.unpack_from(self._index, i * _index_entry.size)[0]
+
+class Log(object):
+    """A recorded log, memory-mapped. Only the part written when it was opened is seen,
+    what is recorded meanwhile needs another Log."""
+    def __init__(self, path):
+        self.path = path
+        self._map = _map(path)
+        if self._map is None or self._map[:len(MAGIC)] != MAGIC:
+            raise Error('%s is not a sample log' % path)
+        magic, length = _header.unpack_from(self._map, 0)
+        self.topics = json.loads(bytes(self._map[_header.size:_header.size + length]))
+        self._start = _padded(_header.size + length)
+        self._index = _map(path + '.idx') if os.path.exists(path + '.idx') else None
+        self._entries = 0 if self._index is None else len(self._index) // _index_entry.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _read(self, offset, view):
+        """The sample recorded at offset and the offset past it, or None where the log ends"""
+        if offset + _record.size > len(self._map):
+            return None
+        length, topic, source, reception = _record.unpack_from(self._map, offset)
+        end = offset + _record.size + length
+        if end > len(self._map):
+            # cut short, the recorder did not get to write all of it
+            return None
+        return LoggedSample(topic, source, reception, view[offset + _record.size:end]), offset + _record.size + _padded(length)
+
+    def samples(self, topics = None, start = None, end = None):
+        """Generator of the LoggedSamples in the order they were recorded, those of the
+        'topics' numbers only if given, received from 'start' until before 'end' (seconds
+        since the epoch). Their data are writable memoryviews into the log. Samples received
+        out of order are selected by their own reception time all the same, so past the
+        first one received at 'end' or later, the rest of the index, or log, is still looked at."""
+        if topics is not None:
+            topics = frozenset(topics)
+        # in nanoseconds, as the log's timestamps
+        if start is not None:
+            start *= 1e9
+        if end is not None:
+            end *= 1e9
+        view = memoryview(self._map)
+        try:
+            if self._index is None:
+                read = self._read(self._start, view)
+                while read is not None:
+                    sample, offset = read
+                    if ((topics is None or sample.topic in topics) and (start is None or sample.reception_timestamp >= start)
+                            and (end is None or sample.reception_timestamp < end)):
+                        yield sample
+                    read = self._read(offset, view)
+                return
+            # the index lets samples of other topics and times be skipped without touching them,
+            # those before the first whose latest time reaches start were all received before it
+            i = 0 if start is None else bisect.bisect_left(_IndexTimes(self._index, self._entries), start)
+            for i in range(i, self._entries):
+                latest, reception, offset, topic = _index_entry.unpack_from(self._index, i * _index_entry.size)
+                if ((topics is not None and topic not in topics) or (start is not None and reception < start)
+                        or (end is not None and reception >= end)):
+                    continue
+                read = self._read(offset, view)
+                if read is None:
+                    return
+                yield read[0]
+        finally:
+            view.release()
+
+    def __len__(self):
+        """How many samples the index holds"""
+        return self._entries
+
+    def close(self):
+        for mapped in (self._map, self._index):
+            if mapped is None:
+                continue
+            try:
+                mapped.close()
+            except BufferError:
+                # views of it are still held, it is unmapped when the last one goes
+                pass
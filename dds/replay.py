@@ -0,0 +1,57 @@
+"""Playing a sample log made by dds.record back through Writers"""
+import time
+
+from .record import Log
+
+def replay(log, writers, speed = 1.0, batch_size = 64, start = None, end = None, source_timestamps = False,
+           on_progress = None):
+    """Writes the samples of a Log, or of the log at that path, with Writer.write_encoded.
+
+    'writers' maps the names of the recorded readers (see Log.topics) to the Writer
+    their samples are written with, those of other readers are skipped. 'speed' 1.0
+    keeps the pace they were received at, 2.0 is twice as fast and None as fast as
+    possible. Samples that are due are written in batches of up to 'batch_size', so
+    bursts are reproduced as bursts. 'start' and 'end' select a range of reception
+    times, see Log.samples. With 'source_timestamps' samples keep their original
+    source timestamp, to the nanosecond. on_progress(samples written, seconds
+    elapsed) is called after every batch. Returns how many samples were written.
+    """
+    owned = not isinstance(log, Log)
+    if owned:
+        log = Log(log)
+    try:
+        by_topic = {i: writers[topic['reader']] for i, topic in enumerate(log.topics) if topic['reader'] in writers}
+        started = time.monotonic()
+        first = None
+        count = 0
+        batch = []
+        batch_writer = None
+
+        def flush():
+            nonlocal count
+            if batch:
+                # as (sec, nanosec), which seconds as floats could not hold exactly
+                timestamps = [divmod(sample.source_timestamp, 1000000000) for sample in batch] if source_timestamps else None
+                count += batch_writer.write_encoded([sample.data for sample in batch], timestamps)
+                del batch[:]
+                if on_progress is not None:
+                    on_progress(count, time.monotonic() - started)
+
+        for sample in log.samples(by_topic, start, end):
+            if speed is not None:
+                if first is None:
+                    first = sample.reception_timestamp
+                delay = (sample.reception_timestamp - first) / 1e9 / speed - (time.monotonic() - started)
+                if delay > 0:
+                    flush()
+                    time.sleep(delay)
+            writer = by_topic[sample.topic]
+            if writer is not batch_writer or len(batch) >= batch_size:
+                flush()
+                batch_writer = writer
+            batch.append(sample)
+        flush()
+        return count
+    finally:
+        if owned:
+            log.close()
@@ -3,6 +3,7 @@ import time
 import random
 
 import dds
+import dds.blob
 
 PUB_ROLE = 0
 SUB_ROLE = 1
@@ -12,26 +13,26 @@ role = ['pub', 'sub'].index(sys.argv[1])
 if role == PUB_ROLE:
     participant = dds.DDS('MyParticipantLibrary::BigPublicationParticipant')
     HelloBigWorldWriter = participant.lookup_datawriter_by_name('MyBigPublisher::HelloBigWorldWriter')
+    # the picture is read 1MB at a time and sent as that many samples, rather than all at once
+    blobWriter = dds.blob.BlobWriter(HelloBigWorldWriter, 'rawBytes')
     seq = 0
-    data = "x" * 10000000 #10MB
-    file = open("huge_pic.png", "rb")
-    buf = file.read()
     while True:
         seq+=1
 
         print ('writing sequence#', seq)
-        msg = {'seq':seq , 'data':"x" , 'rawBytes':buf}
+        msg = {'seq':seq , 'data':"x"}
         a = time.time()
-        HelloBigWorldWriter.write(msg)
+        blobWriter.write("huge_pic.png", msg)
         print("Write speed: %f" %( time.time() -a))
         time.sleep(3)
 
 else:
     participant = dds.DDS('MyParticipantLibrary::BigSubscriptionParticipant')
     HelloBigWorldReader = participant.lookup_datareader_by_name('MyBigSubscriber::HelloBigWorldReader')
+    blobReader = dds.blob.BlobReader(HelloBigWorldReader, 'rawBytes')
     while True:
         t = time.time()
-        msgList = HelloBigWorldReader.take()
+        msgList = blobReader.take()
         e = time.time() - t
         print (len(msgList))
         for msg in msgList:
@@ -31,12 +31,7 @@ if role == PUB_ROLE:
         time.sleep(1)
 
 else:
-    while True:
-        for reader in readers:
-            msgList = reader.take(dds.DDS_InstanceStateKindEnum.DDS_ALIVE_INSTANCE_STATE)
-            print (len(msgList))
-            for msg in msgList:
-                print("Received %r on %s" % (msg, reader.name))
-        print('sleeping for 1 sec...')
-        time.sleep(1)
+    reader = readers[0]
+    for msg in reader.stream(instanceState=dds.DDS_InstanceStateKindEnum.DDS_ALIVE_INSTANCE_STATE):
+        print("Received %r on %s" % (msg, reader.name))
 
@@ -11,4 +11,5 @@ setup(name='pydds-rti-xml',
       include_package_data=True,
       packages = find_packages(),
       py_modules=['dds'],
+      extras_require={'numpy': ['numpy']},
 )
@@ -0,0 +1,41 @@
+"""Runs the tests against benchmarks/fakenddsc.py, so no RTI install is needed"""
+import itertools
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+sys.path.insert(0, ROOT)
+
+import fakenddsc
+# before dds is first imported, for it to load the fake as libnddsc
+fakenddsc.install()
+import dds
+
+_topic_ids = itertools.count()
+
+@pytest.fixture
+def participant():
+    participant = dds.DDS('Test::Participant', prewarm = False)
+    yield participant
+    participant.close()
+
+@pytest.fixture
+def topic():
+    """topic(TypeCode) defines a topic of that type and returns its (writer name, reader name)"""
+    def define(tc):
+        i = next(_topic_ids)
+        names = ('Pub::Writer%d' % i, 'Sub::Reader%d' % i)
+        fakenddsc.define_topic(names[0], names[1], tc)
+        return names
+    return define
+
+@pytest.fixture
+def endpoints(participant, topic):
+    """endpoints(TypeCode) defines a topic of that type and returns the participant's (Writer, Reader) of it"""
+    def lookup(tc):
+        writer_name, reader_name = topic(tc)
+        return participant.lookup_datawriter_by_name(writer_name), participant.lookup_datareader_by_name(reader_name)
+    return lookup
@@ -0,0 +1,63 @@
+import asyncio
+import concurrent.futures
+
+import fakenddsc as F
+
+payload = F.struct('TestAsync', ('id', F.prim(F.LONG), True), ('raw', F.seq(F.prim(F.OCTET), 100000)))
+
+def test_take_async_waits_without_blocking_the_loop(endpoints):
+    writer, reader = endpoints(payload)
+    ticks = []
+
+    async def tick():
+        while True:
+            ticks.append(None)
+            await asyncio.sleep(0.005)
+
+    async def main():
+        ticker = asyncio.ensure_future(tick())
+        task = asyncio.ensure_future(reader.take_async())
+        await asyncio.sleep(0.05)
+        assert not task.done() and len(ticks) > 2
+        # from another thread, as the middleware would call the listener
+        await asyncio.get_running_loop().run_in_executor(None, writer.write, dict(id=1, raw=b'x'))
+        samples = await asyncio.wait_for(task, 1)
+        ticker.cancel()
+        return samples
+
+    samples = asyncio.run(main())
+    assert [s['sampleData']['id'] for s in samples] == [1]
+    assert reader._listener is None
+
+def test_stream_async(endpoints):
+    writer, reader = endpoints(payload)
+
+    async def main():
+        received = []
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.02, writer.write_many, [dict(id=i, raw=b'') for i in range(3)])
+        async for sample in reader:
+            received.append(sample['sampleData']['id'])
+            if len(received) == 3:
+                break
+        return received
+
+    assert asyncio.run(main()) == [0, 1, 2]
+
+def test_write_async_large_messages_off_the_loop(endpoints):
+    writer, reader = endpoints(payload)
+    submitted = []
+
+    class Executor(concurrent.futures.ThreadPoolExecutor):
+        def submit(self, fn, *args, **kwargs):
+            submitted.append(fn)
+            return super().submit(fn, *args, **kwargs)
+
+    async def main():
+        with Executor(1) as executor:
+            await writer.write_async(dict(id=1, raw=b'small'), executor)
+            await writer.write_async(dict(id=2, raw=bytes(70000)), executor)
+
+    asyncio.run(main())
+    assert len(submitted) == 1
+    assert [(s['sampleData']['id'], len(s['sampleData']['raw'])) for s in reader.take()] == [(1, 5), (2, 70000)]
@@ -0,0 +1,83 @@
+import io
+
+import fakenddsc as F
+import pytest
+
+import dds
+import dds.blob
+
+picture = F.struct('TestPicture', ('seq', F.prim(F.LONG)), ('data', F.prim(F.STRING)), ('rawBytes', F.seq(F.prim(F.OCTET), 1000)))
+
+PAYLOAD = bytes(range(256)) * 3 + b'tail'
+
+@pytest.fixture
+def blobs(endpoints):
+    writer, reader = endpoints(picture)
+    return dds.blob.BlobWriter(writer, 'rawBytes', chunk_size = 100), dds.blob.BlobReader(reader, 'rawBytes'), reader
+
+# the size of a file without a descriptor or of chunks is only known once they end
+@pytest.mark.parametrize('source, total', [(PAYLOAD, len(PAYLOAD)), (io.BytesIO(PAYLOAD), None),
+                                           (iter([PAYLOAD[:150], PAYLOAD[150:]]), None)], ids = ['bytes', 'file', 'chunks'])
+def test_round_trip(blobs, source, total):
+    blob_writer, blob_reader, reader = blobs
+    progress = []
+    assert blob_writer.write(source, dict(seq=3, data='pic'), lambda done, total, elapsed: progress.append((done, total))) == len(PAYLOAD)
+    assert [done for done, total in progress] == [100, 200, 300, 400, 500, 600, 700, 772]
+    assert progress[0][1] == total
+    blob, = blob_reader.take()
+    assert bytes(blob['sampleData']['rawBytes']) == PAYLOAD and blob['sampleData']['seq'] == 3
+    assert blob_reader.dropped == 0
+
+def test_file_path(blobs, tmp_path):
+    blob_writer, blob_reader, reader = blobs
+    path = tmp_path / 'pic.bin'
+    path.write_bytes(PAYLOAD)
+    blob_writer.write(str(path))
+    assert [bytes(blob['sampleData']['rawBytes']) for blob in blob_reader.take()] == [PAYLOAD]
+
+def test_chunks(blobs):
+    blob_writer, blob_reader, reader = blobs
+    blob_writer.write(PAYLOAD[:250])
+    chunks = list(blob_reader.chunks(reader.take(as_numpy = True)))
+    assert [(chunk.offset, len(chunk.data), chunk.last) for chunk in chunks] == [(0, 100, False), (100, 100, False), (200, 50, True)]
+    assert len(set(chunk.id for chunk in chunks)) == 1 and chunks[0].total == 250
+
+def test_missing_first_fragment_dropped_once(blobs):
+    blob_writer, blob_reader, reader = blobs
+    blob_writer.write(PAYLOAD)
+    blob_writer.write(PAYLOAD[:250])
+    samples = reader.take(as_numpy = True)
+    assert blob_reader.add(samples[1:8]) == []
+    assert blob_reader.dropped == 1
+    assert [bytes(blob['sampleData']['rawBytes']) for blob in blob_reader.add(samples[8:])] == [PAYLOAD[:250]]
+    assert blob_reader.dropped == 1
+
+def test_gap_dropped_once(blobs):
+    blob_writer, blob_reader, reader = blobs
+    blob_writer.write(PAYLOAD)
+    samples = reader.take(as_numpy = True)
+    assert blob_reader.add(samples[:2] + samples[3:]) == []
+    assert blob_reader.dropped == 1 and not blob_reader._pending and not blob_reader._given_up
+
+def test_too_many_pending(endpoints):
+    writer, reader = endpoints(picture)
+    blob_writer = dds.blob.BlobWriter(writer, 'rawBytes', chunk_size = 100)
+    blob_reader = dds.blob.BlobReader(reader, 'rawBytes', max_pending = 1)
+    blob_writer.write(PAYLOAD[:150])
+    blob_writer.write(PAYLOAD[:150])
+    first, last, other_first, other_last = reader.take(as_numpy = True)
+    assert blob_reader.add([first, other_first, last, other_last]) != []
+    assert blob_reader.dropped == 1
+
+def test_not_fragmented(endpoints):
+    writer, reader = endpoints(picture)
+    dds.blob.BlobWriter(writer, 'rawBytes', fragment = False).write(PAYLOAD[:900], dict(seq=1))
+    blob, = dds.blob.BlobReader(reader, 'rawBytes', fragment = False).take()
+    assert bytes(blob['sampleData']['rawBytes']) == PAYLOAD[:900]
+
+def test_chunk_size_checked(endpoints):
+    writer, reader = endpoints(picture)
+    with pytest.raises(ValueError):
+        dds.blob.BlobWriter(writer, 'rawBytes', chunk_size = 1000)
+    with pytest.raises(ValueError):
+        dds.blob.BlobWriter(writer, 'data')
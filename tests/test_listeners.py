@@ -0,0 +1,94 @@
+import threading
+import time
+
+import fakenddsc as F
+import pytest
+
+import dds
+
+hello = F.struct('TestListened', ('sender', F.prim(F.STRING), True), ('count', F.prim(F.LONG)))
+
+def test_callbacks_added_and_removed(endpoints):
+    writer, reader = endpoints(hello)
+    calls = []
+    first = reader.add_data_available_callback(lambda: calls.append(1))
+    second = reader.add_data_available_callback(lambda: calls.append(2))
+    assert first != second
+    writer.write(dict(sender='a', count=1))
+    assert sorted(calls) == [1, 2]
+    reader.remove_data_available_callback(first)
+    writer.write(dict(sender='a', count=2))
+    assert sorted(calls) == [1, 2, 2]
+    reader.remove_data_available_callback(second)
+    assert reader._listener is None
+
+def test_stream_keeps_other_callbacks(endpoints):
+    writer, reader = endpoints(hello)
+    ref = reader.add_data_available_callback(lambda: None)
+    def publish():
+        for i in range(5):
+            time.sleep(0.01)
+            writer.write(dict(sender='t', count=i))
+    thread = threading.Thread(target=publish)
+    thread.start()
+    assert [s['sampleData']['count'] for s in reader.stream(batch_size = 2, timeout = 0.3)] == list(range(5))
+    thread.join()
+    assert list(reader._callbacks) == [ref]
+    reader.remove_data_available_callback(ref)
+
+def test_dispatcher_runs_callbacks_off_the_writing_thread(participant, topic):
+    writer_name, reader_name = topic(hello)
+    dispatcher = dds.Dispatcher(threads = 1)
+    writer = participant.lookup_datawriter_by_name(writer_name)
+    reader = participant.lookup_datareader_by_name(reader_name, dispatcher = dispatcher)
+    threads = []
+    done = threading.Event()
+    def callback():
+        threads.append(threading.current_thread())
+        done.set()
+    reader.add_data_available_callback(callback)
+    writer.write(dict(sender='d', count=1))
+    assert done.wait(1)
+    dispatcher.close()
+    assert threading.current_thread() not in threads
+    assert dispatcher.metrics()[reader.name]['dispatched'] == 1
+
+def test_instance_cache_follows(endpoints):
+    writer, reader = endpoints(hello)
+    cache = dds.InstanceCache(reader, follow = True)
+    writer.write(dict(sender='f', count=9))
+    assert cache.get('f')['count'] == 9
+    writer.dispose(dict(sender='f'))
+    assert 'f' not in cache
+    cache.close()
+    assert reader._listener is None
+
+def test_instance_cache_forgets_removed_keys(endpoints):
+    writer, reader = endpoints(hello)
+    cache = dds.InstanceCache(reader, removed_history = 2)
+    for i in range(5):
+        writer.write(dict(sender='s%d' % i, count=i))
+        writer.dispose(dict(sender='s%d' % i))
+    writer.write(dict(sender='kept', count=1))
+    cache.update()
+    assert len(cache) == 1 and list(cache._versions) == [('kept',)]
+    assert list(cache._removed) == [('s3',), ('s4',)]
+    version = cache.version
+    writer.dispose(dict(sender='kept'))
+    writer.write(dict(sender='s4', count=4))
+    cache.update()
+    assert cache.changed_since(version) == {('kept',): None, ('s4',): dict(sender='s4', count=4)}
+    assert list(cache._removed) == [('kept',)]
+    with pytest.raises(dds.Error):
+        cache.changed_since(0)
+
+def test_waitset(endpoints):
+    writer, reader = endpoints(hello)
+    waitset = dds.WaitSet()
+    try:
+        waitset.attach(reader)
+        assert waitset.wait(0.05) == []
+        writer.write(dict(sender='w', count=1))
+        assert waitset.wait(1) == [reader]
+    finally:
+        waitset.close()
@@ -0,0 +1,43 @@
+import fakenddsc as F
+import pytest
+
+import dds
+
+hello = F.struct('TestHello', ('sender', F.prim(F.STRING), True), ('message', F.prim(F.STRING)), ('count', F.prim(F.LONG)))
+
+def test_members_unpacked_on_access(endpoints):
+    writer, reader = endpoints(hello)
+    writer.write(dict(sender='x', message='m1', count=1))
+    writer.write(dict(sender='y', message='m2', count=2))
+    with reader.take_loaned() as samples:
+        assert [s.message for s in samples if s['sender'] == 'y'] == ['m2']
+        assert samples[0].unpack() == dict(sender='x', message='m1', count=1)
+        assert samples[1].info['ValidData']
+        with pytest.raises(AttributeError):
+            samples[0].nope
+    assert reader.take() == []
+
+def test_sample_unusable_after_loan_returned(endpoints):
+    writer, reader = endpoints(hello)
+    writer.write(dict(sender='x', message='m', count=1))
+    with reader.take_loaned() as samples:
+        kept = samples[0]
+    with pytest.raises(dds.Error):
+        kept.count
+
+def test_loan_of_dispose_has_no_data(endpoints):
+    writer, reader = endpoints(hello)
+    writer.write(dict(sender='x', message='m', count=1))
+    writer.dispose(dict(sender='x'))
+    with reader.take_loaned() as samples:
+        assert [(s['count'], s.unpack()) for s in samples] == [(1, dict(sender='x', message='m', count=1)), (None, None)]
+
+def test_sequences_reused(endpoints):
+    writer, reader = endpoints(hello)
+    for i in range(5):
+        writer.write(dict(sender='s%d' % i, message='m', count=i))
+    assert [s['sampleData']['count'] for s in reader.take(max_samples = 2)] == [0, 1]
+    with reader.take_loaned(max_samples = 1) as samples:
+        assert [s.count for s in samples] == [2]
+    assert reader.take_next_sample()['sampleData']['count'] == 3
+    assert len(reader._seq_pool) == 1
@@ -0,0 +1,42 @@
+import fakenddsc as F
+
+import dds
+
+hello = F.struct('TestMeasured', ('sender', F.prim(F.STRING), True), ('count', F.prim(F.LONG)))
+
+def test_counts(participant, topic):
+    writer_name, reader_name = topic(hello)
+    writer = participant.lookup_datawriter_by_name(writer_name, metrics = True)
+    reader = participant.lookup_datareader_by_name(reader_name, metrics = True)
+    writer.write(dict(sender='a', count=1))
+    writer.write_many(dict(sender='b', count=i) for i in range(4))
+    writer.dispose(dict(sender='a'))
+    assert len(reader.take()) == 6
+    assert reader.take() == []
+
+    written = writer.metrics()
+    assert written['samples'] == 5 and written['disposes'] == 1 and written['bytes'] > 0
+    assert written['batches'] == 1 and written['max_batch'] == 4 and written['mean_batch_size'] == 4
+    assert written['pushed_sample_count'] == 6
+    assert not any(key.endswith('_change') for key in written)
+    taken = reader.metrics()
+    assert taken['takes'] == 2 and taken['empty_takes'] == 1 and taken['empty_take_ratio'] == 0.5
+    assert taken['samples'] == 6 and taken['invalid_samples'] == 1 and taken['sample_lost'] == 0
+
+def test_prometheus_text(participant, topic):
+    writer_name, reader_name = topic(hello)
+    writer = participant.lookup_datawriter_by_name(writer_name, metrics = True)
+    reader = participant.lookup_datareader_by_name(reader_name, metrics = True)
+    writer.write_many(dict(sender='a', count=i) for i in range(3))
+    reader.take()
+    lines = dds.prometheus_text(writer, reader).splitlines()
+    label = '{name="%s"}' % writer_name
+    assert '# TYPE dds_writer_samples_total counter' in lines and 'dds_writer_samples_total%s 3' % label in lines
+    assert '# TYPE dds_writer_pushed_sample_count_total counter' in lines and 'dds_writer_pushed_sample_count_total%s 3' % label in lines
+    assert '# TYPE dds_writer_max_batch gauge' in lines and 'dds_writer_max_batch%s 3' % label in lines
+    assert '# TYPE dds_reader_empty_take_ratio gauge' in lines
+    assert 'dds_reader_samples_total{name="%s"} 3' % reader_name in lines
+    assert not [line for line in lines if '_change' in line]
+    # one TYPE line per metric, followed by its samples
+    types = [line.split()[2] for line in lines if line.startswith('# TYPE')]
+    assert len(types) == len(set(types)) and all(line.split('{')[0] in types for line in lines if not line.startswith('#'))
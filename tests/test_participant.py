@@ -0,0 +1,52 @@
+import fakenddsc as F
+import pytest
+
+import dds
+
+message = F.struct('TestFiltered', ('id', F.prim(F.LONG), True), ('sender', F.prim(F.STRING)), ('count', F.prim(F.LONG)))
+
+@pytest.fixture
+def names(topic):
+    return topic(message)
+
+def test_filtered_reader_and_query(participant, names):
+    writer = participant.lookup_datawriter_by_name(names[0])
+    reader = participant.lookup_datareader_by_name(names[1])
+    filtered = participant.create_filtered_reader(names[1], 'sender = %0 AND count > 10', ["'node7'"])
+    for i in range(30):
+        writer.write(dict(id=i, sender='node%d' % (i % 10), count=i))
+    assert [s['sampleData']['id'] for s in filtered.read()] == [17, 27]
+    filtered.set_filter_parameters(["'node3'"])
+    assert [s['sampleData']['id'] for s in filtered.read()] == [13, 23]
+    assert [s['sampleData']['id'] for s in reader.take(query = 'count >= %0', query_parameters = [28])] == [28, 29]
+    assert len(reader.read()) == 28
+
+def test_replace_deletes_the_template_reader(participant, names):
+    participant.lookup_datareader_by_name(names[1])
+    readers = len(F._readers)
+    participant.create_filtered_reader(names[1], 'id = %0', [1], replace = True)
+    participant.create_filtered_reader(names[1], 'id = %0', [2], replace = True)
+    # two filtered readers in, the template out
+    assert len(F._readers) == readers + 1
+    with pytest.raises(dds.Error):
+        participant.lookup_datareader_by_name(names[1])
+
+def test_close_forgets_plans(names):
+    participant = dds.DDS('Test::Participant', prewarm = False)
+    writer = participant.lookup_datawriter_by_name(names[0])
+    key = dds._tc_address(writer._data_pool[0].get_type())
+    assert dds._plans[key] is writer._plan
+    participant.close()
+    assert key not in dds._plans
+
+def test_configured_entities_and_profiles(tmp_path, names):
+    xml = tmp_path / 'profiles.xml'
+    xml.write_text('''<dds><domain_participant_library name="Lib">
+<domain_participant name="Base"><publisher name="Pub"><data_writer name="%s" topic_ref="t"/></publisher></domain_participant>
+<domain_participant name="P" base_name="Base"><subscriber name="Sub"><data_reader name="%s" topic_ref="t"/></subscriber></domain_participant>
+</domain_participant_library></dds>''' % (names[0].split('::')[1], names[1].split('::')[1]))
+    assert dds.configured_entities('Lib::P', str(xml)) == ([names[0]], [names[1]])
+    with dds.DDS('Lib::P', str(xml)) as participant:
+        assert F.profile_loads[-1] == str(xml)
+        assert len(participant._writers) == 1 and len(participant._readers) == 1
+        assert participant.lookup_datareader_by_name(names[1], metrics = True).metrics()['takes'] == 0
@@ -0,0 +1,39 @@
+import fakenddsc as F
+import pytest
+
+import dds
+
+message = F.struct('TestPooled', ('id', F.prim(F.LONG), True), ('sender', F.prim(F.STRING)))
+
+# forked, the workers inherit the samples the fake library holds in this process
+@pytest.fixture
+def written(participant, topic):
+    writer_name, reader_name = topic(message)
+    writer = participant.lookup_datawriter_by_name(writer_name)
+    writer.write_many(dict(id=i, sender='n%d' % i) for i in range(50))
+    return reader_name
+
+def test_shards_by_key(written):
+    with dds.ReaderPool('Test::Participant', written, processes = 3, batch_size = 8, start_method = 'fork') as pool:
+        batches = []
+        while True:
+            batch = pool.take(timeout = 1)
+            if not batch:
+                break
+            batches.append(batch)
+    assert all(len(batch) <= 8 for batch in batches)
+    assert sorted(sample['sampleData']['id'] for batch in batches for sample in batch) == list(range(50))
+
+def test_shard_filters(written):
+    with dds.ReaderPool('Test::Participant', written, shard_filters = ['id < 20', 'id >= 20'], start_method = 'fork') as pool:
+        ids = [sample['sampleData']['id'] for sample in pool.stream(timeout = 1)]
+    assert sorted(ids) == list(range(50))
+
+def test_worker_failure_reported():
+    with dds.ReaderPool('Test::Participant', 'Sub::Nope', processes = 2, start_method = 'fork') as pool:
+        with pytest.raises(dds.Error, match = 'worker failed'):
+            pool.take(timeout = 2)
+
+def test_one_filter_per_process():
+    with pytest.raises(ValueError):
+        dds.ReaderPool('Test::Participant', 'Sub::Reader', processes = 3, shard_filters = ['id < 5'])
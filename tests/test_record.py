@@ -0,0 +1,64 @@
+import os
+
+import fakenddsc as F
+import pytest
+
+import dds
+import dds.record
+import dds.replay
+
+message = F.struct('TestRecorded', ('id', F.prim(F.LONG), True), ('sender', F.prim(F.STRING)), ('data', F.seq(F.prim(F.OCTET), 1000)),
+                   ('note', F.prim(F.LONG), False, True))
+
+MESSAGES = [dict(id=i, sender='n%d' % i, data=bytes([i]) * i, note=None if i % 3 else i) for i in range(10)]
+
+def test_record_and_replay(endpoints, tmp_path):
+    writer, reader = endpoints(message)
+    path = str(tmp_path / 'capture.ddslog')
+    with dds.record.Recorder(path, [reader]) as recorder:
+        writer.write_many(MESSAGES)
+        assert recorder.poll() == 10
+    with dds.record.Log(path) as log:
+        assert len(log) == 10 and log.topics[0]['reader'] == dds.pstring(reader.name)
+        times = [sample.reception_timestamp for sample in log.samples()]
+        start = times[5] / 1e9
+        assert [sample.reception_timestamp for sample in log.samples(start = start)] == [t for t in times if t >= start * 1e9]
+    progress = []
+    assert dds.replay.replay(path, {dds.pstring(reader.name): writer}, speed = None, batch_size = 4,
+                             on_progress = lambda count, elapsed: progress.append(count)) == 10
+    assert progress == [4, 8, 10]
+    assert [s['sampleData'] for s in reader.take()] == MESSAGES
+
+def test_out_of_order_times_select_the_same_with_and_without_index(endpoints, tmp_path):
+    writer, reader = endpoints(message)
+    path = str(tmp_path / 'unordered.ddslog')
+    with dds.record.Recorder(path, [reader]) as recorder:
+        for t in (1, 3, 2, 5, 4):
+            recorder._append(0, t * 10**9, t * 10**9, b'x')
+    def selected():
+        with dds.record.Log(path) as log:
+            return [[s.reception_timestamp // 10**9 for s in log.samples(start = start, end = end)]
+                    for start, end in ((2.5, None), (None, 3.5), (2.0, 4.5))]
+    indexed = selected()
+    os.remove(path + '.idx')
+    assert selected() == indexed == [[3, 5, 4], [1, 3, 2], [3, 2, 4]]
+
+def test_timestamps_replayed_to_the_nanosecond(endpoints, tmp_path):
+    writer, reader = endpoints(message)
+    path = str(tmp_path / 'timed.ddslog')
+    # more digits than a float of seconds since the epoch holds
+    timestamps = [(1700000000, 123456789), (1700000001, 987654321)]
+    with dds.record.Recorder(path, [reader]) as recorder:
+        writer.write_many(MESSAGES[:2], timestamps)
+        recorder.poll()
+    with dds.record.Log(path) as log:
+        assert [sample.source_timestamp for sample in log.samples()] == [1700000000123456789, 1700000001987654321]
+    dds.replay.replay(path, {dds.pstring(reader.name): writer}, speed = None, source_timestamps = True)
+    assert [(info.source_timestamp.sec, info.source_timestamp.nanosec)
+            for info in (sample.sampleInfo._info for sample in reader.take(as_records = True))] == timestamps
+
+def test_not_a_log(tmp_path):
+    path = tmp_path / 'empty.ddslog'
+    path.write_bytes(b'nothing')
+    with pytest.raises(dds.Error):
+        dds.record.Log(str(path))
@@ -0,0 +1,47 @@
+import fakenddsc as F
+
+keyed = F.struct('TestKeyed', ('sender', F.prim(F.STRING), True), ('count', F.prim(F.LONG)))
+
+def counting(writer):
+    """A list getting the handle of every instance writer registers from now on"""
+    registered = []
+    register = writer._register_instance
+    def counted(native_writer, data):
+        handle = register(native_writer, data)
+        registered.append(handle)
+        return handle
+    writer._register_instance = counted
+    return registered
+
+def test_handles_cached_least_recently_used_first(participant, topic):
+    writer_name, reader_name = topic(keyed)
+    writer = participant.lookup_datawriter_by_name(writer_name, instance_cache_size = 2)
+    reader = participant.lookup_datareader_by_name(reader_name)
+    registered = counting(writer)
+    for sender in ('a', 'b', 'a', 'c', 'a', 'b'):
+        writer.write(dict(sender=sender, count=1))
+    # a is written again before c pushes out b, which is registered again
+    assert len(registered) == 4
+    assert list(writer._instances) == [('a',), ('b',)]
+    assert len(reader.take()) == 6
+
+def test_register_and_unregister(participant, topic):
+    writer_name, reader_name = topic(keyed)
+    writer = participant.lookup_datawriter_by_name(writer_name, instance_cache_size = 4)
+    handle = writer.register_instance(dict(sender='x', count=99))
+    assert handle.isValid and bytes(writer._instances[('x',)].keyHash_value) == bytes(handle.keyHash_value)
+    registered = counting(writer)
+    writer.write(dict(sender='x', count=1))
+    assert registered == []
+    writer.unregister(dict(sender='x'))
+    assert ('x',) not in writer._instances
+
+def test_no_cache_without_size_or_key(participant, topic):
+    writer_name, reader_name = topic(keyed)
+    writer = participant.lookup_datawriter_by_name(writer_name)
+    registered = counting(writer)
+    writer.write(dict(sender='a', count=1))
+    assert registered == [] and not writer._instances
+    unkeyed = F.struct('TestUnkeyed', ('sender', F.prim(F.STRING)))
+    writer_name, reader_name = topic(unkeyed)
+    assert participant.lookup_datawriter_by_name(writer_name, instance_cache_size = 8)._instance_cache_size == 0
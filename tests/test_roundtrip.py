@@ -0,0 +1,72 @@
+import enum
+
+import fakenddsc as F
+import numpy
+import pytest
+
+import dds
+
+color = F.enum('TestColor', ('RED', 0), ('GREEN', 1), ('BLUE', 2))
+point = F.struct('TestPoint', ('x', F.prim(F.DOUBLE)), ('y', F.prim(F.DOUBLE)))
+shape = F.union('TestShape', F.prim(F.LONG), ('radius', F.prim(F.DOUBLE), 1), ('name', F.prim(F.STRING), 2))
+message = F.struct('TestMessage', ('id', F.prim(F.LONG), True), ('sender', F.prim(F.STRING)), ('color', color),
+                   ('origin', point), ('path', F.seq(point, 16)), ('samples', F.seq(F.prim(F.FLOAT), 64)),
+                   ('raw', F.seq(F.prim(F.OCTET), 1000)), ('shape', shape), ('note', F.prim(F.LONG), False, True))
+
+MSG = dict(id=1, sender='node7', color=2, origin=dict(x=1.5, y=-2.5), path=[dict(x=0.0, y=1.0), dict(x=2.0, y=3.0)],
+           samples=[0.5, 1.5], raw=b'\x00\x01\xff', shape={'radius': 2.5}, note=None)
+
+def test_write_take(endpoints):
+    writer, reader = endpoints(message)
+    writer.write(MSG)
+    samples = reader.take()
+    assert [s['sampleData'] for s in samples] == [MSG]
+    assert isinstance(samples[0]['sampleData']['color'], enum.IntEnum)
+    assert reader.take() == []
+
+def test_optional_and_union(endpoints):
+    writer, reader = endpoints(message)
+    writer.write(dict(MSG, note=7, shape={'name': 'square'}))
+    data = reader.take()[0]['sampleData']
+    assert data['note'] == 7 and data['shape'] == {'name': 'square'}
+
+def test_as_numpy_and_records(endpoints):
+    writer, reader = endpoints(message)
+    writer.write(MSG)
+    writer.write(MSG)
+    data = reader.take(as_numpy = True, max_samples = 1)[0]['sampleData']
+    assert data['samples'].dtype == numpy.float32 and list(data['samples']) == [0.5, 1.5]
+    # only the received elements are kept, not the sequence's bound of 64
+    for name in ('samples', 'raw'):
+        assert data[name].base is None or data[name].base.nbytes == data[name].nbytes
+    record = reader.take(as_records = True)[0]
+    assert record.sampleData.origin.x == 1.5 and record.sampleData.path[1].y == 3.0
+
+def test_dispose_has_no_data(endpoints):
+    writer, reader = endpoints(message)
+    writer.write(MSG)
+    writer.dispose(MSG)
+    alive, disposed = reader.take()
+    assert alive['sampleInfo']['ValidData'] and disposed['sampleData'] is None
+
+def test_out_of_range_rejected(endpoints):
+    writer, reader = endpoints(message)
+    with pytest.raises(ValueError):
+        writer.write(dict(MSG, raw=[256]))
+    with pytest.raises(ValueError):
+        writer.write(dict(MSG, raw=numpy.array([1, 300])))
+    assert reader.take() == []
+
+def test_write_many_with_timestamps(endpoints):
+    writer, reader = endpoints(message)
+    assert writer.write_many([dict(MSG, id=i) for i in range(3)], [1.0, 2.0, 3.0]) == 3
+    samples = reader.take()
+    assert [s['sampleInfo']['SourceTimestamp'] for s in samples] == [1.0, 2.0, 3.0]
+    assert [s['sampleData']['id'] for s in samples] == [0, 1, 2]
+
+def test_lookup_hands_out_one_instance(participant, topic):
+    writer_name, reader_name = topic(message)
+    reader = participant.lookup_datareader_by_name(reader_name)
+    assert participant.lookup_datareader_by_name(reader_name) is reader
+    with pytest.raises(dds.Error):
+        participant.lookup_datareader_by_name(reader_name, metrics = True)